@@ -0,0 +1,66 @@
+import os
+import gc
+import sys
+import json
+import asyncio
+import subprocess
+from typing import Any, Dict, Iterable
+
+import discord
+
+from tests.support import BOT_USER, guild_payload, message_payload
+from utils.gateway import GatewayProfile
+
+
+def rss() -> int:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+async def measure(profile_name: str, members: int, messages: int = 5000) -> Dict[str, Any]:
+    # one guild of `members` plus a burst of messages, parsed into a client built with the profile
+    profile = GatewayProfile.select(profile_name)
+    client = discord.Client(**profile.options())
+    state = client._connection
+    state.user = discord.ClientUser(state=state, data=BOT_USER)
+    guild_id = 10**15
+    payload = guild_payload(guild_id, members, profile.intents)
+    events = [
+        message_payload(guild_id + 10**9 + index, guild_id, guild_id + 1 + members, guild_id + 1 + index % max(members, 1))
+        for index in range(messages)
+    ] if profile.intents.guild_messages else []
+    traffic = len(json.dumps(payload))
+    gc.collect()
+    before = rss()
+
+    guild = discord.Guild(data=payload, state=state)
+    state._add_guild(guild)
+    for event in events:
+        state.parse_message_create(event)
+    gc.collect()
+    return {
+        'profile': profile_name, 'members': members, 'cached_members': len(guild._members),
+        'cached_messages': len(state._messages or ()), 'guild_create_bytes': traffic, 'rss_bytes': rss() - before
+    }
+
+
+def main(sizes: Iterable[int] = (1_000, 10_000, 100_000)):
+    # one fresh process per measurement, RSS never shrinks back within a process
+    print(f"{'profile':<8} {'members':>8} {'cached':>8} {'messages':>9} {'GUILD_CREATE':>13} {'RSS':>10}")
+    for size in sizes:
+        for name in ('full', 'lean'):
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.gateway', 'measure', name, str(size)],
+                capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(output)
+            print(
+                f"{name:<8} {size:>8} {result['cached_members']:>8} {result['cached_messages']:>9}"
+                f" {result['guild_create_bytes'] / 2**10:>10.0f}KiB {result['rss_bytes'] / 2**20:>8.1f}MiB"
+            )
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ['measure']:
+        print(json.dumps(asyncio.run(measure(sys.argv[2], int(sys.argv[3])))))
+    else:
+        main()
@@ -0,0 +1,371 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import itertools
+import subprocess
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import discord
+from aiohttp import web
+
+from tests.support import BOT_USER, StandInGateway, guild_payload, json_response, message_payload, png, sandbox
+from utils.images import FileImageSource
+from utils.trivia import TriviaCorpus
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'fixtures')
+DISCORD_EPOCH = 1420070400000
+
+
+# A stand-in for Discord that one guild's worth of synthetic users talk to the bot through.
+# Messages and button clicks go out as gateway events, everything the bot posts back is
+# queued per channel with the time it arrived
+class FakeDiscord(StandInGateway):
+    def __init__(self, *, channels: int) -> None:
+        super().__init__(shards=1)
+        self.guild_id = 10**15
+        self.channel_ids = [self.guild_id + 2 + index for index in range(channels)]
+        self.replies: Dict[int, asyncio.Queue] = defaultdict(asyncio.Queue)
+        self.requests: Counter = Counter()
+        self.uploaded_bytes = 0
+        self.socket: Optional[web.WebSocketResponse] = None
+        # interaction token -> (channel id, message id) of the clicked message
+        self.interactions: Dict[str, Tuple[int, int]] = {}
+        self.connected = asyncio.Event()
+        self._counter = itertools.count()
+
+    def snowflake(self) -> int:
+        return (int(time.time() * 1000) - DISCORD_EPOCH) << 22 | next(self._counter) % 2**22
+
+    def add_routes(self, app: web.Application) -> None:
+        app.router.add_post('/api/v10/channels/{channel_id}/messages', self.create_message)
+        app.router.add_patch('/api/v10/channels/{channel_id}/messages/{message_id}', self.edit_message)
+        app.router.add_delete('/api/v10/channels/{channel_id}/messages/{message_id}', self.no_content)
+        app.router.add_put('/api/v10/channels/{channel_id}/messages/{message_id}/reactions/{emoji}/@me', self.no_content)
+        app.router.add_post('/api/v10/interactions/{interaction_id}/{token}/callback', self.interaction_callback)
+        app.router.add_patch('/api/v10/webhooks/{application_id}/{token}/messages/@original', self.edit_original)
+        super().add_routes(app)
+
+    def bot_message(self, channel_id: int, body: Dict[str, Any], attachments: List[Dict[str, Any]] = (), message_id: Optional[int] = None) -> Dict[str, Any]:
+        return message_payload(
+            message_id or self.snowflake(), self.guild_id, channel_id, 0, body.get('content') or '',
+            author=BOT_USER, embeds=body.get('embeds') or [], components=body.get('components') or [],
+            attachments=list(attachments)
+        )
+
+    async def read_body(self, request: web.Request) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        # uploads arrive as multipart: the message in payload_json, then one part per file
+        if not request.content_type.startswith('multipart/'):
+            return await request.json(), []
+        body, attachments = {}, []
+        async for part in await request.multipart():
+            data = await part.read()
+            if part.name == 'payload_json':
+                body = json.loads(data)
+            else:
+                attachment_id = self.snowflake()
+                self.uploaded_bytes += len(data)
+                attachments.append({
+                    'id': str(attachment_id), 'filename': part.filename, 'size': len(data),
+                    'url': f"{self.api}/attachments/{attachment_id}/{part.filename}?ex={int(time.time()) + 86400:x}",
+                    'proxy_url': f"{self.api}/attachments/{attachment_id}/{part.filename}"
+                })
+        return body, attachments
+
+    def count(self, request: web.Request) -> None:
+        self.requests[f"{request.method} {request.match_info.route.resource.canonical.removeprefix('/api/v10')}"] += 1
+
+    async def create_message(self, request: web.Request) -> web.Response:
+        arrived = time.perf_counter()
+        self.count(request)
+        channel_id = int(request.match_info['channel_id'])
+        message = self.bot_message(channel_id, *await self.read_body(request))
+        self.replies[channel_id].put_nowait((arrived, message))
+        return json_response(message)
+
+    async def edit_message(self, request: web.Request) -> web.Response:
+        arrived = time.perf_counter()
+        self.count(request)
+        channel_id, message_id = int(request.match_info['channel_id']), int(request.match_info['message_id'])
+        message = self.bot_message(channel_id, (await self.read_body(request))[0], message_id=message_id)
+        # game feedback edits one status message, to the player that edit is the reply
+        self.replies[channel_id].put_nowait((arrived, message))
+        return json_response(message)
+
+    async def interaction_callback(self, request: web.Request) -> web.Response:
+        arrived = time.perf_counter()
+        self.count(request)
+        interaction_id = int(request.match_info['interaction_id'])
+        channel_id, message_id = self.interactions[request.match_info['token']]
+        body, attachments = await self.read_body(request)
+        # 4 answers with a new message, 7 edits the clicked one in place, a deferred
+        # response (6) is followed by an edit of the original message
+        if body['type'] not in (4, 7):
+            return json_response({'interaction': {'id': str(interaction_id), 'type': 3}})
+        del self.interactions[request.match_info['token']]
+        message = self.bot_message(channel_id, body.get('data') or {}, attachments, message_id if body['type'] == 7 else None)
+        self.replies[channel_id].put_nowait((arrived, message))
+        return json_response({
+            'interaction': {'id': str(interaction_id), 'type': 3, 'response_message_id': message['id']},
+            'resource': {'type': body['type'], 'message': message}
+        })
+
+    async def edit_original(self, request: web.Request) -> web.Response:
+        arrived = time.perf_counter()
+        self.count(request)
+        channel_id, message_id = self.interactions.pop(request.match_info['token'])
+        message = self.bot_message(channel_id, *await self.read_body(request), message_id=message_id)
+        self.replies[channel_id].put_nowait((arrived, message))
+        return json_response(message)
+
+    async def no_content(self, request: web.Request) -> web.Response:
+        self.count(request)
+        return web.Response(status=204)
+
+    async def identify(self, ws: web.WebSocketResponse, shard: List[int]) -> None:
+        await super().identify(ws, shard)
+        # small enough not to be "large", so the full profile does not ask for member chunks
+        guild = guild_payload(self.guild_id, 0, discord.Intents.none(), channels=len(self.channel_ids))
+        guild['channels'] = [{**channel, 'id': str(channel_id)} for channel, channel_id in zip(guild['channels'], self.channel_ids)]
+        await self.dispatch(ws, 'GUILD_CREATE', guild)
+        self.socket = ws
+        self.connected.set()
+
+    def member(self) -> Dict[str, Any]:
+        return {'roles': [], 'joined_at': '2022-01-01T00:00:00+00:00', 'deaf': False, 'mute': False, 'flags': 0}
+
+    async def send(self, channel_id: int, user_id: int, content: str) -> float:
+        message = message_payload(self.snowflake(), self.guild_id, channel_id, user_id, content, member=self.member())
+        sent = time.perf_counter()
+        await self.dispatch(self.socket, 'MESSAGE_CREATE', message)
+        return sent
+
+    async def click(self, channel_id: int, user_id: int, message: Dict[str, Any], custom_id: str) -> float:
+        user = message_payload(0, 0, 0, user_id)['author']
+        interaction_id = self.snowflake()
+        token = f"token-{interaction_id}"
+        self.interactions[token] = (channel_id, int(message['id']))
+        interaction = {
+            'id': str(interaction_id), 'application_id': BOT_USER['id'], 'type': 3, 'token': token, 'version': 1,
+            'attachment_size_limit': 8 * 2**20, 'channel_id': str(channel_id), 'guild_id': str(self.guild_id),
+            'channel': {'id': str(channel_id), 'type': 0, 'guild_id': str(self.guild_id), 'name': 'channel', 'position': 0},
+            'member': {**self.member(), 'user': user, 'permissions': '0'}, 'message': message,
+            'data': {'custom_id': custom_id, 'component_type': 2}, 'locale': 'en-US', 'guild_locale': 'en-US',
+            'app_permissions': '0', 'entitlements': [], 'authorizing_integration_owners': {}, 'context': 0
+        }
+        sent = time.perf_counter()
+        await self.dispatch(self.socket, 'INTERACTION_CREATE', interaction)
+        return sent
+
+    async def reply(self, channel_id: int, timeout: float = 30.0) -> Tuple[float, Dict[str, Any]]:
+        return await asyncio.wait_for(self.replies[channel_id].get(), timeout)
+
+
+def button(message: Dict[str, Any], label: str) -> str:
+    for row in message['components']:
+        for component in row['components']:
+            if component.get('label') == label:
+                return component['custom_id']
+    raise LookupError(f"No {label!r} button on {message['content']!r}")
+
+
+class Results:
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.failures: Counter = Counter()
+
+    def record(self, name: str, seconds: float) -> None:
+        self.latencies[name].append(seconds)
+
+    @property
+    def completed(self) -> int:
+        return sum(map(len, self.latencies.values()))
+
+    def table(self) -> str:
+        lines = [f"{'command':<12} {'count':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9} {'failed':>7}"]
+        for name in sorted(self.latencies.keys() | self.failures.keys()):
+            values = sorted(self.latencies[name]) or [0.0]
+
+            def quantile(q: float) -> float:
+                return values[min(int(q * len(values)), len(values) - 1)] * 1e3
+
+            lines.append(
+                f"{name:<12} {len(values):>7} {quantile(0.5):>7.1f}ms {quantile(0.95):>7.1f}ms"
+                f" {quantile(0.99):>7.1f}ms {values[-1] * 1e3:>7.1f}ms {self.failures[name]:>7}"
+            )
+        return "\n".join(lines)
+
+
+# One synthetic user: verifies through the confirm button, starts the story, then runs
+# spacefacts, gtu, mission and help `rounds` times, each command waiting for the bot's answer
+class SyntheticUser:
+    def __init__(self, fake: FakeDiscord, user_id: int, channel_id: int, answers: Dict[str, List[str]], results: Results, think: float = 0.5) -> None:
+        self.fake = fake
+        self.user_id = user_id
+        self.channel_id = channel_id
+        self.answers = answers
+        self.results = results
+        # pause before every message and click, like a person reading the last answer. Without it a
+        # click can beat the bot attaching its view, or a new game start before the last one closed
+        self.think = think
+
+    async def command(self, name: str, content: str) -> Dict[str, Any]:
+        await asyncio.sleep(self.think)
+        sent = await self.fake.send(self.channel_id, self.user_id, content)
+        arrived, reply = await self.fake.reply(self.channel_id)
+        self.results.record(name, arrived - sent)
+        return reply
+
+    async def confirm(self, name: str, prompt: Dict[str, Any]) -> None:
+        await asyncio.sleep(self.think)
+        sent = await self.fake.click(self.channel_id, self.user_id, prompt, button(prompt, 'Confirm'))
+        arrived, _ = await self.fake.reply(self.channel_id)
+        self.results.record(name, arrived - sent)
+
+    async def gtu(self) -> None:
+        prompt = await self.command('gtu', '>>gtu')
+        # several entries can share a clue, a wrong guess just moves on to the next candidate
+        for answer in self.answers[prompt['embeds'][0]['description']]:
+            reply = await self.command('gtu answer', answer)
+            if reply['content'].startswith('You got it'):
+                return
+        raise LookupError("No candidate answer was accepted")
+
+    async def verify(self) -> None:
+        prompt = await self.command('verify prompt', '>>spacefacts')
+        await self.confirm('verify', prompt)
+
+    async def begin(self) -> None:
+        prompt = await self.command('begin', '>>begin')
+        await self.confirm('begin confirm', prompt)
+
+    async def run(self, rounds: int) -> None:
+        await self.step('verify', self.verify())
+        await self.step('begin', self.begin())
+        commands = [
+            ('spacefacts', lambda: self.command('spacefacts', '>>spacefacts')),
+            ('gtu', self.gtu),
+            ('mission', lambda: self.command('mission', '>>mission')),
+            ('help', lambda: self.command('help', '>>help')),
+        ]
+        for _ in range(rounds):
+            random.shuffle(commands)
+            for name, step in commands:
+                await self.step(name, step())
+
+    async def step(self, name: str, awaitable) -> Any:
+        try:
+            return await awaitable
+        except (asyncio.TimeoutError, LookupError):
+            self.results.failures[name] += 1
+            # ends a game the step may have left running, and whatever the bot still sends for
+            # this step must not be taken as the next step's answer
+            await self.fake.send(self.channel_id, self.user_id, 'quit')
+            await asyncio.sleep(1)
+            queue = self.fake.replies[self.channel_id]
+            while not queue.empty():
+                queue.get_nowait()
+
+
+def peak_rss(pid: int) -> int:
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def image_directory(information: str, directory: str) -> str:
+    # a local copy of every corpus image for the bot's IMAGE_SOURCE, nothing leaves the machine
+    corpus = TriviaCorpus.compile(information)
+    source = FileImageSource(os.path.join(directory, 'images'))
+    os.makedirs(source.directory, exist_ok=True)
+    for index, entry in enumerate(entry for pool in corpus.pools.values() for entry in pool if entry.image):
+        with open(source.path(entry.image), 'wb') as f:
+            f.write(png(640, 480, (index * 20 % 256, 40, 90)))
+    return source.directory
+
+
+def answer_index(directory: str) -> Dict[str, List[str]]:
+    # the gtu prompt shows one "**basis**: clue" line, mapped to every entry that has it
+    corpus = TriviaCorpus.compile(directory)
+    index: Dict[str, List[str]] = defaultdict(list)
+    for entries in corpus.pools.values():
+        for entry in entries:
+            for basis, clue in entry.clues:
+                index[f"**{basis}**: {clue}"].append(entry.answers[0])
+    return index
+
+
+async def run_load(users: int = 1000, concurrency: int = 200, rounds: int = 2, profile: str = 'full', think: float = 0.5) -> None:
+    fake = FakeDiscord(channels=concurrency)
+    await fake.start()
+
+    async def space_facts(request: web.Request) -> web.FileResponse:
+        return web.FileResponse(os.path.join(FIXTURES, 'space_facts.html'))
+
+    facts = web.Application()
+    facts.router.add_get('/space', space_facts)
+    facts_runner = web.AppRunner(facts)
+    await facts_runner.setup()
+    await web.TCPSite(facts_runner, '127.0.0.1', 0).start()
+    facts_url = f"http://127.0.0.1:{facts_runner.addresses[0][1]}/"
+
+    with sandbox() as directory:
+        # every synthetic user shares one guild, its budgets would throttle the whole test
+        env = {
+            **os.environ, 'TOKEN': 'stand-in', 'DISCORD_API_BASE': fake.api, 'DISCORD_GATEWAY_URL': fake.gateway,
+            'FACTS_URL': facts_url, 'GATEWAY_PROFILE': profile, 'METRICS': '1', 'ADMISSION_GUILD_SCALE': '0',
+            'IMAGE_SOURCE': image_directory(os.path.join(directory, 'information'), directory)
+        }
+        bot = subprocess.Popen([sys.executable, 'main.py'], cwd=directory, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            await asyncio.wait_for(fake.connected.wait(), 60)
+            answers = answer_index(os.path.join(directory, 'information'))
+            results = Results()
+            channels: asyncio.Queue[int] = asyncio.Queue()
+            for channel_id in fake.channel_ids:
+                channels.put_nowait(channel_id)
+
+            async def run_user(user_id: int) -> None:
+                # each channel holds one user at a time, so a reply in it always answers that user
+                channel_id = await channels.get()
+                try:
+                    await SyntheticUser(fake, user_id, channel_id, answers, results, think).run(rounds)
+                finally:
+                    channels.put_nowait(channel_id)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(run_user(2 * 10**15 + user_id) for user_id in range(users)))
+            elapsed = time.perf_counter() - start
+            peak = peak_rss(bot.pid)
+        finally:
+            bot.send_signal(2)
+            await asyncio.to_thread(bot.wait)
+    await fake.close()
+    await facts_runner.cleanup()
+
+    print(f"{users} users, {concurrency} at a time, {rounds} rounds, {think}s think time, {profile} gateway profile")
+    print(results.table())
+    print(f"{results.completed} commands in {elapsed:.1f}s, {results.completed / elapsed:.0f} commands/s")
+    print(f"bot peak RSS {peak / 2**20:.1f}MiB, {fake.uploaded_bytes / 2**10:.0f}KiB of images uploaded")
+    for route, count in fake.requests.most_common():
+        print(f"{count:>7} {route}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.loadtest')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=2)
+    parser.add_argument('--profile', choices=('full', 'lean'), default='full')
+    parser.add_argument('--think', type=float, default=0.5, help="seconds each user waits before every message or click")
+    arguments = parser.parse_args()
+    asyncio.run(run_load(arguments.users, arguments.concurrency, arguments.rounds, arguments.profile, arguments.think))
+
+if __name__ == "__main__":
+    main()
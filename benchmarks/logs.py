@@ -0,0 +1,40 @@
+import os
+import time
+import logging
+import tempfile
+
+from utils.logs import FORMAT, setup_logging
+
+
+# What a logging call costs the caller, a FileHandler writing in place against the queue handler
+def main(records: int = 20_000):
+    def run(logger: logging.Logger) -> list:
+        timings = []
+        for index in range(records):
+            start = time.perf_counter()
+            logger.warning("record %d", index)
+            timings.append(time.perf_counter() - start)
+        return sorted(timings)
+
+    with tempfile.TemporaryDirectory() as directory:
+        direct = logging.getLogger('bench.direct')
+        direct.propagate = False
+        handler = logging.FileHandler(os.path.join(directory, 'direct.log'), encoding='utf-8')
+        handler.setFormatter(logging.Formatter(FORMAT))
+        direct.addHandler(handler)
+        blocking = run(direct)
+        handler.close()
+
+        queued = logging.getLogger('bench.queued')
+        queued.propagate = False
+        runtime = setup_logging(queued, os.path.join(directory, 'queued.log'), burst=records)
+        caller = run(queued)
+        runtime.stop()
+
+    # what matters on the event loop is the worst call, a slow disk shows up there first
+    for name, timings in (('FileHandler', blocking), ('queue handler', caller)):
+        print(f"{records} records, {name:<13}: p50 {timings[len(timings) // 2] * 1e6:6.2f}µs, max {timings[-1] * 1e6:8.2f}µs")
+    print(f"queue handler dropped {runtime.dropped} records")
+
+if __name__ == "__main__":
+    main()
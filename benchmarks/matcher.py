@@ -0,0 +1,33 @@
+import json
+import time
+
+from utils.matcher import AnswerMatcher
+
+
+# Per-guess cost of AnswerMatcher for typical guesses, next to the lowercase scan it replaced
+def main(rounds: int = 20_000):
+    with open('./information/galaxy.json', 'r') as f:
+        trivia = json.load(f)
+    matcher = AnswerMatcher({key: info['answers'] for key, info in trivia.items()})
+
+    guesses = {
+        'exact': 'Andromeda Galaxy',
+        'accents / articles': 'the  Andrómeda galaxy!',
+        'typo': 'Andromda Galaxi',
+        'wrong': 'Sombrero Galaxy',
+    }
+    for name, guess in guesses.items():
+        start = time.perf_counter()
+        for _ in range(rounds):
+            result = matcher.is_correct(guess, 'Andromeda')
+        elapsed = (time.perf_counter() - start) / rounds
+        print(f"{name:<20} {guess!r:<26} -> {str(result):<5} {elapsed * 1e6:7.2f}µs per guess")
+
+    answers = trivia['Andromeda']['answers']
+    start = time.perf_counter()
+    for _ in range(rounds):
+        'andromda galaxi' in map(lambda x: x.lower(), answers)
+    print(f"{'old lowercase scan':<20} {'Andromda Galaxi'!r:<26} -> False {(time.perf_counter() - start) / rounds * 1e6:7.2f}µs per guess")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import time
+import random
+import tracemalloc
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from utils.membership import VerifiedSet
+
+
+# what models.Cache held per user before VerifiedSet replaced it
+@dataclass(slots=True, repr=True, kw_only=True)
+class Cache:
+    verified: bool
+    story_progression: Optional[int] = None
+
+
+# Memory, build time and lookups of VerifiedSet against the dict of Cache dataclasses it replaced
+def main(sizes: Iterable[int] = (10_000, 1_000_000, 10_000_000), lookups: int = 200_000):
+    for size in sizes:
+        ids = random.sample(range(10**17, 10**17 + size * 8), size)
+        probes = [random.choice(ids) if i % 2 else random.randrange(10**17, 10**17 + size * 8) for i in range(lookups)]
+        results = []
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        verified = VerifiedSet(ids)
+        build = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        start = time.perf_counter()
+        for probe in probes:
+            probe in verified
+        results.append(('VerifiedSet', memory, build, time.perf_counter() - start))
+
+        # the old dict of dataclasses, skipped at 10M where it needs several GiB
+        if size <= 1_000_000:
+            tracemalloc.start()
+            start = time.perf_counter()
+            cache = {user_id: Cache(verified=True) for user_id in ids}
+            build = time.perf_counter() - start
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            start = time.perf_counter()
+            for probe in probes:
+                probe in cache
+            results.append(('Dict[int, Cache]', memory, build, time.perf_counter() - start))
+            del cache
+
+        for name, memory, build, lookup in results:
+            print(
+                f"{size:>10,} IDs  {name:<17} {memory / 2**20:9.1f} MiB  "
+                f"build {build:6.2f}s  lookup {lookup / lookups * 1e9:6.0f}ns"
+            )
+        del verified, ids, probes
+
+if __name__ == "__main__":
+    main()
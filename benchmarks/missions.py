@@ -0,0 +1,49 @@
+import os
+import time
+import random
+import asyncio
+import tempfile
+from types import MappingProxyType
+
+from utils.database import Database
+from utils.missions import GuessCorrect, MissionTracker, TyperacerFinish
+from utils.userstate import UserState
+
+
+# Events per second through MissionTracker.emit, then the cost of flushing what they changed
+async def run(players: int = 10_000, events: int = 1_000_000):
+    missions = MappingProxyType({
+        '1': {'name': 'guess', 'duration': '0:45', 'goal': {'event': GuessCorrect.name, 'count': 10}},
+        '2': {'name': 'race', 'duration': '1:00', 'goal': {'event': TyperacerFinish.name, 'count': 3}},
+        '3': {'name': 'untracked', 'duration': '0:30'},
+    })
+    with tempfile.TemporaryDirectory() as directory:
+        async with Database({'users': os.path.join(directory, 'users.db')}) as database:
+            state = UserState(database)
+            await state.create_tables()
+            tracker = MissionTracker(state, lambda: missions)
+            await asyncio.gather(*(state.start_story(user_id) for user_id in range(players)))
+            await tracker.load()
+
+            # most traffic comes from players who aren't on a mission that counts it
+            stream = [
+                GuessCorrect(random.randrange(players * 2), 'galaxy') if random.random() < 0.8
+                else TyperacerFinish(random.randrange(players), 80.0, 0.98)
+                for _ in range(events)
+            ]
+            start = time.perf_counter()
+            cleared = sum(1 for event in stream if tracker.emit(event))
+            elapsed = time.perf_counter() - start
+            print(f"{events} events in {elapsed:.2f}s, {elapsed / events * 1e9:.0f}ns each, {cleared} missions cleared, {tracker.pending} players to flush")
+
+            start = time.perf_counter()
+            writes = await tracker.flush()
+            print(f"flushed {writes} rows in {(time.perf_counter() - start) * 1e3:.0f}ms")
+
+            start = time.perf_counter()
+            expired = tracker.expired(time.time() + 3 * 3600)
+            print(f"{len(expired)} stories found expired after 3h in {(time.perf_counter() - start) * 1e3:.0f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
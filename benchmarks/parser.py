@@ -0,0 +1,34 @@
+import os
+import time
+
+from utils.parser import WebsiteParser, parse_fact
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'fixtures')
+
+
+# Full BeautifulSoup tree against the strained parse that Scraper uses, over every saved page
+def main(rounds: int = 200) -> None:
+    for filename in sorted(os.listdir(FIXTURES)):
+        if not filename.endswith('.html'):
+            continue
+        with open(os.path.join(FIXTURES, filename), 'r', encoding='utf-8') as f:
+            text = f.read()
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            full = WebsiteParser(text, "lxml").get_head(2, {'class': 'wow'}).text
+        full_time = (time.perf_counter() - start) / rounds
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            strained = parse_fact(text)
+        strained_time = (time.perf_counter() - start) / rounds
+
+        assert full.strip() == strained
+        print(
+            f"{filename} ({len(text) / 1024:.1f} KiB): full parse {full_time * 1e3:.2f}ms,"
+            f" strained parse {strained_time * 1e3:.2f}ms ({full_time / strained_time:.1f}x)"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import time
+import asyncio
+from types import SimpleNamespace
+
+from utils.sessions import SessionManager
+
+
+def fake_message(channel_id: int, author_id: int) -> SimpleNamespace:
+    return SimpleNamespace(id=1, channel=SimpleNamespace(id=channel_id), author=SimpleNamespace(id=author_id), content='guess')
+
+
+# Routing through SessionManager against one wait_for predicate per running game
+async def run(sessions: int = 5000, rounds: int = 5) -> None:
+    manager = SessionManager(limit=sessions)
+
+    async def play(index: int) -> int:
+        received = 0
+        with manager.open(index % 100, index) as session:
+            for _ in range(rounds):
+                await session.wait(timeout=10)
+                received += 1
+        return received
+
+    players = [asyncio.create_task(play(index)) for index in range(sessions)]
+    await asyncio.sleep(0)
+    print(f"{manager.active} active sessions")
+
+    messages = [fake_message(index % 100, index) for index in range(sessions)]
+    # plus traffic from people who are not playing at all
+    messages += [fake_message(index % 100, sessions + index) for index in range(sessions)]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for message in messages:
+            manager.dispatch(message)
+    dispatch = time.perf_counter() - start
+    received = sum(await asyncio.gather(*players))
+
+    checks = [lambda m, index=index: m.author.id == index and m.channel.id == index % 100 for index in range(sessions)]
+    start = time.perf_counter()
+    for message in messages[:1000]:
+        for check in checks:
+            check(message)
+    predicates = (time.perf_counter() - start) / 1000
+
+    routed = len(messages) * rounds
+    print(f"{routed} messages routed in {dispatch:.3f}s ({dispatch / routed * 1e6:.2f}µs per message), {received} delivered")
+    print(f"{sessions} wait_for predicates: {predicates * 1e6:.0f}µs per message")
+    print(f"{manager.active} active sessions after the games ended")
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,30 @@
+import os
+import time
+import random
+import tempfile
+from array import array
+
+from utils.membership import VerifiedSet
+from utils.snapshot import Snapshot, write_snapshot
+
+
+# Writing and mapping a snapshot of the verified users, against copying them into a new set
+def main(size: int = 5_000_000):
+    ids = array('q', sorted(random.sample(range(10**17, 10**17 + size * 8), size)))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'snapshot.bin')
+        start = time.perf_counter()
+        written = write_snapshot(path, {'verified': ids}, {'cursor': 0})
+        print(f"wrote {size:,} IDs ({written / 2**20:.1f}MiB) in {(time.perf_counter() - start) * 1e3:.0f}ms")
+
+        start = time.perf_counter()
+        snapshot = Snapshot(path)
+        verified = VerifiedSet.from_buffer(snapshot.section('verified'))
+        print(f"mapped and verified in {(time.perf_counter() - start) * 1e3:.0f}ms")
+        start = time.perf_counter()
+        VerifiedSet.from_sorted(ids)
+        print(f"(copying the same IDs into a new set takes {(time.perf_counter() - start) * 1e3:.0f}ms)")
+
+
+if __name__ == "__main__":
+    main()
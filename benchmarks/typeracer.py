@@ -0,0 +1,53 @@
+import os
+import time
+import random
+import asyncio
+import tempfile
+
+from utils.database import Database
+from utils.typeracer import Leaderboards, RaceResult, score
+
+
+# Recording races and reading top 10s, straight from the index against the in-memory boards
+async def run(races: int = 100_000, guilds: int = 50, users: int = 5000, queries: int = 2000):
+    with tempfile.TemporaryDirectory() as directory:
+        async with Database({'users': os.path.join(directory, 'users.db')}) as database:
+            leaderboards = Leaderboards(database)
+            await leaderboards.create_tables()
+            start = time.perf_counter()
+            await asyncio.gather(*(
+                leaderboards.record(random.randrange(1, guilds + 1), random.randrange(users), RaceResult(round(random.uniform(20, 140), 1), 0.97, 30.0))
+                for _ in range(races)
+            ))
+            print(f"recorded {races} races in {time.perf_counter() - start:.2f}s")
+
+            async with database.reader('users').acquire() as conn:
+                async with conn.execute(
+                    'EXPLAIN QUERY PLAN SELECT user_id, wpm, accuracy FROM typeracer_best WHERE scope = ? ORDER BY wpm DESC, user_id LIMIT ?', (1, 10)
+                ) as cursor:
+                    print("plan:", '; '.join(row[-1] for row in await cursor.fetchall()))
+
+            # cold: every query goes to the index, warm: served by the boards
+            cold = Leaderboards(database, max_age=0)
+            for label, boards in (('index', cold), ('heap', leaderboards)):
+                start = time.perf_counter()
+                for index in range(queries):
+                    await boards.top(index % (guilds + 1))
+                print(f"{label:>5}: {(time.perf_counter() - start) / queries * 1e6:8.1f}us per top 10")
+
+    # score runs on the event loop for every message of a race
+    sentence = ' '.join(["The Sun holds more than ninety nine percent of all the mass in the solar system."] * 3)
+    attempts = {
+        'exact': sentence,
+        'two typos': sentence.replace('Sun', 'Sn', 1).replace('mass', 'mas', 1),
+        'gibberish': 'x' * len(sentence),
+        'oversized': 'a' * 100_000,
+    }
+    for name, typed in attempts.items():
+        start = time.perf_counter()
+        result = score(sentence, typed, 30.0)
+        print(f"{name:<10} {result.wpm:6.1f} wpm in {(time.perf_counter() - start) * 1e3:6.2f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
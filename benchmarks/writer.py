@@ -0,0 +1,39 @@
+import os
+import time
+import asyncio
+import tempfile
+
+import aiosqlite
+
+from utils.writer import WriteBehind
+
+
+# A commit per write against WriteBehind's group commit, both connections in WAL
+async def run(writes: int = 2000):
+    statement = 'INSERT INTO verified (user_id) VALUES (?)'
+    with tempfile.TemporaryDirectory() as directory:
+        async with aiosqlite.connect(os.path.join(directory, 'single.db')) as conn:
+            # the same journal as WriteBehind.start, so only the batching differs
+            await conn.execute('PRAGMA journal_mode=WAL')
+            await conn.execute('PRAGMA synchronous=NORMAL')
+            await conn.execute('CREATE TABLE verified (user_id INTEGER PRIMARY KEY)')
+            start = time.perf_counter()
+            for user_id in range(writes):
+                await conn.execute(statement, (user_id,))
+                await conn.commit()
+            single = time.perf_counter() - start
+
+        async with aiosqlite.connect(os.path.join(directory, 'group.db')) as conn:
+            await conn.execute('CREATE TABLE verified (user_id INTEGER PRIMARY KEY)')
+            writer = WriteBehind(conn)
+            await writer.start()
+            start = time.perf_counter()
+            await asyncio.gather(*(writer.execute(statement, (user_id,)) for user_id in range(writes)))
+            group = time.perf_counter() - start
+            await writer.close()
+
+    print(f"{writes} writes, commit per write (WAL): {writes / single:10.0f} writes/s")
+    print(f"{writes} writes, group commit (WAL): {writes / group:10.0f} writes/s ({single / group:.1f}x)")
+
+if __name__ == "__main__":
+    asyncio.run(run())
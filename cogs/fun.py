@@ -1,60 +1,170 @@
+import os
 import asyncio
 import random
+from typing import Literal
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 
+from utils.errors import UpstreamUnavailable
+from utils.facts import FactPool
+from utils.feedback import CoalescedStatus
+from utils.gateway import GatewayNeeds
+from utils.missions import GameEvent, GuessCorrect, TyperacerFinish
 from utils.scraper import Scraper
+from utils.typeracer import GLOBAL, MIN_ACCURACY, elapsed, is_pasted, prompt, score
 
 
 class FunCog(commands.Cog, name="Fun"):
 
     hidden = False
+    # the games read the player's replies
+    gateway = GatewayNeeds(intents={'guild_messages', 'dm_messages', 'message_content'})
+    # seconds of silence before a race is abandoned
+    RACE_TIMEOUT = 120.0
+
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
+        # FACTS_URL points the scraper at a mirror, or the load test's local copy
+        self.scraper = Scraper(bot.web, base=os.getenv('FACTS_URL'), executor=bot.executor)
+        self.facts = FactPool(self.scraper.scrape)
+
+    async def cog_load(self) -> None:
+        self.refill_facts.start()
+        self.warm_images.start()
+
+    async def cog_unload(self) -> None:
+        self.refill_facts.cancel()
+        self.warm_images.cancel()
+
+    @commands.Cog.listener('on_message')
+    async def route_game_messages(self, message: discord.Message) -> None:
+        self.bot.sessions.dispatch(message)
+
+    @tasks.loop(seconds=30)
+    async def refill_facts(self):
+        await self.facts.refill()
+
+    @refill_facts.before_loop
+    async def before_refill_facts(self):
+        await self.bot.wait_for('ready')
+
+    @tasks.loop(hours=1)
+    async def warm_images(self):
+        # only images not on disk yet are fetched, after a corpus reload that's the new ones
+        corpus = self.bot.trivia.corpus
+        fetched = await self.bot.images.warm(entry.image for pool in corpus.pools.values() for entry in pool if entry.image)
+        if fetched:
+            self.bot.logger.info(f"Cached {fetched} trivia images")
+
+    @warm_images.before_loop
+    async def before_warm_images(self):
+        await self.bot.wait_until_ready()
     
-    @commands.hybrid_command(name='spacefacts', aliases=['spacefact'], brief='Get random facts about space!')
+    def count_for_missions(self, ctx: commands.Context, event: GameEvent) -> str:
+        # a line to add to the game's last message when the event cleared a mission
+        cleared = self.bot.missions.emit(event)
+        if not cleared:
+            return ''
+        mission = self.bot.trivia.corpus.missions[str(cleared)]
+        return f"\nMission {cleared} cleared: **{mission['name']}**! Use `{ctx.prefix}mission` to see what's next."
+
+    @commands.hybrid_command(name='spacefacts', aliases=['spacefact'], brief='Get random facts about space!', extras={'admission': 'scrape'})
     async def spacefacts(self, ctx: commands.Context) -> None:
-        scraper = Scraper(self.bot.session)
-        fact = await scraper.scrape()
+        try:
+            fact = await self.facts.get_or_fetch()
+        except UpstreamUnavailable as error:
+            return await ctx.send(f"The facts source is down right now, try again in {error.retry_after:.0f} seconds.")
         await ctx.send(fact)
 
-    @commands.hybrid_command(name="guesstheuniverse", aliases=['gtu'], brief="Guess the universe with the given information")
+    @commands.hybrid_command(name="guesstheuniverse", aliases=['gtu'], brief="Guess the universe with the given information", extras={'admission': 'game'})
     async def guesstheuniverse(self, ctx: commands.Context) -> None:
-        key = random.choice(tuple(self.bot.universe_trivia.keys()))
-        info = self.bot.universe_trivia[key]
-        on_basis = random.choice(['description', 'constellation'])
-        on_bases_info = info[on_basis]
+        corpus = self.bot.trivia.corpus
+        entry = corpus.random()
+        key = entry.key
+        on_basis, on_bases_info = random.choice(entry.clues)
         embed = discord.Embed(
             title="Guess The Universe",
             description=f"**{on_basis}**: {on_bases_info}",
             color=self.bot.theme
         )
-        embed.set_image(url=info['image'])
-        await ctx.send(embed=embed)
-        while True:
-            try:
-                message = await self.bot.wait_for('message', check=lambda m: m.author == ctx.author and m.channel == ctx.channel)
-            except asyncio.TimeoutError:
-                return await ctx.send("You took too long to answer. Try again.")
-            else:
-                if message.content.lower() in map(lambda x: x.lower(), info['answers']):
-                    return await ctx.send(f"You got it! It was {key}")
-                elif message.content.lower() in ('quit', 'exit'):
-                    return await ctx.send(f"You quit the game. The answer was {key}\nAlternate answers: {', '.join(info['answers'])}")
+        image = await self.bot.images.get(entry.image) if entry.image else None
+        # the local copy when there is one, the original host otherwise
+        file = self.bot.images.attach(embed, image) if image else None
+        if entry.image and image is None:
+            embed.set_image(url=entry.image)
+        wrong = CoalescedStatus(ctx, self.bot.route_budget, lambda count: f"Wrong, maybe try again! ({count} wrong so far)")
+        with self.bot.sessions.open(ctx.channel.id, ctx.author.id, after=ctx.message.id) as session, wrong:
+            question = await ctx.send(embed=embed, file=file)
+            if file:
+                await self.bot.images.uploaded(image, question)
+            while True:
+                try:
+                    message = await session.wait()
+                except asyncio.TimeoutError:
+                    return await ctx.send("You took too long to answer. Try again.")
                 else:
-                    await ctx.send(f"Wrong, maybe try again!", ephemeral=True, delete_after=5.0)
+                    if corpus.is_correct(entry, message.content):
+                        cleared = self.count_for_missions(ctx, GuessCorrect(ctx.author.id, entry.category))
+                        return await ctx.send(f"You got it! It was {key}{cleared}")
+                    elif message.content.lower() in ('quit', 'exit'):
+                        return await ctx.send(f"You quit the game. The answer was {key}\nAlternate answers: {', '.join(entry.answers)}")
+                    else:
+                        wrong.bump()
 
-    @commands.hybrid_command(name="typeracer", aliases=['tr'], brief="Type a random message sent as fast as possible")
+    @commands.hybrid_command(name="typeracer", aliases=['tr'], brief="Type a random message sent as fast as possible", extras={'admission': 'game'})
     async def typeracer(self, ctx: commands.Context) -> None:
-        sentence = "hello world I don't know what to say"
-        message = await self.bot.wait_for('message', check=lambda m: m.author == ctx.author and m.channel == ctx.channel and m.content == sentence)
-        if message.content.lower() == 'quit':
-            return await ctx.send("You quit the game.")
-        else:
-            await ctx.send(f"You typed {message.content} in {message.created_at - ctx.message.created_at} seconds")
-                
-    
+        sentence = self.bot.trivia.corpus.random_sentence()
+        embed = discord.Embed(
+            title="Typeracer",
+            description=f"Type this as fast as you can:\n\n**{prompt(sentence)}**",
+            color=self.bot.theme
+        )
+        embed.set_footer(text="Type quit to give up")
+        short = CoalescedStatus(ctx, self.bot.route_budget, lambda count: f"That doesn't look like the sentence, keep typing or type quit. ({count} tries)")
+        with self.bot.sessions.open(ctx.channel.id, ctx.author.id, after=ctx.message.id, timeout=self.RACE_TIMEOUT) as session, short:
+            prompted = await ctx.send(embed=embed)
+            while True:
+                try:
+                    message = await session.wait()
+                except asyncio.TimeoutError:
+                    return await ctx.send("You took too long to finish. Try again.")
+                if message.content.lower() in ('quit', 'exit'):
+                    return await ctx.send("You quit the game.")
+                if is_pasted(message.content):
+                    return await ctx.send("No copy-pasting! That race doesn't count.")
+                result = score(sentence, message.content, elapsed(prompted.created_at, message.created_at))
+                if result.accuracy >= MIN_ACCURACY:
+                    break
+                short.bump()
+        best = await self.bot.leaderboards.personal_best(ctx.author.id)
+        await self.bot.leaderboards.record(ctx.guild.id if ctx.guild else None, ctx.author.id, result)
+        cleared = self.count_for_missions(ctx, TyperacerFinish(ctx.author.id, result.wpm, result.accuracy))
+        embed = discord.Embed(title="Finished!", description=cleared.strip() or None, color=self.bot.theme)
+        embed.add_field(name="Speed", value=f"{result.wpm:.1f} WPM")
+        embed.add_field(name="Accuracy", value=f"{result.accuracy:.1%}")
+        embed.add_field(name="Time", value=f"{result.seconds:.2f}s")
+        if best is None or result.wpm > best:
+            embed.set_footer(text="New personal best!")
+        await ctx.send(embed=embed)
+
+    @commands.hybrid_command(name="leaderboard", aliases=['lb'], brief="The fastest typeracers in this server or everywhere", extras={'admission': 'database'})
+    async def leaderboard(self, ctx: commands.Context, scope: Literal['server', 'global'] = 'server') -> None:
+        if ctx.guild is None:
+            scope = 'global'
+        rows = await self.bot.leaderboards.top(ctx.guild.id if scope == 'server' else GLOBAL)
+        # mentions render without the member cache, which the lean gateway profile leaves empty
+        lines = [
+            f"**{place}.** <@{user_id}> - {wpm:.1f} WPM ({accuracy:.1%})"
+            for place, (user_id, wpm, accuracy) in enumerate(rows, start=1)
+        ]
+        embed = discord.Embed(
+            title=f"Typeracer leaderboard ({'global' if scope == 'global' else ctx.guild.name})",
+            description="\n".join(lines) or "Nobody has raced yet, be the first with `>>typeracer`!",
+            color=self.bot.theme
+        )
+        await ctx.send(embed=embed, allowed_mentions=discord.AllowedMentions.none())
+
 
 async def setup(bot: commands.Bot) -> None:
     await bot.add_cog(FunCog(bot))
\ No newline at end of file
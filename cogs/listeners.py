@@ -4,9 +4,10 @@ import traceback
 import discord
 from discord.ext import commands
 
-from utils.errors import UserNotVerified
+from utils.errors import CommandRejected, SessionUnavailable, UserNotVerified
+from utils.metrics import metrics
 from utils.models import SpaceBot
-from utils.ui.view import ConfirmButton
+from utils.ui.view import ConfirmPrompt
 
 
 class ListenerCog(commands.Cog):
@@ -15,8 +16,31 @@ class ListenerCog(commands.Cog):
     def __init__(self, bot) -> None:
         self.bot = bot
 
+    async def cog_load(self) -> None:
+        self.bot.confirm_actions['verify'] = self.confirm_verification
+
+    async def cog_unload(self) -> None:
+        self.bot.confirm_actions.pop('verify', None)
+
+    async def confirm_verification(self, interaction: discord.Interaction, confirmed: bool) -> str:
+        if not confirmed:
+            return "You've cancelled the verification process."
+        await self.bot.verify_user(interaction.user)
+        return "You're now verified!"
+
+    @staticmethod
+    def rejection_message(error: CommandRejected) -> str:
+        match error.reason:
+            case 'user_budget':
+                return f"Slow down! You can use that again in {error.retry_after:.0f}s."
+            case 'guild_budget' | 'guild_share':
+                return f"This server is using that a lot right now, try again in {error.retry_after:.0f}s."
+            case _:
+                return "I'm busy right now, try again in a moment."
+
     @commands.Cog.listener('on_command_error')
     async def check_errors(self, ctx: commands.Context, error):
+        metrics.inc('command_errors_total', command=ctx.command.qualified_name if ctx.command else 'none', error=type(error).__name__)
         if isinstance(error, UserNotVerified):
             embed = discord.Embed(
                 title="You're not verified!", 
@@ -28,14 +52,12 @@ class ListenerCog(commands.Cog):
                 "If you agree to the above point, you can click the confirm button below to verify yourself.", 
                 color=self.bot.theme
             )
-            view = ConfirmButton(ctx)
-            await ctx.send(embed=embed, view=view)
-            view_not_touched = await view.wait()
-            if not view_not_touched and view.confirmed:
-                await self.bot.verify_user(ctx.author)
-                await ctx.send("You're now verified!", ephemeral=True)
-            elif not view_not_touched and not view.confirmed:
-                await ctx.send("You've cancelled the verification process.", ephemeral=True)
+            await ctx.send(embed=embed, view=ConfirmPrompt.view('verify', ctx.author.id))
+        elif isinstance(error, CommandRejected):
+            if error.notify:
+                await ctx.send(self.rejection_message(error), ephemeral=True)
+        elif isinstance(error, SessionUnavailable):
+            await ctx.send(str(error), ephemeral=True)
         else:
             print('Ignoring exception in command {}:'.format(ctx.command), file=sys.stderr)
             traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
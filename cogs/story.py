@@ -1,10 +1,10 @@
-import json
+import datetime
 from typing import Mapping
 
 import discord
 from discord.ext import commands
 
-from utils.ui.view import ConfirmButton
+from utils.ui.view import ConfirmPrompt
 from utils.models import SpaceBot
 
 class StoryCog(commands.Cog):
@@ -12,39 +12,30 @@ class StoryCog(commands.Cog):
     hidden = False
     def __init__(self, bot: SpaceBot) -> None:
         self.bot = bot
-        self.missions: Mapping[str, dict] = None
 
     async def cog_load(self) -> None:
-        with open('./information/missions.json', 'r') as f:
-            self.missions = json.load(f)
+        self.bot.confirm_actions['begin'] = self.confirm_begin
+
+    async def cog_unload(self) -> None:
+        self.bot.confirm_actions.pop('begin', None)
+
+    @property
+    def missions(self) -> Mapping[str, Mapping]:
+        # read through the trivia library so edits to missions.json show up on reload
+        return self.bot.trivia.corpus.missions
 
     async def enable_story_mode(self, user: discord.User):
-        story = self.bot.get_conn('story')
-        if story:
-            async with story.cursor() as cursor:
-                await cursor.execute('INSERT INTO story (user_id, enabled) VALUES (?, ?)', (user.id, 1))
-                await story.commit()
-        self.bot.verified[user.id].story_progression = 1
+        await self.bot.user_state.start_story(user.id)
+        self.bot.missions.begin(user.id)
 
-    async def get_user_progression(self, user: discord.User):
-        cached_progression = self.bot.verified.get(user.id).story_progression
-        if cached_progression is False:
+    def get_user_progression(self, user: discord.User):
+        # progression is prefetched with verification at startup, so this never touches the database
+        progression = self.bot.user_state.get_progression(user.id)
+        if progression is None:
             return False
-        elif cached_progression:
-            return cached_progression
-        else:
-            story = self.bot.get_conn('story')
-            if story:
-                async with story.cursor() as cursor:
-                    await cursor.execute('SELECT progression FROM story WHERE user_id = ?', (self.bot.user.id,))
-                    result = await cursor.fetchone()
-                    if result:
-                        self.bot.verified[user.id].story_progression = result[0]
-                        return result[0]
-            return False
-        
+        return progression
 
-    @commands.hybrid_command(name="begin", brief="Start the story mode of the bot")
+    @commands.hybrid_command(name="begin", brief="Start the story mode of the bot", extras={'admission': 'database'})
     async def begin(self, ctx: commands.Context) -> None:
         embed = discord.Embed(
             title="Story mode", 
@@ -53,28 +44,33 @@ class StoryCog(commands.Cog):
             "If you fail to clear one mission, you will faill and you will have to start over.\n"
             "Are you sure you want to start the story mode?",
             )
-        view = ConfirmButton(ctx)
         await ctx.send(
             embed=embed,
-            view=view,
+            view=ConfirmPrompt.view('begin', ctx.author.id),
             ephemeral=True
         )
-        view_not_touched = await view.wait()
-        if not view_not_touched and view.confirmed:
-            await self.enable_story_mode(ctx.author)
-            await ctx.send("Story mode has been activated!", ephemeral=True)
-        elif not view_not_touched and not view.confirmed:
-            await ctx.send("Story mode has been cancelled.", ephemeral=True)
+
+    async def confirm_begin(self, interaction: discord.Interaction, confirmed: bool) -> str:
+        if not confirmed:
+            return "Story mode has been cancelled."
+        await self.enable_story_mode(interaction.user)
+        return "Story mode has been activated!"
 
     @commands.hybrid_command(name="mission", brief="Get the current mission")
     async def mission(self, ctx: commands.Context) -> None:
-        current_progress = await self.get_user_progression(ctx.author)
+        current_progress = self.get_user_progression(ctx.author)
         match current_progress:
             case False:
                 return await ctx.send(f"You have not started the story mode yet. Please use `{ctx.prefix}begin` to start the story mode.")
+            case _ if current_progress > len(self.missions):
+                return await ctx.send("You have cleared every mission, the story is complete!")
             case _:
                 stuff = self.missions[str(current_progress)]
                 embed = discord.Embed(title=stuff['name'], description=stuff['description'], color=self.bot.theme)
+                progress, goal, deadline = self.bot.missions.status(ctx.author.id)
+                if goal is not None:
+                    embed.add_field(name="Progress", value=f"{progress.count}/{goal}")
+                    embed.add_field(name="Time left", value=discord.utils.format_dt(datetime.datetime.fromtimestamp(deadline, datetime.timezone.utc), 'R'))
                 embed.set_footer(text=f"Mission {current_progress}/{len(self.missions)}")
                 await ctx.send(embed=embed)
 
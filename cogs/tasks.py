@@ -1,6 +1,10 @@
+import os
+import asyncio
+
 import discord
 from discord.ext import commands, tasks
 
+from utils.metrics import metrics
 from utils.models import SpaceBot
 
 class TaskCog(commands.Cog):
@@ -11,6 +15,21 @@ class TaskCog(commands.Cog):
         
     async def cog_load(self) -> None:
         self.change_activities.start()
+        self.reload_trivia.start()
+        self.write_metrics.start()
+        self.flush_missions.start()
+        if self.bot.cluster and self.bot.cluster.multiprocess:
+            self.sync_user_state.start()
+            if self.bot.cluster.cluster_id == 0:
+                self.prune_changes.start()
+
+    async def cog_unload(self) -> None:
+        self.change_activities.cancel()
+        self.reload_trivia.cancel()
+        self.write_metrics.cancel()
+        self.flush_missions.cancel()
+        self.sync_user_state.cancel()
+        self.prune_changes.cancel()
 
     @tasks.loop(minutes=2)
     async def change_activities(self):
@@ -23,6 +42,48 @@ class TaskCog(commands.Cog):
     async def before_change_activities(self):
         await self.bot.wait_for('ready')
 
+    @tasks.loop(seconds=15)
+    async def reload_trivia(self):
+        await self.bot.trivia.reload()
+
+    @reload_trivia.before_loop
+    async def before_reload_trivia(self):
+        # the library is built alongside login, which is where this cog loads
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(seconds=15)
+    async def write_metrics(self):
+        # Prometheus text format, for node_exporter's textfile collector or any scraper
+        if metrics.enabled:
+            await asyncio.to_thread(metrics.write, self.bot.local_path(os.getenv('METRICS_FILE', './metrics.prom')))
+
+    @tasks.loop(seconds=30)
+    async def flush_missions(self):
+        # the games only count in memory, this is where progress reaches the story table
+        await self.bot.missions.flush()
+
+    @flush_missions.before_loop
+    async def before_flush_missions(self):
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(seconds=2)
+    async def sync_user_state(self):
+        # verifications and story progress made by the other clusters
+        await self.bot.user_state.sync()
+
+    @sync_user_state.before_loop
+    async def before_sync_user_state(self):
+        # the tables are created and loaded while the extensions load, ready comes after both
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(minutes=5)
+    async def prune_changes(self):
+        await self.bot.user_state.prune()
+
+    @prune_changes.before_loop
+    async def before_prune_changes(self):
+        await self.bot.wait_until_ready()
+
 async def setup(bot: SpaceBot) -> None:
     await bot.add_cog(TaskCog(bot))
     
\ No newline at end of file
@@ -1,3 +1,6 @@
+import time
+started = time.perf_counter()
+
 import os
 from typing import Optional
 
@@ -5,31 +8,32 @@ from discord.ext import commands
 from dotenv import load_dotenv
 
 from utils.errors import UserNotVerified
-from utils.models import Cache, SpaceBot, SpaceHelp
+from utils.metrics import metrics
+from utils.cluster import ClusterConfig
+from utils.models import SpaceHelp, create_bot
+from utils.startup import profiler
 
-bot = SpaceBot()
-bot.help_command = SpaceHelp()
+profiler.record('imports', started)
+
+# the bot reads its settings (logging, pools) from the environment while it is built
 load_dotenv('.env')
+# SHARDS (and CLUSTER_* from the launcher in utils.cluster) switch to the sharded bot
+bot = create_bot(ClusterConfig.from_env())
+bot.help_command = SpaceHelp()
 
 
 @bot.check
 async def check_if_user_verified(ctx: commands.Context) -> Optional[bool]:
-    author = bot.verified.get(ctx.author.id)
-    if author:
-        if author.verified:
-            return True
-        else:
-            raise UserNotVerified(ctx.author)
-    else:
-        verified = bot.get_conn('verified')
-        if verified:
-            async with verified.cursor() as cursor:
-                await cursor.execute('SELECT * FROM verified WHERE user_id = ?', (ctx.author.id,))
-                record = bool(await cursor.fetchone())
-            bot.verified[ctx.author.id] = Cache(verified=record)
-        if record is True:
-            return True
-        raise UserNotVerified(ctx.author)
+    # bot.verified holds every verified ID (loaded at startup, added to by verify_user), so a miss is a no
+    # the phase covers the admission wait as well, a command queued for a slot is spent here
+    with metrics.phase('check'):
+        verified = ctx.author.id in bot.verified
+        metrics.inc('verified_lookups_total', result='hit' if verified else 'miss')
+        # an unverified user is admitted to a verification prompt, not to the command itself
+        await bot.admission.admit(ctx, None if verified else 'prompt')
+    if verified:
+        return True
+    raise UserNotVerified(ctx.author)
 
 os.environ["JISHAKU_NO_UNDERSCORE"] = "true"
 os.environ["SHELL"] = "/bin/zsh"
@@ -41,5 +45,36 @@ async def _sync(ctx: commands.Context) -> None:
     await ctx.send("Synced slash commands to global!")
 
 
+@bot.command(name="dbstats", brief="Show database pool usage")
+@commands.is_owner()
+async def _dbstats(ctx: commands.Context) -> None:
+    lines = []
+    for name, stats in bot.database_stats().items():
+        lines.append(
+            f"**{name}**: {stats['in_use']}/{stats['size']} readers busy, {stats['acquisitions']} reads,"
+            f" wait avg {stats['avg_wait_ms']:.2f}ms / max {stats['max_wait_ms']:.2f}ms, {stats['write_queue']} writes queued"
+        )
+    await ctx.send("\n".join(lines))
+
+
+@bot.command(name="metrics", brief="Show command latency and cache statistics")
+@commands.is_owner()
+async def _metrics(ctx: commands.Context) -> None:
+    if not metrics.enabled:
+        return await ctx.send("Metrics are disabled, start the bot with `METRICS=1`.")
+    lines = ["```", f"{'command':<20} {'calls':>6} {'p50':>8} {'p95':>8} {'p99':>8}"]
+    for command, count, p50, p95, p99 in metrics.summary():
+        lines.append(f"{command:<20} {count:>6} {p50 * 1e3:>6.1f}ms {p95 * 1e3:>6.1f}ms {p99 * 1e3:>6.1f}ms")
+    errors = sum(value for (name, _), value in metrics.counters.items() if name == 'command_errors_total')
+    lines.append(f"errors: {errors:.0f}")
+    rejected = sum(value for (name, _), value in metrics.counters.items() if name == 'admission_rejected_total')
+    lines.append(f"rejected by admission: {rejected:.0f}{' (overloaded)' if bot.admission.overloaded else ''}")
+    for name in ('verified_lookups_total', 'fact_pool_total'):
+        ratio = metrics.ratio(name)
+        lines.append(f"{name} hit ratio: {'n/a' if ratio is None else f'{ratio:.1%}'}")
+    lines.append("```")
+    await ctx.send("\n".join(lines))
+
+
 TOKEN = os.getenv('TOKEN')
 bot.run(TOKEN)
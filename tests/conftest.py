@@ -0,0 +1,14 @@
+import asyncio
+import inspect
+
+import pytest
+
+
+# Coroutine tests run on a fresh event loop each, the suite doesn't need an asyncio plugin
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem: pytest.Function):
+    if not inspect.iscoroutinefunction(pyfuncitem.obj):
+        return None
+    arguments = {name: pyfuncitem.funcargs[name] for name in pyfuncitem._fixtureinfo.argnames}
+    asyncio.run(pyfuncitem.obj(**arguments))
+    return True
@@ -0,0 +1,192 @@
+import os
+import json
+import zlib
+import struct
+import tempfile
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Tuple
+
+import discord
+from aiohttp import WSMsgType, web
+
+
+# A local aiohttp server for the code that talks HTTP, yields its base URL ("http://127.0.0.1:port")
+@asynccontextmanager
+async def serve(routes: Dict[str, Callable]) -> AsyncIterator[str]:
+    app = web.Application()
+    for path, handler in routes.items():
+        app.router.add_get(path, handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', 0).start()
+    try:
+        yield f"http://127.0.0.1:{runner.addresses[0][1]}"
+    finally:
+        await runner.cleanup()
+
+
+BOT_USER = {'id': '1000000000000000', 'username': 'SpaceBot', 'discriminator': '0', 'global_name': None, 'avatar': None, 'bot': True}
+
+
+def guild_payload(guild_id: int, members: int, intents: discord.Intents, online: float = 0.1, channels: int = 1) -> Dict[str, Any]:
+    # GUILD_CREATE as Discord sends it for these intents, with member chunks already folded in:
+    # without the members intent only the bot's own member arrives, without presences none do
+    def member(user_id: int) -> Dict[str, Any]:
+        return {
+            'user': {'id': str(user_id), 'username': f'user{user_id}', 'discriminator': '0', 'global_name': None, 'avatar': None},
+            'roles': [], 'joined_at': '2022-01-01T00:00:00+00:00', 'deaf': False, 'mute': False, 'flags': 0
+        }
+
+    ids = range(guild_id + 1, guild_id + 1 + members) if intents.members else range(0)
+    presences = [
+        {'user': {'id': str(user_id)}, 'status': 'online', 'activities': [], 'client_status': {'desktop': 'online'}}
+        for user_id in ids[::round(1 / online)]
+    ] if intents.presences else []
+    return {
+        'id': str(guild_id), 'name': f'guild {members}', 'icon': None, 'owner_id': str(guild_id + 1),
+        'member_count': members, 'large': members > 250, 'roles': [], 'emojis': [], 'stickers': [], 'features': [],
+        'channels': [
+            {'id': str(guild_id + 1 + members + index), 'type': 0, 'name': f'channel-{index}', 'position': index, 'permission_overwrites': []}
+            for index in range(channels)
+        ],
+        'members': [{**member(int(BOT_USER['id'])), 'user': BOT_USER}] + [member(user_id) for user_id in ids],
+        'presences': presences, 'voice_states': [], 'threads': [], 'stage_instances': [], 'guild_scheduled_events': []
+    }
+
+
+def message_payload(message_id: int, guild_id: int, channel_id: int, author_id: int, content: str = '>>spacefacts', **fields: Any) -> Dict[str, Any]:
+    return {
+        'id': str(message_id), 'channel_id': str(channel_id), 'guild_id': str(guild_id), 'type': 0,
+        'content': content, 'timestamp': '2022-01-01T00:00:00+00:00', 'edited_timestamp': None,
+        'tts': False, 'mention_everyone': False, 'mentions': [], 'mention_roles': [], 'attachments': [],
+        'embeds': [], 'pinned': False,
+        'author': {'id': str(author_id), 'username': f'user{author_id}', 'discriminator': '0', 'global_name': None, 'avatar': None},
+        **fields
+    }
+
+
+def json_response(data: Any, status: int = 200) -> web.Response:
+    # discord.py only decodes bodies whose content type is exactly application/json, no charset
+    return web.Response(body=json.dumps(data).encode(), status=status, content_type='application/json')
+
+
+# Just enough of Discord's REST API and gateway for the bot to log in, identify its shards
+# and reach READY, on localhost. Records every IDENTIFY it receives
+class StandInGateway:
+    def __init__(self, *, shards: int = 4, max_concurrency: int = 16) -> None:
+        self.shards = shards
+        self.max_concurrency = max_concurrency
+        self.identified: List[Tuple[int, int]] = []
+        self._sequences: Dict[Any, int] = {}
+        self.runner = None
+        self.port = 0
+
+    @property
+    def api(self) -> str:
+        return f"http://127.0.0.1:{self.port}/api/v10"
+
+    @property
+    def gateway(self) -> str:
+        return f"ws://127.0.0.1:{self.port}/"
+
+    async def start(self) -> None:
+        app = web.Application()
+        self.add_routes(app)
+        # last, so routes added by subclasses match first
+        app.router.add_route('*', '/api/v10/{tail:.*}', self.not_found)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = self.runner.addresses[0][1]
+
+    def add_routes(self, app: web.Application) -> None:
+        app.router.add_get('/', self.websocket)
+        app.router.add_get('/api/v10/users/@me', self.user)
+        app.router.add_get('/api/v10/oauth2/applications/@me', self.application)
+        app.router.add_get('/api/v10/gateway', self.gateway_url)
+        app.router.add_get('/api/v10/gateway/bot', self.gateway_bot)
+
+    async def close(self) -> None:
+        if self.runner:
+            await self.runner.cleanup()
+
+    async def not_found(self, request: web.Request) -> web.Response:
+        return json_response({'message': '404: Not Found', 'code': 0}, status=404)
+
+    async def user(self, request: web.Request) -> web.Response:
+        return json_response(BOT_USER)
+
+    async def application(self, request: web.Request) -> web.Response:
+        return json_response({
+            'id': BOT_USER['id'], 'name': 'SpaceBot', 'description': '', 'icon': None, 'bot_public': True,
+            'bot_require_code_grant': False, 'owner': BOT_USER, 'verify_key': '', 'flags': 0
+        })
+
+    async def gateway_url(self, request: web.Request) -> web.Response:
+        return json_response({'url': self.gateway})
+
+    async def gateway_bot(self, request: web.Request) -> web.Response:
+        return json_response({
+            'url': self.gateway,
+            'shards': self.shards,
+            'session_start_limit': {'total': 1000, 'remaining': 1000, 'reset_after': 0, 'max_concurrency': self.max_concurrency}
+        })
+
+    async def dispatch(self, ws: web.WebSocketResponse, event: str, data: Dict[str, Any]) -> None:
+        self._sequences[ws] = sequence = self._sequences.get(ws, 0) + 1
+        await ws.send_json({'op': 0, 't': event, 's': sequence, 'd': data})
+
+    async def identify(self, ws: web.WebSocketResponse, shard: List[int]) -> None:
+        await self.dispatch(ws, 'READY', {
+            'v': 10,
+            'user': BOT_USER,
+            'guilds': [],
+            'session_id': f"stand-in-{shard[0]}",
+            'resume_gateway_url': self.gateway,
+            'shard': shard,
+            'application': {'id': BOT_USER['id'], 'flags': 0}
+        })
+
+    async def websocket(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.send_json({'op': 10, 'd': {'heartbeat_interval': 41250}})
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                continue
+            payload: Dict[str, Any] = json.loads(message.data)
+            if payload['op'] == 1:
+                await ws.send_json({'op': 11})
+            elif payload['op'] == 2:
+                shard = payload['d'].get('shard', [0, 1])
+                self.identified.append(tuple(shard))
+                await self.identify(ws, shard)
+        self._sequences.pop(ws, None)
+        return ws
+
+
+@contextmanager
+def sandbox() -> Iterator[str]:
+    # a scratch working directory with the code linked in, the bot writes its databases and logs there
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as directory:
+        for name in ('main.py', 'cogs', 'utils', 'information'):
+            os.symlink(os.path.join(root, name), os.path.join(directory, name))
+        os.mkdir(os.path.join(directory, 'database'))
+        yield directory
+
+
+
+def png(width: int, height: int, rgb: Tuple[int, int, int]) -> bytes:
+    # a solid colour PNG, without needing an imaging library
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    rows = b''.join(b'\x00' + bytes(rgb) * width for _ in range(height))
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        + chunk(b'IDAT', zlib.compress(rows))
+        + chunk(b'IEND', b'')
+    )
@@ -0,0 +1,98 @@
+import asyncio
+from collections import Counter
+from itertools import count
+from types import SimpleNamespace
+
+import pytest
+
+from utils.admission import LOW, AdmissionController, CommandClass
+from utils.errors import CommandRejected
+
+CLASSES = (
+    CommandClass('scrape', limit=4, queue=8, max_wait=1.0, user_rate=3, guild_rate=20, per=60.0, priority=LOW),
+    CommandClass('default', limit=16, queue=16, max_wait=1.0),
+)
+ids = count(1)
+
+
+def context(user_id: int, guild_id: int, kind: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        command=SimpleNamespace(extras={'admission': kind}), interaction=None, message=SimpleNamespace(id=next(ids)),
+        author=SimpleNamespace(id=user_id), guild=SimpleNamespace(id=guild_id)
+    )
+
+
+async def invoke(controller: AdmissionController, ctx: SimpleNamespace, seconds: float, outcomes: Counter) -> None:
+    try:
+        await controller.admit(ctx)
+    except CommandRejected as error:
+        outcomes[(ctx.guild.id, error.reason)] += 1
+        return
+    try:
+        await asyncio.sleep(seconds)
+        outcomes[(ctx.guild.id, 'ran')] += 1
+    finally:
+        await controller.release(ctx)
+
+
+async def test_a_busy_guild_leaves_room_for_a_quiet_one():
+    outcomes = Counter()
+    controller = AdmissionController(CLASSES)
+    # one busy guild fires 60 slow scrapes from 30 users, a quiet guild right behind it still gets in
+    busy = [invoke(controller, context(100 + index % 30, 1, 'scrape'), 0.2, outcomes) for index in range(60)]
+    quiet = [invoke(controller, context(900 + index, 2, 'scrape'), 0.2, outcomes) for index in range(4)]
+    await asyncio.gather(*busy, *quiet)
+    assert outcomes[(2, 'ran')] == 4
+    assert outcomes[(1, 'guild_share')] == 54 and outcomes[(1, 'ran')] == 6
+    # only the six that ran were charged, the rejected ones left the budgets alone
+    assert controller._guilds['scrape'].peek(1) == 0.0 and controller._guilds['scrape']._buckets[1][0] >= 14
+    assert controller._users['scrape'].peek(100) == 0.0
+    assert controller.running == {'scrape': 0, 'default': 0} and controller.waiting == {'scrape': 0, 'default': 0}
+    assert not controller._in_flight and not controller._held
+
+
+async def test_user_budget():
+    outcomes = Counter()
+    controller = AdmissionController(CLASSES)
+    for _ in range(5):
+        await invoke(controller, context(1, 1, 'scrape'), 0.0, outcomes)
+    assert outcomes == Counter({(1, 'ran'): 3, (1, 'user_budget'): 2})
+
+
+async def test_low_priority_is_shed_under_overload():
+    outcomes = Counter()
+    controller = AdmissionController(CLASSES, overload_waiting=6)
+    slow = [asyncio.create_task(invoke(controller, context(5000 + index, 3 + index, 'default'), 0.3, outcomes)) for index in range(24)]
+    await asyncio.sleep(0.05)
+    assert controller.overloaded
+    await invoke(controller, context(6000, 1000, 'scrape'), 0.0, outcomes)
+    await asyncio.gather(*slow)
+    assert outcomes[(1000, 'shed')] == 1 and sum(outcomes[(3 + index, 'ran')] for index in range(24)) == 24
+    assert not controller.overloaded
+    # shedding didn't cost the scrape's user anything
+    assert controller._users['scrape']._buckets.get(6000) is None
+
+
+async def test_a_timed_out_command_gets_its_tokens_back():
+    outcomes = Counter()
+    classes = (CommandClass('scrape', limit=1, queue=4, max_wait=0.05, user_rate=3, guild_rate=20, per=60.0), CLASSES[1])
+    controller = AdmissionController(classes, guild_share=1.0)
+    holder = asyncio.create_task(invoke(controller, context(1, 1, 'scrape'), 0.3, outcomes))
+    await asyncio.sleep(0.01)
+    await invoke(controller, context(2, 1, 'scrape'), 0.0, outcomes)
+    await holder
+    assert outcomes == Counter({(1, 'ran'): 1, (1, 'timeout'): 1})
+    assert controller._users['scrape']._buckets[2][0] == pytest.approx(3, abs=0.1)
+    assert controller._guilds['scrape']._buckets[1][0] == pytest.approx(19, abs=0.1)
+    assert controller.waiting['scrape'] == 0 and not controller._in_flight
+
+
+async def test_the_check_runs_once_per_invocation():
+    controller = AdmissionController(CLASSES)
+    ctx = context(1, 1, 'default')
+    await controller.admit(ctx)
+    await controller.admit(ctx)
+    assert controller.running['default'] == 1
+    await controller.release(ctx)
+    await controller.release(ctx)
+    assert controller.running['default'] == 0
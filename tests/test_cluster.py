@@ -0,0 +1,65 @@
+import os
+import time
+import asyncio
+
+from support import StandInGateway, sandbox
+from utils.cluster import Launcher
+from utils.database import Database
+from utils.userstate import UserState
+
+
+async def test_clusters_identify_every_shard():
+    clusters, shards = 2, 4
+    gateway = StandInGateway(shards=shards)
+    await gateway.start()
+    try:
+        with sandbox() as directory:
+            launcher = Launcher(clusters=clusters, shards=shards, max_concurrency=gateway.max_concurrency, cwd=directory, env={
+                'TOKEN': 'stand-in',
+                'DISCORD_API_BASE': gateway.api,
+                'DISCORD_GATEWAY_URL': gateway.gateway,
+            })
+            start = time.perf_counter()
+            launcher.start()
+            try:
+                while len(gateway.identified) < shards and time.perf_counter() - start < 60:
+                    await asyncio.sleep(0.1)
+            finally:
+                await asyncio.to_thread(launcher.stop)
+    finally:
+        await gateway.close()
+    assert sorted(gateway.identified) == [(shard, shards) for shard in range(shards)]
+
+
+async def test_processes_sharing_users_db_catch_up(tmp_path):
+    # two processes sharing users.db, one verifies and advances a story, the other catches up
+    path = os.path.join(tmp_path, 'users.db')
+    async with Database({'users': path}, readers=1) as first, Database({'users': path}, readers=1) as second:
+        writer, follower = UserState(first, origin=0), UserState(second, origin=1)
+        await writer.create_tables()
+        await follower.load()
+        await writer.verify(42)
+        await writer.start_story(42)
+        await writer.set_progression(42, 3)
+        assert await follower.sync() > 0
+        assert 42 in follower.verified and follower.get_progression(42) == 3
+        # its own changes are not applied twice
+        assert await writer.sync() == 0
+
+
+def test_exited_cluster_restarts_without_blocking_the_others(tmp_path):
+    script = os.path.join(tmp_path, 'worker.py')
+    with open(script, 'w') as f:
+        f.write("import os, sys\nsys.exit(3 if os.environ['CLUSTER_ID'] == '0' else 0)\n")
+    launcher = Launcher(script, clusters=2, shards=2, restart_after=0.5, cwd=str(tmp_path))
+    launcher.start()
+    for process in launcher.workers.values():
+        process.wait()
+    start = time.perf_counter()
+    launcher.poll()
+    # both exits are noticed in one pass, neither waits out the delay in there
+    assert time.perf_counter() - start < 0.2 and launcher.restarts == 0
+    time.sleep(0.5)
+    launcher.poll()
+    assert launcher.restarts == 2
+    launcher.stop()
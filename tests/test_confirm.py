@@ -0,0 +1,77 @@
+import time
+from types import SimpleNamespace
+
+from utils.ui.view import ConfirmPrompt
+
+
+class FakeResponse:
+    def __init__(self, calls: list) -> None:
+        self.calls = calls
+
+    async def defer(self) -> None:
+        self.calls.append(('defer',))
+
+    async def edit_message(self, **kwargs) -> None:
+        self.calls.append(('edit_message', kwargs['content']))
+
+    async def send_message(self, content: str, **kwargs) -> None:
+        self.calls.append(('send_message', content))
+
+
+def interaction(user_id: int, handlers: dict, calls: list) -> SimpleNamespace:
+    async def edit_original_response(**kwargs) -> None:
+        calls.append(('edit_original_response', kwargs['content']))
+
+    return SimpleNamespace(
+        user=SimpleNamespace(id=user_id), client=SimpleNamespace(confirm_actions=handlers),
+        response=FakeResponse(calls), edit_original_response=edit_original_response
+    )
+
+
+async def click(custom_id: str, user_id: int, handlers: dict) -> list:
+    calls = []
+    item = ConfirmPrompt.__discord_ui_compiled_template__.fullmatch(custom_id)
+    prompt = await ConfirmPrompt.from_custom_id(None, None, item)
+    if await prompt.interaction_check(interaction(user_id, handlers, calls)):
+        await prompt.callback(interaction(user_id, handlers, calls))
+    return calls
+
+
+async def test_state_lives_in_the_custom_id():
+    view = ConfirmPrompt.view('unverify', 42)
+    confirm, cancel = view.children
+    assert view.is_finished()
+    assert confirm.item.custom_id.startswith('confirm:unverify:42:') and confirm.item.custom_id.endswith(':yes')
+    assert cancel.item.custom_id.split(':')[3] == confirm.item.custom_id.split(':')[3]
+
+
+async def test_click_is_acknowledged_before_the_action_runs():
+    calls = []
+
+    async def unverify(interaction, confirmed: bool) -> str:
+        calls.append(('handler', confirmed))
+        return 'Unverified.' if confirmed else 'Kept.'
+
+    issued = int(time.time())
+    assert await click(f'confirm:unverify:42:{issued}:yes', 42, {'unverify': unverify}) == [
+        ('defer',), ('edit_original_response', 'Unverified.')
+    ]
+    assert calls == [('handler', True)]
+    assert (await click(f'confirm:unverify:42:{issued}:no', 42, {'unverify': unverify}))[-1] == ('edit_original_response', 'Kept.')
+
+
+async def test_stale_and_foreign_clicks_are_refused():
+    calls = []
+
+    async def unverify(interaction, confirmed: bool) -> str:
+        calls.append(('handler', confirmed))
+        return 'Unverified.'
+
+    issued = int(time.time()) - ConfirmPrompt.EXPIRES - 1
+    assert await click(f'confirm:unverify:42:{issued}:yes', 42, {'unverify': unverify}) == [
+        ('edit_message', "This prompt has expired, run the command again.")
+    ]
+    assert (await click(f'confirm:unverify:42:{int(time.time())}:yes', 7, {'unverify': unverify}))[0][0] == 'send_message'
+    # its cog was unloaded since the prompt went out
+    assert (await click(f'confirm:unverify:42:{int(time.time())}:yes', 42, {}))[0][0] == 'edit_message'
+    assert not calls
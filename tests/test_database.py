@@ -0,0 +1,92 @@
+import os
+import asyncio
+import sqlite3
+
+import pytest
+
+from utils.database import Database
+
+INSERT = 'INSERT INTO verified (user_id) VALUES (?)'
+COUNT = 'SELECT COUNT(*) FROM verified'
+
+
+async def open_database(tmp_path, readers: int = 2) -> Database:
+    database = Database({'users': os.path.join(tmp_path, 'users.db')}, readers=readers)
+    await database.start()
+    await database.writer('users').execute('CREATE TABLE verified (user_id INTEGER PRIMARY KEY)')
+    return database
+
+
+async def test_reads_go_on_while_the_writer_commits(tmp_path):
+    database = await open_database(tmp_path, readers=4)
+    try:
+        writer, pool = database.writer('users'), database.reader('users')
+        counts = []
+
+        async def read() -> None:
+            for _ in range(25):
+                counts.append((await pool.fetchone(COUNT))[0])
+                await asyncio.sleep(0)
+
+        await asyncio.gather(
+            *(writer.execute(INSERT, (user_id,)) for user_id in range(500)),
+            *(read() for _ in range(8))
+        )
+        assert len(counts) == 200 and all(0 <= count <= 500 for count in counts)
+        assert (await pool.fetchone(COUNT))[0] == 500
+        assert pool.stats()['acquisitions'] == 201 and pool.in_use == 0
+    finally:
+        await database.close()
+
+
+async def test_readers_see_the_last_commit_not_an_open_transaction(tmp_path):
+    database = await open_database(tmp_path)
+    try:
+        await database.writer('users').execute(INSERT, (1,))
+        # another process halfway through a write, in WAL it blocks no reader
+        other = sqlite3.connect(os.path.join(tmp_path, 'users.db'), isolation_level=None)
+        other.execute('BEGIN IMMEDIATE')
+        other.execute(INSERT, (2,))
+        assert (await asyncio.wait_for(database.reader('users').fetchone(COUNT), 1))[0] == 1
+        other.execute('COMMIT')
+        other.close()
+        assert (await database.reader('users').fetchone(COUNT))[0] == 2
+        with pytest.raises(sqlite3.OperationalError):
+            async with database.reader('users').acquire() as conn:
+                await conn.execute(INSERT, (3,))
+    finally:
+        await database.close()
+
+
+async def test_stats_report_pool_use_and_queued_writes(tmp_path):
+    database = await open_database(tmp_path)
+    try:
+        pool = database.reader('users')
+        assert database.stats()['users'] == {
+            'size': 2, 'in_use': 0, 'acquisitions': 0, 'avg_wait_ms': 0.0, 'max_wait_ms': 0.0, 'write_queue': 0
+        }
+        release = asyncio.Event()
+
+        async def hold() -> None:
+            async with pool.acquire():
+                await release.wait()
+
+        holders = [asyncio.create_task(hold()) for _ in range(2)]
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(pool.fetchone(COUNT))
+        await asyncio.sleep(0.05)
+        # queued writes are counted until the writer task picks them up
+        writes = [database.writer('users').submit(INSERT, (user_id,)) for user_id in range(3)]
+        stats = database.stats()['users']
+        assert stats['in_use'] == 2 and stats['acquisitions'] == 2 and stats['write_queue'] == 3
+        assert not waiter.done()
+
+        release.set()
+        assert (await waiter)[0] == 0
+        await asyncio.gather(*holders, *writes)
+        stats = database.stats()['users']
+        assert stats['in_use'] == 0 and stats['acquisitions'] == 3 and stats['write_queue'] == 0
+        # only the third read waited, for about the 50ms the other two held on
+        assert stats['max_wait_ms'] >= 40 and stats['avg_wait_ms'] == pytest.approx(stats['max_wait_ms'] / 3, rel=0.2)
+    finally:
+        await database.close()
@@ -0,0 +1,75 @@
+import time
+import asyncio
+
+from aiohttp import ClientSession, web
+
+from support import serve
+from utils.facts import FactPool
+from utils.scraper import Scraper
+from utils.web import ResponseCache, WebClient
+
+
+def counting_page():
+    requests = []
+
+    async def fact_page(request: web.Request) -> web.Response:
+        requests.append(request.path)
+        await asyncio.sleep(0.05)
+        return web.Response(text=f"<html><body><h2 class='wow'>Space fact #{len(requests)}</h2></body></html>", content_type='text/html')
+
+    return requests, fact_page
+
+
+async def test_concurrent_fetches_share_one_request():
+    requests, fact_page = counting_page()
+    async with serve({'/random/facts/space': fact_page}) as base, ClientSession() as session:
+        scraper = Scraper(WebClient(session, cache=ResponseCache(None)), base=f"{base}/random/facts/")
+        pool = FactPool(scraper.scrape, size=16)
+        facts = await asyncio.gather(*(pool.fetch() for _ in range(10)))
+    assert len(requests) == 1
+    assert set(facts) == {'Space fact #1'} and len(pool) == 1
+
+
+async def test_get_answers_from_memory():
+    requests, fact_page = counting_page()
+    async with serve({'/random/facts/space': fact_page}) as base, ClientSession() as session:
+        scraper = Scraper(WebClient(session, cache=ResponseCache(None)), base=f"{base}/random/facts/")
+        pool = FactPool(scraper.scrape, size=4)
+        assert await pool.refill() == 4 and pool.full
+        fetched = len(requests)
+
+        start = time.perf_counter()
+        facts = {await pool.get_or_fetch() for _ in range(10_000)}
+        elapsed = (time.perf_counter() - start) / 10_000
+    # a live scrape takes the stand-in's 50ms, the pool answers without going upstream
+    assert len(requests) == fetched
+    assert facts <= {f'Space fact #{number}' for number in range(1, fetched + 1)}
+    assert elapsed < 1e-3
+
+
+def test_duplicates_and_size():
+    pool = FactPool(lambda: None, size=2)
+    assert pool.add(' Mars is red. ') and not pool.add('Mars is red.')
+    assert not pool.add('   ')
+    pool.add('Venus is hot.')
+    pool.add('Jupiter is big.')
+    # the oldest fact makes room
+    assert len(pool) == 2 and 'Mars is red.' not in pool._facts
+
+
+def test_old_facts_expire():
+    pool = FactPool(lambda: None, ttl=60)
+    pool.add('Mars is red.')
+    pool._facts['Mars is red.'] -= 61
+    pool.add('Venus is hot.')
+    assert len(pool) == 1 and pool.get() == 'Venus is hot.'
+
+
+async def test_failed_refill_keeps_what_it_has():
+    async def fail() -> str:
+        raise ValueError("No fact found")
+
+    pool = FactPool(fail, size=4)
+    pool.add('Mars is red.')
+    assert await pool.refill() == 0
+    assert pool.get() == 'Mars is red.'
@@ -0,0 +1,67 @@
+import asyncio
+from types import SimpleNamespace
+
+import discord
+
+from utils.feedback import CoalescedStatus, RouteBudget
+
+
+def channel_context(calls: list, fail: bool = False) -> SimpleNamespace:
+    class FakeMessage:
+        async def edit(self, content: str) -> None:
+            calls.append(('edit', content))
+
+    async def send(content: str, **kwargs) -> FakeMessage:
+        if fail:
+            raise discord.HTTPException(SimpleNamespace(status=500, reason='error'), 'error')
+        calls.append(('send', content))
+        return FakeMessage()
+
+    return SimpleNamespace(channel=SimpleNamespace(id=1), send=send)
+
+
+async def test_bumps_coalesce_into_few_edits():
+    calls = []
+    with CoalescedStatus(channel_context(calls), RouteBudget(), lambda count: f"Wrong, {count} so far", window=0.1) as status:
+        for _ in range(50):
+            status.bump()
+            await asyncio.sleep(0.005)
+        await asyncio.sleep(0.15)
+    assert calls[0][0] == 'send' and all(kind == 'edit' for kind, _ in calls[1:])
+    assert calls[-1] == ('edit', "Wrong, 50 so far")
+    # roughly a call per window over the quarter second, never one per bump
+    assert len(calls) <= 5 and status.calls == len(calls)
+
+
+async def test_failed_feedback_is_not_fatal():
+    with CoalescedStatus(channel_context([], fail=True), RouteBudget(), str, window=0.01) as status:
+        status.bump()
+        await asyncio.sleep(0.05)
+        assert status._task.done() and status._task.exception() is None
+
+
+def test_reserve_queues_past_the_budget():
+    budget = RouteBudget()
+    delays = [budget.reserve(2) for _ in range(12)]
+    assert delays[:5] == [0.0] * 5 and delays[-1] > 6.9
+
+
+def test_keys_are_bounded():
+    budget = RouteBudget(keys=3)
+    for key in range(10):
+        budget.reserve(key)
+    assert list(budget._buckets) == [7, 8, 9]
+def test_take_peek_and_refund():
+    budget = RouteBudget(rate=2, per=60.0)
+    assert budget.peek(1) == 0.0
+    assert budget.take(1) == 0.0 and budget.take(1) == 0.0
+    retry_after = budget.peek(1)
+    assert retry_after > 29 and budget.take(1) >= retry_after - 0.1
+    budget.refund(1)
+    assert budget.peek(1) == 0.0 and budget.take(1) == 0.0
+    # a refund never takes a bucket past its rate
+    for _ in range(5):
+        budget.refund(2)
+    assert [budget.take(2) for _ in range(3)][-1] > 0
+
+
@@ -0,0 +1,42 @@
+import discord
+import pytest
+
+from support import BOT_USER, guild_payload, message_payload
+from utils.gateway import CORE, GatewayNeeds, GatewayProfile, cog_classes, declared_needs
+
+
+def test_needs_combine():
+    first = GatewayNeeds(intents={'members'}, member_cache={'joined'}, messages=100)
+    second = GatewayNeeds(intents={'reactions'}, chunk_guilds=True, messages=50)
+    combined = first | second
+    assert combined.intents == {'members', 'reactions'} and combined.member_cache == {'joined'}
+    assert combined.chunk_guilds and combined.messages == 100
+
+
+def test_lean_profile_is_what_the_cogs_declare():
+    needs = declared_needs(cog_classes())
+    assert CORE.intents <= needs.intents
+    profile = GatewayProfile.select('lean')
+    assert not profile.intents.members and not profile.intents.presences
+    assert not profile.chunk_guilds_at_startup and profile.max_messages is None
+    assert GatewayProfile.select('full').intents.members
+
+
+def test_bad_profiles():
+    with pytest.raises(ValueError):
+        GatewayProfile.lean(GatewayNeeds(intents={'guilds'}, chunk_guilds=True))
+    with pytest.raises(ValueError):
+        GatewayProfile.select('tiny')
+
+
+@pytest.mark.parametrize('name, members, messages', [('full', 501, 50), ('lean', 1, 0)])
+async def test_profile_caches(name, members, messages):
+    profile = GatewayProfile.select(name)
+    client = discord.Client(**profile.options())
+    state = client._connection
+    state.user = discord.ClientUser(state=state, data=BOT_USER)
+    guild = discord.Guild(data=guild_payload(10**15, 500, profile.intents), state=state)
+    state._add_guild(guild)
+    for index in range(50):
+        state.parse_message_create(message_payload(10**15 + 10**9 + index, 10**15, 10**15 + 501, 10**15 + 1 + index))
+    assert len(guild._members) == members and len(state._messages or ()) == messages
@@ -0,0 +1,127 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+from support import BOT_USER
+from utils.models import SpaceBot, SpaceHelp
+
+EXTENSION = '''
+from discord.ext import commands
+
+
+class Launch(commands.Cog):
+    hidden = False
+
+    @commands.command(brief={brief!r})
+    async def launch(self, ctx):
+        pass
+
+
+class Orbit(commands.Cog):
+    hidden = False
+
+    @commands.command(brief="Stay up")
+    async def orbit(self, ctx):
+        pass
+
+
+class Crew(commands.Cog):
+    hidden = False
+
+    @commands.command(brief="Who is aboard")
+    async def crew(self, ctx):
+        pass
+
+
+async def setup(bot):
+    for cog in (Launch(), Orbit(), Crew()):
+        await bot.add_cog(cog)
+'''
+
+
+class Channel:
+    def __init__(self) -> None:
+        self.sent = []
+
+    async def send(self, **kwargs) -> None:
+        self.sent.append(kwargs)
+
+
+@pytest.fixture
+def bot(tmp_path, monkeypatch):
+    # the bot writes its log file to the working directory, the test extension is imported from it
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(sys, 'dont_write_bytecode', True)
+    bot = SpaceBot()
+    bot._connection.user = discord.ClientUser(state=bot._connection, data=BOT_USER)
+    yield bot
+    bot.logs.stop()
+
+
+def write_extension(directory, brief: str) -> None:
+    with open(os.path.join(directory, 'help_extension.py'), 'w') as f:
+        f.write(EXTENSION.format(brief=brief))
+
+
+async def bot_help(bot: SpaceBot) -> dict:
+    help_command = SpaceHelp()
+    help_command.context = SimpleNamespace(bot=bot, channel=Channel())
+    await help_command.send_bot_help(help_command.get_bot_mapping())
+    return help_command.context.channel.sent[-1]
+
+
+async def test_reloading_an_extension_rebuilds_help(bot, tmp_path):
+    write_extension(tmp_path, "Leave the pad")
+    await bot.load_extension('help_extension')
+    try:
+        first = await bot_help(bot)
+        assert "launch - Leave the pad" in first['embed'].description
+        # a second request is served the pages already rendered
+        assert (await bot_help(bot))['view'].embeds is first['view'].embeds and len(bot.help_cache) == 1
+
+        write_extension(tmp_path, "Leave the pad, then the atmosphere")
+        await bot.reload_extension('help_extension')
+        assert len(bot.help_cache) == 0
+        reloaded = await bot_help(bot)
+        assert "launch - Leave the pad, then the atmosphere" in reloaded['embed'].description
+        assert reloaded['view'].embeds is not first['view'].embeds
+    finally:
+        await bot.unload_extension('help_extension')
+    assert len(bot.help_cache) == 0
+
+
+async def test_cached_pages_still_page_through_the_view(bot, tmp_path):
+    edits = []
+
+    async def edit(**kwargs) -> None:
+        edits.append(kwargs)
+
+    def titles() -> list:
+        return [edit['embed'].title for edit in edits if 'embed' in edit]
+
+    write_extension(tmp_path, "Leave the pad")
+    await bot.load_extension('help_extension')
+    try:
+        rendered = (await bot_help(bot))['view']
+        view = (await bot_help(bot))['view']
+    finally:
+        await bot.unload_extension('help_extension')
+    pages = view.embeds
+    assert pages is rendered.embeds and [page.title for page in pages] == ['Launch Commands', 'Orbit Commands', 'Crew Commands']
+
+    first, previous, stop, forward, last = view.children
+    interaction = SimpleNamespace(message=SimpleNamespace(edit=edit))
+    await forward.callback(interaction)
+    await forward.callback(interaction)
+    assert view.counter == 2 and forward.disabled and last.disabled and not previous.disabled
+    await previous.callback(interaction)
+    await first.callback(interaction)
+    assert view.counter == 0 and first.disabled and previous.disabled and not forward.disabled
+    await last.callback(interaction)
+    assert titles() == ['Orbit Commands', 'Crew Commands', 'Orbit Commands', 'Launch Commands', 'Crew Commands']
+    # paging one view moves neither the shared pages nor the other view
+    assert view.embeds is pages and rendered.counter == 0
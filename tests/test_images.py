@@ -0,0 +1,79 @@
+import io
+import os
+import time
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+from support import png
+from utils.images import CachedImage, FileImageSource, ImageCache, downscale, sniff
+
+URLS = [f"https://example.invalid/images/{name}" for name in ('andromeda.png', 'm31.png', 'pinwheel.png')]
+
+
+@pytest.fixture
+def source(tmp_path) -> FileImageSource:
+    directory = os.path.join(tmp_path, 'source')
+    os.makedirs(directory)
+    for name, colour in (('andromeda.png', (10, 20, 30)), ('m31.png', (10, 20, 30)), ('pinwheel.png', (200, 0, 0))):
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(png(1024, 768, colour))
+    return FileImageSource(directory)
+
+
+def upload(file: discord.File, expires_in: float = 86400) -> SimpleNamespace:
+    expires = format(int(time.time() + expires_in), 'x')
+    return SimpleNamespace(attachments=[SimpleNamespace(filename=file.filename, url=f"https://cdn.invalid/{file.filename}?ex={expires}")])
+
+
+def test_sniff():
+    assert sniff(png(1, 1, (0, 0, 0))) == 'png'
+    assert sniff(b'GIF89a...') == 'gif' and sniff(b'RIFF\0\0\0\0WEBPVP8 ') == 'webp'
+    assert sniff(b'<html>') is None
+    with pytest.raises(ValueError):
+        downscale(b'<html>', 512)
+
+
+def test_downscale():
+    Image = pytest.importorskip('PIL.Image')
+    data, kind = downscale(png(1024, 768, (1, 2, 3)), 512)
+    with Image.open(io.BytesIO(data)) as image:
+        assert max(image.size) == 512 and kind in ('png', 'jpg')
+
+
+async def test_an_image_is_uploaded_once(source, tmp_path):
+    cache = ImageCache(source, os.path.join(tmp_path, 'cache'))
+    await cache.load()
+    assert await cache.warm(URLS) == 3
+    # the same picture under two URLs is stored and uploaded once
+    assert len(cache) == 2
+
+    sent = 0
+    for round_number in range(6):
+        image = await cache.get(URLS[round_number % 2])
+        file = cache.attach(discord.Embed(), image)
+        if file is not None:
+            sent += 1
+            await cache.uploaded(image, upload(file))
+    assert sent == 1 and cache.reuses == 5 and cache.uploads == 1
+
+
+async def test_restart_keeps_files_index_and_upload(source, tmp_path):
+    cache = ImageCache(source, os.path.join(tmp_path, 'cache'))
+    image = await cache.get(URLS[0])
+    await cache.uploaded(image, upload(cache.attach(discord.Embed(), image)))
+
+    restarted = ImageCache(source, os.path.join(tmp_path, 'cache'))
+    await restarted.load()
+    image = await restarted.get(URLS[0])
+    assert restarted.fetched_bytes == 0 and image.reusable()
+    # a missing image falls back to hot-linking
+    assert await restarted.get("https://example.invalid/images/missing.png") is None
+
+
+def test_expiring_uploads_are_not_reused():
+    assert CachedImage('d', 'f.png', "https://cdn.invalid/f.png?ex=" + format(int(time.time() + 86400), 'x')).reusable()
+    assert not CachedImage('d', 'f.png', "https://cdn.invalid/f.png?ex=" + format(int(time.time() + 600), 'x')).reusable()
+    assert not CachedImage('d', 'f.png', "https://cdn.invalid/f.png?ex=zz").reusable()
+    assert not CachedImage('d', 'f.png').reusable()
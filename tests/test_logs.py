@@ -0,0 +1,116 @@
+import os
+import asyncio
+import logging
+
+import discord
+import pytest
+
+from utils.logs import DroppingQueueHandler, RateLimitFilter, setup_logging
+from utils.models import SpaceBot
+
+
+def logger(name: str) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    return logger
+
+
+def test_records_reach_the_file(tmp_path):
+    path = os.path.join(tmp_path, 'discord.log')
+    runtime = setup_logging(logger('tests.logs.file'), path, burst=1000)
+    for index in range(500):
+        runtime.logger.warning("record %d", index)
+    runtime.stop()
+    runtime.stop()
+    with open(path, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 500 and lines[-1].endswith('tests.logs.file: record 499')
+    assert runtime.dropped == 0
+
+
+def test_rotation(tmp_path):
+    path = os.path.join(tmp_path, 'discord.log')
+    runtime = setup_logging(logger('tests.logs.rotation'), path, max_bytes=2048, backups=2, burst=1000)
+    for index in range(200):
+        runtime.logger.warning("record %d", index)
+    runtime.stop()
+    assert sorted(os.listdir(tmp_path)) == ['discord.log', 'discord.log.1', 'discord.log.2']
+
+
+def test_full_queue_drops_and_reports():
+    handler = DroppingQueueHandler(maxsize=2)
+    record = logging.makeLogRecord({'msg': 'hello'})
+    for _ in range(5):
+        handler.enqueue(record)
+    assert handler.dropped == 3 and handler.queue.qsize() == 2
+    handler.queue.get_nowait()
+    handler.queue.get_nowait()
+    handler.enqueue(record)
+    report = handler.queue.get_nowait()
+    assert report.levelno == logging.WARNING and 'Dropped 3 log records' in report.getMessage()
+
+
+def test_rate_limit_spares_warnings():
+    limiter = RateLimitFilter(burst=3, per=60)
+    info = [limiter.filter(logging.makeLogRecord({'name': 'x', 'levelno': logging.INFO, 'msg': 'm'})) for _ in range(5)]
+    warnings = [limiter.filter(logging.makeLogRecord({'name': 'x', 'levelno': logging.WARNING, 'msg': 'm'})) for _ in range(5)]
+    assert info == [True] * 3 + [False] * 2 and all(warnings)
+    assert limiter.suppressed == 2
+
+    limiter.per = 0
+    record = logging.makeLogRecord({'name': 'x', 'levelno': logging.INFO, 'msg': 'm'})
+    assert limiter.filter(record) and record.msg == 'm (2 similar records suppressed)'
+
+
+@pytest.fixture
+def bot(tmp_path, monkeypatch):
+    # start() is stubbed down to its teardown, the log file lands in the working directory
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('database')
+    bot = SpaceBot()
+    bot.logs.handler.dropped = 3
+
+    async def save_state() -> None:
+        await asyncio.sleep(0.05)
+        bot.logger.warning("state saved")
+
+    monkeypatch.setattr(bot, 'prepare_trivia', lambda: asyncio.sleep(0))
+    monkeypatch.setattr(bot, 'save_state', save_state)
+    return bot
+
+
+def shutdown_lines() -> list:
+    with open('discord.log', encoding='utf-8') as f:
+        return [line.rsplit(': ', 1)[1] for line in f.read().splitlines()[-2:]]
+
+
+async def test_shutdown_is_logged_before_the_listener_stops(bot, monkeypatch):
+    async def connect(reconnect: bool = True) -> None:
+        while not bot.is_closed():
+            await asyncio.sleep(0.01)
+
+    monkeypatch.setattr(bot, 'prepare_login', lambda token: asyncio.sleep(0))
+    monkeypatch.setattr(bot, 'connect', connect)
+    running = asyncio.create_task(bot.start('stand-in'))
+    await asyncio.sleep(0.1)
+    # close() returns while start() is still saving state
+    await bot.close()
+    assert not bot.logs.stopped
+    await running
+    assert bot.logs.stopped
+    assert shutdown_lines() == ["state saved", "3 log records were dropped under load"]
+
+
+async def test_a_failed_start_still_logs_its_shutdown(bot, monkeypatch):
+    async def prepare_login(token: str) -> None:
+        raise discord.LoginFailure('Improper token has been passed.')
+
+    monkeypatch.setattr(bot, 'prepare_login', prepare_login)
+    with pytest.raises(discord.LoginFailure):
+        await bot.start('stand-in')
+    # discord.py closes the client after start() has given up
+    assert not bot.logs.stopped
+    await bot.close()
+    assert bot.logs.stopped
+    assert shutdown_lines() == ["state saved", "3 log records were dropped under load"]
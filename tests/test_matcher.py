@@ -0,0 +1,73 @@
+import json
+import random
+
+import pytest
+
+from utils.matcher import AnswerMatcher, TrigramIndex, distance, normalize
+
+
+def levenshtein(a: str, b: str) -> int:
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def test_normalize():
+    assert normalize("  The Bódé's  Galaxy!") == 'bodes galaxy'
+    assert normalize("An Andromeda") == 'andromeda'
+    assert normalize("Theia") == 'theia'
+
+
+def test_banded_distance_agrees_with_levenshtein():
+    rng = random.Random(3)
+    for _ in range(2000):
+        a = ''.join(rng.choice('abn') for _ in range(rng.randrange(0, 9)))
+        b = ''.join(rng.choice('abn') for _ in range(rng.randrange(0, 9)))
+        limit = rng.randrange(0, 4)
+        expected = levenshtein(a, b)
+        assert distance(a, b, limit) == (expected if expected <= limit else limit + 1), (a, b, limit)
+
+
+def test_trigram_filter_finds_everything_within_the_threshold():
+    rng = random.Random(9)
+    words = [''.join(rng.choice('an') for _ in range(rng.randrange(3, 10))) for _ in range(300)]
+    words.append('nananana')
+    index = TrigramIndex(words)
+    for _ in range(150):
+        guess = ''.join(rng.choice('an') for _ in range(rng.randrange(3, 10)))
+        edits = {word: levenshtein(guess, word) for word in words}
+        for threshold in (1, 2):
+            expected = sorted({(edits[word], word) for word in words if edits[word] <= threshold})
+            assert sorted(set(index.search(guess, threshold))) == expected, (guess, threshold)
+    # repeated trigrams count as often as they occur
+    assert index.search('nananana', 1)[0] == (0, 'nananana')
+
+
+@pytest.fixture(scope='module')
+def matcher() -> AnswerMatcher:
+    with open('./information/galaxy.json', 'r') as f:
+        trivia = json.load(f)
+    return AnswerMatcher({key: info['answers'] for key, info in trivia.items()})
+
+
+@pytest.mark.parametrize('guess, correct', [
+    ('Andromeda Galaxy', True),
+    ('the  Andrómeda galaxy!', True),
+    ('Andromda Galaxi', True),
+    # the entry key itself is an accepted answer
+    ('andromeda', True),
+    ('Sombrero Galaxy', False),
+    ('', False),
+])
+def test_guesses(matcher: AnswerMatcher, guess: str, correct: bool):
+    assert matcher.is_correct(guess, 'Andromeda') is correct
+
+
+def test_short_guesses_get_fewer_typos():
+    matcher = AnswerMatcher({'Moon': ['moon'], 'Milky Way': ['milky way']})
+    assert matcher.threshold('moo') == 0 and matcher.match('mon') is None
+    assert matcher.match('milky wya') == 'Milky Way'
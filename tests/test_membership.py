@@ -0,0 +1,41 @@
+import random
+
+from utils.membership import VerifiedSet
+
+
+def test_membership_across_buffer_and_pending():
+    ids = random.sample(range(10**17, 10**17 + 80_000), 10_000)
+    verified = VerifiedSet(ids, merge_at=64)
+    extra = [10**17 - index for index in range(1, 200)]
+    for user_id in extra:
+        verified.add(user_id)
+    verified.add(ids[0])
+    assert len(verified) == len(ids) + len(extra)
+    assert all(user_id in verified for user_id in ids + extra)
+    assert 10**17 + 80_001 not in verified and 0 not in verified
+    assert list(verified) == sorted(ids + extra)
+
+
+def test_pending_ids_merge_in_batches():
+    verified = VerifiedSet([5, 1, 3], merge_at=3)
+    verified.add(4)
+    verified.add(2)
+    assert len(verified._pending) == 2
+    verified.add(6)
+    assert not verified._pending and list(verified._sorted) == [1, 2, 3, 4, 5, 6]
+
+
+def test_count_range():
+    verified = VerifiedSet([10, 20, 30])
+    verified.add(25)
+    assert verified.count_range(10, 30) == 3
+    assert verified.count_range(0, 9) == 0
+
+
+def test_from_buffer_searches_in_place():
+    source = VerifiedSet([3, 1, 2])
+    verified = VerifiedSet.from_buffer(memoryview(source.buffer.tobytes()))
+    assert 2 in verified and 4 not in verified
+    verified.add(4)
+    verified.merge()
+    assert list(verified) == [1, 2, 3, 4]
@@ -0,0 +1,90 @@
+import pytest
+
+from utils.metrics import BUCKETS, Histogram, Metrics, current_command
+
+
+def enabled() -> Metrics:
+    metrics = Metrics()
+    metrics.enabled = True
+    return metrics
+
+
+def test_bucket_placement():
+    histogram = Histogram()
+    # a bucket holds everything up to and including its bound, like Prometheus' le
+    for value in (0, BUCKETS[0], BUCKETS[0] * 1.2, BUCKETS[-1], BUCKETS[-1] * 2):
+        histogram.observe(value)
+    assert histogram.counts[0] == 2 and histogram.counts[1] == 1
+    assert histogram.counts[-2] == 1 and histogram.counts[-1] == 1
+    assert histogram.count == 5 and histogram.total == pytest.approx(BUCKETS[0] * 2.2 + BUCKETS[-1] * 3)
+
+
+def test_quantile_interpolates_inside_the_bucket():
+    assert Histogram().quantile(0.5) == 0.0
+    histogram = Histogram()
+    for _ in range(10):
+        histogram.observe(0.0007)
+    # all ten fall in (0.0005, 0.001], the median sits halfway through it
+    assert histogram.quantile(0.5) == pytest.approx(0.00075)
+    assert histogram.quantile(1.0) == pytest.approx(0.001)
+    for _ in range(10):
+        histogram.observe(0.003)
+    assert histogram.quantile(0.25) == pytest.approx(0.00075)
+    assert histogram.quantile(0.75) == pytest.approx(0.002 + 0.002 * 5 / 10)
+    # what lands past the last bound is reported as the last bound
+    overflow = Histogram()
+    overflow.observe(100)
+    assert overflow.quantile(0.99) == BUCKETS[-1]
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics()
+    metrics.inc('commands_total')
+    metrics.observe('command_seconds', 0.1, command='ping')
+    with metrics.timer('command_seconds', command='ping'), metrics.phase('sqlite'):
+        pass
+    assert not metrics.counters and not metrics.histograms
+
+
+def test_phase_is_attributed_to_the_running_command():
+    metrics = enabled()
+    token = current_command.set('typeracer')
+    try:
+        with metrics.phase('sqlite'):
+            pass
+    finally:
+        current_command.reset(token)
+    with metrics.phase('http'):
+        pass
+    assert set(metrics.histograms) == {
+        ('phase_seconds', (('command', 'typeracer'), ('phase', 'sqlite'))),
+        ('phase_seconds', (('command', 'none'), ('phase', 'http'))),
+    }
+
+
+def test_render_prometheus_text():
+    metrics = enabled()
+    metrics.inc('verified_lookups_total', result='hit')
+    metrics.inc('verified_lookups_total', 2, result='miss')
+    metrics.observe('command_seconds', 0.0007, command='ping')
+    metrics.observe('command_seconds', 50, command='ping')
+    metrics.gauge('admission_overloaded', lambda: 0.0)
+    lines = metrics.render().splitlines()
+
+    assert lines[:3] == [
+        '# TYPE spacebot_verified_lookups_total counter',
+        'spacebot_verified_lookups_total{result="hit"} 1',
+        'spacebot_verified_lookups_total{result="miss"} 2',
+    ]
+    assert lines[3] == '# TYPE spacebot_command_seconds histogram'
+    buckets = [line for line in lines if line.startswith('spacebot_command_seconds_bucket')]
+    # one line per bound plus +Inf, counts are cumulative
+    assert len(buckets) == len(BUCKETS) + 1
+    assert buckets[0] == 'spacebot_command_seconds_bucket{command="ping",le="0.0005"} 0'
+    assert buckets[1] == 'spacebot_command_seconds_bucket{command="ping",le="0.001"} 1'
+    assert buckets[-2] == f'spacebot_command_seconds_bucket{{command="ping",le="{BUCKETS[-1]:g}"}} 1'
+    assert buckets[-1] == 'spacebot_command_seconds_bucket{command="ping",le="+Inf"} 2'
+    assert 'spacebot_command_seconds_sum{command="ping"} 50.0007' in lines
+    assert 'spacebot_command_seconds_count{command="ping"} 2' in lines
+    assert lines[-2:] == ['# TYPE spacebot_admission_overloaded gauge', 'spacebot_admission_overloaded 0.0']
+    assert metrics.summary() == [('ping', 2, pytest.approx(0.001), pytest.approx(BUCKETS[-1]), pytest.approx(BUCKETS[-1]))]
@@ -0,0 +1,80 @@
+import os
+import time
+from types import MappingProxyType
+
+import pytest
+
+from utils.database import Database
+from utils.missions import GuessCorrect, MissionIndex, MissionTracker, TyperacerFinish, duration_seconds
+from utils.userstate import UserState
+
+MISSIONS = MappingProxyType({
+    '1': {'name': 'guess', 'duration': '0:45', 'goal': {'event': GuessCorrect.name, 'count': 3}},
+    '2': {'name': 'race', 'duration': '1:00', 'goal': {'event': TyperacerFinish.name, 'count': 1}},
+    '3': {'name': 'untracked', 'duration': '0:30'},
+})
+
+
+@pytest.fixture
+def database_path(tmp_path) -> str:
+    return os.path.join(tmp_path, 'users.db')
+
+
+async def tracker_for(database: Database, *players: int) -> MissionTracker:
+    state = UserState(database)
+    await state.create_tables()
+    await state.load()
+    for user_id in players:
+        await state.start_story(user_id)
+    tracker = MissionTracker(state, lambda: MISSIONS)
+    await tracker.load()
+    return tracker
+
+
+def test_index():
+    index = MissionIndex(MISSIONS)
+    assert index.goals == {1: 3, 2: 1} and index.durations[2] == 3600
+    assert index.events == {GuessCorrect.name: frozenset({1}), TyperacerFinish.name: frozenset({2})}
+    assert duration_seconds('1:05') == 3900
+
+
+async def test_events_clear_missions_in_order(database_path):
+    async with Database({'users': database_path}) as database:
+        tracker = await tracker_for(database, 1)
+        # not on a racing mission yet, and user 2 isn't in the story at all
+        assert tracker.emit(TyperacerFinish(1, 80.0, 0.98)) is None
+        assert tracker.emit(GuessCorrect(2, 'galaxy')) is None
+        assert [tracker.emit(GuessCorrect(1, 'galaxy')) for _ in range(3)] == [None, None, 1]
+        assert tracker.emit(TyperacerFinish(1, 80.0, 0.98)) == 2
+        progress, goal, deadline = tracker.status(1)
+        assert progress.mission == 3 and goal is None and deadline is None
+
+        assert await tracker.flush() == 1
+        row = await database.reader('users').fetchone('SELECT progression, mission_count FROM story WHERE user_id = ?', (1,))
+        assert row == (3, 0)
+
+
+async def test_missions_out_of_time_end_the_story(database_path):
+    async with Database({'users': database_path}) as database:
+        tracker = await tracker_for(database, 1, 2)
+        # found straight after load, before any event rebuilt the deadlines
+        assert sorted(tracker.expired(time.time() + 3600)) == [1, 2]
+
+        await tracker.user_state.save_progress(1, 1, 2, time.time() - 3600)
+        tracker = await tracker_for(database)
+        assert tracker.emit(GuessCorrect(1, 'galaxy')) is None
+        tracker.emit(GuessCorrect(2, 'galaxy'))
+        # user 2's count and the end of user 1's story
+        assert await tracker.flush() == 2
+        assert tracker.user_state.get_progression(1) is None and tracker.user_state.get_progression(2) == 1
+        assert tracker.status(2)[0].count == 1
+
+
+async def test_a_reloaded_missions_file_is_picked_up(database_path):
+    missions = MISSIONS
+    async with Database({'users': database_path}) as database:
+        tracker = await tracker_for(database, 1)
+        tracker._missions = lambda: missions
+        tracker.emit(GuessCorrect(1, 'galaxy'))
+        missions = MappingProxyType({**MISSIONS, '1': {'name': 'guess', 'duration': '0:45', 'goal': {'event': GuessCorrect.name, 'count': 2}}})
+        assert tracker.emit(GuessCorrect(1, 'galaxy')) == 1
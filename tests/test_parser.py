@@ -0,0 +1,41 @@
+import os
+
+import pytest
+from aiohttp import ClientSession, web
+
+from support import serve
+from utils.parser import WebsiteParser, parse_fact
+from utils.scraper import Scraper
+from utils.web import ResponseCache, WebClient
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES, name), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def test_strained_parse_matches_full_parse():
+    text = fixture('space_facts.html')
+    full = WebsiteParser(text, "lxml").get_head(2, {'class': 'wow'}).text
+    assert parse_fact(text) == full.strip() == "The Sun makes up about 99.86 percent of the total mass of the Solar System."
+
+
+def test_class_is_matched_as_a_word():
+    assert parse_fact("<h2 class='wowza'>no</h2><h2 class='big wow'>yes</h2>") == 'yes'
+    assert parse_fact("<h1 class='wow'>no</h1>") is None
+
+
+async def test_scrape_parses_off_the_loop():
+    async def page(request: web.Request) -> web.Response:
+        return web.Response(text=fixture('space_facts.html'), content_type='text/html')
+
+    async def empty(request: web.Request) -> web.Response:
+        return web.Response(text="<html></html>", content_type='text/html')
+
+    async with serve({'/facts/space': page, '/empty/space': empty}) as base, ClientSession() as session:
+        client = WebClient(session, cache=ResponseCache(None))
+        assert (await Scraper(client, base=f"{base}/facts/").scrape()).startswith("The Sun makes up")
+        with pytest.raises(ValueError):
+            await Scraper(client, base=f"{base}/empty/").scrape()
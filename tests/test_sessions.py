@@ -0,0 +1,71 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from utils.errors import SessionUnavailable
+from utils.sessions import SessionManager
+
+
+def message(channel_id: int, author_id: int, message_id: int = 1, content: str = 'guess') -> SimpleNamespace:
+    return SimpleNamespace(id=message_id, channel=SimpleNamespace(id=channel_id), author=SimpleNamespace(id=author_id), content=content)
+
+
+async def test_thousands_of_sessions_get_only_their_messages():
+    sessions, rounds = 5000, 3
+    manager = SessionManager(limit=sessions)
+
+    async def play(index: int) -> int:
+        with manager.open(index % 100, index) as session:
+            for _ in range(rounds):
+                received = await session.wait(timeout=5)
+                assert (received.channel.id, received.author.id) == (index % 100, index)
+        return rounds
+
+    players = [asyncio.create_task(play(index)) for index in range(sessions)]
+    await asyncio.sleep(0)
+    assert manager.active == sessions
+    for _ in range(rounds):
+        for index in range(sessions):
+            assert manager.dispatch(message(index % 100, index))
+            # someone in the same channel who isn't playing
+            assert not manager.dispatch(message(index % 100, sessions + index))
+    assert sum(await asyncio.gather(*players)) == sessions * rounds
+    assert manager.active == 0
+
+
+async def test_quiet_player_times_out():
+    manager = SessionManager(timeout=0.05)
+    with manager.open(1, 1) as session:
+        with pytest.raises(asyncio.TimeoutError):
+            await session.wait()
+    assert manager.active == 0
+
+
+def test_one_game_per_player_and_a_cap():
+    manager = SessionManager(limit=2)
+    manager.open(1, 1)
+    with pytest.raises(SessionUnavailable):
+        manager.open(1, 1)
+    manager.open(1, 2)
+    with pytest.raises(SessionUnavailable):
+        manager.open(2, 3)
+    assert manager.rejected == 2 and manager.active == 2
+
+
+async def test_messages_before_the_game_started_are_ignored():
+    manager = SessionManager()
+    with manager.open(1, 1, after=10) as session:
+        manager.dispatch(message(1, 1, message_id=10))
+        manager.dispatch(message(1, 1, message_id=11))
+        assert (await session.wait(timeout=1)).id == 11
+
+
+async def test_full_queue_keeps_the_latest_message():
+    manager = SessionManager()
+    with manager.open(1, 1) as session:
+        for message_id in range(1, 20):
+            manager.dispatch(message(1, 1, message_id))
+        manager.dispatch(message(1, 1, 20, content='quit'))
+        received = [await session.wait(timeout=1) for _ in range(16)]
+    assert received[0].id == 5 and received[-1].content == 'quit'
@@ -0,0 +1,88 @@
+import os
+import time
+from array import array
+
+import pytest
+
+from utils.database import Database
+from utils.membership import VerifiedSet
+from utils.missions import GuessCorrect, MissionTracker
+from utils.snapshot import Snapshot, SnapshotError, write_snapshot
+from utils.userstate import UserState
+
+MISSIONS = {'1': {'name': 'guess', 'duration': '0:45', 'goal': {'event': GuessCorrect.name, 'count': 10}}}
+
+
+def test_sections_round_trip_in_place(tmp_path):
+    path = os.path.join(tmp_path, 'snapshot.bin')
+    ids = array('q', range(10**17, 10**17 + 1000, 3))
+    write_snapshot(path, {'verified': ids, 'odd': b'abc', 'empty': b''}, {'cursor': 7})
+    snapshot = Snapshot(path)
+    assert snapshot.meta == {'cursor': 7}
+    assert bytes(snapshot.section('odd')) == b'abc' and snapshot.section('empty').nbytes == 0
+    verified = VerifiedSet.from_buffer(snapshot.section('verified'))
+    assert len(verified) == len(ids) and ids[100] in verified and ids[100] + 1 not in verified
+    with pytest.raises(SnapshotError):
+        snapshot.section('missing')
+
+
+@pytest.mark.parametrize('damage', ['flip', 'truncate', 'magic', 'empty'])
+def test_damaged_snapshots_are_refused(tmp_path, damage):
+    path = os.path.join(tmp_path, 'snapshot.bin')
+    written = write_snapshot(path, {'verified': array('q', range(1000))}, {'cursor': 0})
+    with open(path, 'r+b') as f:
+        if damage == 'flip':
+            f.seek(written // 2)
+            byte = f.read(1)
+            f.seek(written // 2)
+            f.write(bytes([byte[0] ^ 1]))
+        elif damage == 'truncate':
+            f.truncate(written - 8)
+        elif damage == 'magic':
+            f.write(b'NOTSNAP\x00')
+        else:
+            f.truncate(0)
+    with pytest.raises(SnapshotError):
+        Snapshot(path)
+    # which sends the bot down the full load from the database
+    assert Snapshot.load(path) is None
+    assert Snapshot.load(os.path.join(tmp_path, 'missing.bin')) is None
+
+
+async def test_restore_then_reconcile_with_the_tables(tmp_path):
+    path = os.path.join(tmp_path, 'snapshot.bin')
+    async with Database({'users': os.path.join(tmp_path, 'users.db')}) as database:
+        state = UserState(database)
+        await state.create_tables()
+        await state.load()
+        for user_id in (1, 2, 3):
+            await state.verify(user_id)
+            await state.start_story(user_id)
+        tracker = MissionTracker(state, lambda: MISSIONS)
+        await tracker.load()
+        tracker.emit(GuessCorrect(1, 'galaxy'))
+        await tracker.flush()
+        sections, meta = state.snapshot()
+        sections['missions'] = tracker.snapshot()
+        write_snapshot(path, sections, {**meta, 'created': time.time()})
+
+        # what another process did after the snapshot was written
+        other = UserState(database)
+        await other.load()
+        await other.verify(4)
+        await other.set_progression(2, 5)
+        await other.stop_story(3)
+        await other.save_progress(1, 1, 4, time.time())
+
+        snapshot = Snapshot(path)
+        restored = UserState(database)
+        restored.restore(snapshot)
+        restored_tracker = MissionTracker(restored, lambda: MISSIONS)
+        restored_tracker.restore(snapshot.section('missions'))
+        assert 4 not in restored.verified and restored_tracker.status(1)[0].count == 1
+
+        assert await restored.reconcile() == {'verified_added': 1, 'verified_removed': 0, 'story_changed': 1, 'story_ended': 1}
+        assert await restored_tracker.reconcile() == {'missions_changed': 2, 'missions_ended': 1}
+        assert 4 in restored.verified and restored.get_progression(2) == 5 and restored.get_progression(3) is None
+        assert restored_tracker.status(1)[0].count == 4
+        assert sorted(restored_tracker.expired(time.time() + 3600)) == [1]
@@ -0,0 +1,68 @@
+import os
+import time
+import asyncio
+
+import discord
+import pytest
+
+from utils.models import SpaceBot
+from utils.startup import StartupProfiler
+
+
+def test_phases_are_recorded_even_when_they_fail():
+    profiler = StartupProfiler()
+    with profiler.phase('imports'):
+        pass
+    with pytest.raises(RuntimeError):
+        with profiler.phase('database open'):
+            raise RuntimeError
+    assert [name for name, _, _ in profiler.phases] == ['imports', 'database open']
+    assert all(start <= end for _, start, end in profiler.phases)
+    assert profiler.origin == profiler.phases[0][1]
+
+
+def test_report_lines_up_overlapping_phases():
+    profiler = StartupProfiler()
+    origin = time.perf_counter()
+    # recorded in the order they ended, reported in the order they started
+    profiler.record('trivia compile', origin + 0.010, origin + 0.030)
+    profiler.record('login + setup_hook', origin + 0.005, origin + 0.250)
+    profiler.record('imports', origin, origin + 0.005)
+    lines = profiler.report().splitlines()
+    assert lines[0].split() == ['phase', 'start', 'took']
+    assert [line.split() for line in lines[1:]] == [
+        ['imports', '0.0ms', '5.0ms'],
+        ['login', '+', 'setup_hook', '5.0ms', '245.0ms'],
+        ['trivia', 'compile', '10.0ms', '20.0ms'],
+        ['total', '250.0ms'],
+    ]
+
+
+def test_an_empty_report_only_has_the_total():
+    assert StartupProfiler().report().splitlines()[1:] == [f"{'total':<32} {'':>9} {0:7.1f}ms"]
+
+
+async def test_a_failed_login_stops_the_other_startup_steps(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('database')
+    bot = SpaceBot()
+    seen = []
+
+    async def prepare_trivia() -> None:
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            # the database is still open while the step winds down
+            seen.append(('cancelled', bool(bot._conn._conn)))
+            raise
+
+    async def prepare_login(token: str) -> None:
+        await asyncio.sleep(0.05)
+        raise discord.LoginFailure('Improper token has been passed.')
+
+    monkeypatch.setattr(bot, 'prepare_trivia', prepare_trivia)
+    monkeypatch.setattr(bot, 'prepare_login', prepare_login)
+    with pytest.raises(discord.LoginFailure):
+        await asyncio.wait_for(bot.start('stand-in'), 5)
+    assert seen == [('cancelled', True)] and not bot._conn._conn
+    await bot.close()
@@ -0,0 +1,66 @@
+import os
+import json
+import shutil
+
+import pytest
+
+from utils.trivia import CorpusError, TriviaCorpus, TriviaLibrary, compile_galaxies, compile_missions, compile_sentences
+
+INFORMATION = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'information')
+
+
+def mission(**overrides) -> dict:
+    return {'name': 'Mission', 'points': 10, 'description': 'Do the thing', 'duration': '0:45', **overrides}
+
+
+def test_shipped_corpus_compiles():
+    corpus = TriviaCorpus.compile(INFORMATION)
+    assert len(corpus) > 0 and corpus.sentences
+    entry = corpus.random('galaxy')
+    assert corpus.get('galaxy', entry.key) is entry
+    assert corpus.is_correct(entry, entry.answers[0])
+
+
+@pytest.mark.parametrize('raw', [
+    {'1': mission(), 'x': mission()},
+    {'1': mission(), '٣': mission()},
+    {'1': mission(), '3': mission()},
+    {'1': mission(points='10')},
+    {'1': mission(duration='45m')},
+    {'1': mission(goal={'event': 'nothing', 'count': 1})},
+    {'1': mission(goal={'event': 'gtu_correct', 'count': 0})},
+])
+def test_bad_missions_are_corpus_errors(raw):
+    with pytest.raises(CorpusError):
+        compile_missions(raw)
+
+
+def test_missions_compile_read_only():
+    missions = compile_missions({'2': mission(name='Second'), '1': mission(goal={'event': 'gtu_correct', 'count': 10})})
+    assert sorted(missions) == ['1', '2'] and missions['2']['name'] == 'Second'
+    with pytest.raises(TypeError):
+        missions['1']['points'] = 20
+
+
+def test_bad_galaxies_and_sentences():
+    with pytest.raises(CorpusError):
+        compile_galaxies({'Andromeda': {'description': 'd', 'constellation': 'c', 'image': 'i', 'answers': []}})
+    with pytest.raises(CorpusError):
+        compile_sentences(['x' * 301])
+
+
+async def test_reload_keeps_the_last_good_corpus(tmp_path):
+    directory = os.path.join(tmp_path, 'information')
+    shutil.copytree(INFORMATION, directory)
+    library = TriviaLibrary(directory)
+    corpus = library.corpus
+    assert not await library.reload()
+
+    with open(os.path.join(directory, 'missions.json'), 'w', encoding='utf-8') as f:
+        json.dump({'one': mission()}, f)
+    assert not await library.reload(force=True)
+    assert library.corpus is corpus
+
+    shutil.copy(os.path.join(INFORMATION, 'missions.json'), directory)
+    assert await library.reload(force=True)
+    assert library.corpus is not corpus
@@ -0,0 +1,67 @@
+import os
+import random
+import asyncio
+import datetime
+
+from utils.database import Database
+from utils.typeracer import GLOBAL, Board, Leaderboards, RaceResult, elapsed, is_pasted, prompt, score
+
+SENTENCE = "The Sun holds more than ninety nine percent of all the mass in the solar system."
+
+
+def test_pasted_prompts_are_caught():
+    assert is_pasted(prompt(SENTENCE)) and not is_pasted(SENTENCE)
+    assert prompt(SENTENCE).replace('​', '') == SENTENCE
+
+
+def test_score_scales_speed_by_accuracy():
+    perfect = score(SENTENCE, SENTENCE, 20.0)
+    assert perfect.accuracy == 1.0 and perfect.wpm == round(len(SENTENCE) / 5 / (20 / 60), 1)
+    sloppy = score(SENTENCE, SENTENCE.replace('Sun', 'sun').replace('mass', 'mas'), 20.0)
+    assert sloppy.accuracy == round(1 - 2 / len(SENTENCE), 3) and sloppy.wpm < perfect.wpm
+    # extra whitespace is not a typo
+    assert score(SENTENCE, SENTENCE.replace(' ', '   '), 20.0).accuracy == 1.0
+
+
+def test_attempts_below_min_accuracy_score_nothing():
+    assert score(SENTENCE, 'x' * len(SENTENCE), 20.0) == RaceResult(0.0, 0.0, 20.0)
+    assert score(SENTENCE, 'a' * 100_000, 20.0) == RaceResult(0.0, 0.0, 20.0)
+    # half of it right passes at 0.4, not at the default 0.6
+    half = SENTENCE[:len(SENTENCE) // 2 + 4]
+    assert score(SENTENCE, half, 20.0).wpm == 0.0
+    assert score(SENTENCE, half, 20.0, min_accuracy=0.4).wpm > 0.0
+
+
+def test_elapsed_is_never_zero():
+    now = datetime.datetime.now(datetime.timezone.utc)
+    assert elapsed(now, now + datetime.timedelta(seconds=12)) == 12.0
+    assert elapsed(now, now) == 0.001
+
+
+def test_board_keeps_the_best_per_user():
+    board = Board(3)
+    for user_id, wpm in ((1, 50.0), (2, 60.0), (3, 70.0), (4, 40.0), (1, 80.0), (2, 55.0), (5, 65.0)):
+        board.offer(user_id, wpm, 0.99)
+    assert [(user_id, wpm) for user_id, wpm, _ in board.top(10)] == [(1, 80.0), (3, 70.0), (5, 65.0)]
+    # ties go to the lower id
+    tied = Board(1, [(7, 50.0, 1.0), (6, 50.0, 1.0)])
+    assert tied.top(1)[0][0] == 6
+
+
+async def test_boards_agree_with_the_database(tmp_path):
+    rng = random.Random(18)
+    async with Database({'users': os.path.join(tmp_path, 'users.db')}) as database:
+        leaderboards = Leaderboards(database, size=5)
+        await leaderboards.create_tables()
+        for guild_id in (1, 2):
+            await leaderboards.top(guild_id)
+        await leaderboards.top(GLOBAL)
+        await asyncio.gather(*(
+            leaderboards.record(rng.choice((1, 2, None)), rng.randrange(40), RaceResult(round(rng.uniform(20, 140), 1), 0.97, 30.0))
+            for _ in range(300)
+        ))
+        cold = Leaderboards(database, size=5, max_age=0)
+        for scope in (GLOBAL, 1, 2):
+            assert await leaderboards.top(scope) == await cold.top(scope)
+        best = (await leaderboards.top())[0]
+        assert await leaderboards.personal_best(best[0]) == best[1]
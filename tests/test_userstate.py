@@ -0,0 +1,47 @@
+import os
+import sqlite3
+
+from utils.database import Database
+from utils.userstate import UserState
+
+
+def legacy_layout(directory: str) -> dict:
+    # verified.db and story.db as the bot wrote them before users.db, story without the mission columns
+    paths = {'verified': os.path.join(directory, 'verified.db'), 'story': os.path.join(directory, 'story.db')}
+    with sqlite3.connect(paths['verified']) as conn:
+        conn.execute('CREATE TABLE verified (user_id INTEGER PRIMARY KEY)')
+        conn.executemany('INSERT INTO verified VALUES (?)', [(user_id,) for user_id in (11, 12, 13)])
+    with sqlite3.connect(paths['story']) as conn:
+        conn.execute('CREATE TABLE story (user_id INTEGER PRIMARY KEY, enabled INTEGER, progression INTEGER DEFAULT 0)')
+        conn.executemany('INSERT INTO story VALUES (?, ?, ?)', [(11, 1, 4), (12, 1, 0), (13, 0, 2)])
+    return paths
+
+
+async def test_legacy_databases_are_migrated_once(tmp_path):
+    legacy = legacy_layout(tmp_path)
+    async with Database({'users': os.path.join(tmp_path, 'users.db')}, readers=1) as database:
+        state = UserState(database)
+        await state.create_tables(legacy=legacy)
+        await state.load()
+        assert list(state.verified) == [11, 12, 13]
+        # progression 0 predates stories starting at 1, a disabled story is not loaded
+        assert state.progression == {11: 4, 12: 1}
+        async with database.reader('users').acquire() as conn:
+            async with conn.execute('SELECT user_id, mission_count, mission_started FROM story ORDER BY user_id') as cursor:
+                assert await cursor.fetchall() == [(11, 0, None), (12, 0, None), (13, 0, None)]
+        for path in legacy.values():
+            assert not os.path.exists(path) and os.path.exists(path + '.migrated')
+
+        # progress made since must survive the next startup
+        await state.set_progression(11, 5)
+        await state.create_tables(legacy=legacy)
+        again = UserState(database)
+        await again.load()
+        assert list(again.verified) == [11, 12, 13] and again.progression == {11: 5, 12: 1}
+        assert sorted(os.listdir(tmp_path)) == ['story.db.migrated', 'users.db', 'users.db-shm', 'users.db-wal', 'verified.db.migrated']
+
+        # an old file put back by hand fills gaps at most, it never rolls anyone back
+        legacy_layout(tmp_path)
+        await state.create_tables(legacy=legacy)
+        await again.load()
+        assert again.progression == {11: 5, 12: 1}
@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+from aiohttp import ClientResponseError, ClientSession, web
+
+from support import serve
+from utils.errors import UpstreamUnavailable
+from utils.web import CircuitBreaker, ResponseCache, WebClient
+
+
+def client(session: ClientSession, **kwargs) -> WebClient:
+    return WebClient(session, cache=ResponseCache(None), backoff=0.01, **kwargs)
+
+
+async def test_retries_until_the_host_answers():
+    statuses = [503, 503, 200]
+
+    async def flaky(request: web.Request) -> web.Response:
+        return web.Response(text='fact', status=statuses.pop(0))
+
+    async with serve({'/flaky': flaky}) as base, ClientSession() as session:
+        assert await client(session).get_text(f"{base}/flaky") == 'fact'
+    assert not statuses
+
+
+async def test_revalidates_with_the_etag():
+    seen = []
+
+    async def page(request: web.Request) -> web.Response:
+        seen.append(request.headers.get('If-None-Match'))
+        if request.headers.get('If-None-Match') == '"v1"':
+            return web.Response(status=304)
+        return web.Response(text='fact', headers={'ETag': '"v1"'})
+
+    async with serve({'/page': page}) as base, ClientSession() as session:
+        web_client = client(session)
+        assert await web_client.get_text(f"{base}/page") == 'fact'
+        assert await web_client.get_text(f"{base}/page") == 'fact'
+        # a fresh enough copy is served without asking at all
+        assert await web_client.get_text(f"{base}/page", max_age=60) == 'fact'
+    assert seen == [None, '"v1"']
+
+
+async def test_final_failure_is_upstream_unavailable():
+    status = 200
+
+    async def page(request: web.Request) -> web.Response:
+        return web.Response(text='fact', status=status)
+
+    async def missing(request: web.Request) -> web.Response:
+        return web.Response(status=404)
+
+    async with serve({'/page': page, '/missing': missing}) as base, ClientSession() as session:
+        web_client = client(session, retries=1)
+        await web_client.get_text(f"{base}/page")
+        status = 500
+        # a cached copy is served stale, without one the caller gets UpstreamUnavailable
+        assert await web_client.get_text(f"{base}/page") == 'fact'
+        with pytest.raises(UpstreamUnavailable) as raised:
+            await client(session, retries=1).get_text(f"{base}/page")
+        assert raised.value.host == '127.0.0.1' and isinstance(raised.value.__cause__, Exception)
+
+        # the host answering that the request is wrong is not an outage
+        with pytest.raises(ClientResponseError):
+            await web_client.get_text(f"{base}/missing")
+        assert web_client.get_breaker('127.0.0.1').failures == 0
+
+
+async def test_open_breaker_short_circuits():
+    requests = []
+
+    async def down(request: web.Request) -> web.Response:
+        requests.append(request.path)
+        return web.Response(status=503)
+
+    async with serve({'/down': down}) as base, ClientSession() as session:
+        web_client = client(session, retries=0, breaker_threshold=2)
+        for _ in range(2):
+            with pytest.raises(UpstreamUnavailable):
+                await web_client.get_text(f"{base}/down")
+        with pytest.raises(UpstreamUnavailable) as raised:
+            await web_client.get_text(f"{base}/down")
+    assert len(requests) == 2 and raised.value.retry_after > 0
+
+
+def test_breaker_lets_one_probe_through():
+    breaker = CircuitBreaker(threshold=1, reset_after=0)
+    breaker.record_failure()
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_success()
+    assert breaker.allow() and breaker.allow()
+
+
+async def test_cancelled_probe_frees_the_breaker():
+    async def slow(request: web.Request) -> web.Response:
+        await asyncio.sleep(0.5)
+        return web.Response(text='late')
+
+    async with serve({'/slow': slow}) as base, ClientSession() as session:
+        web_client = client(session)
+        breaker = web_client.get_breaker('127.0.0.1')
+        breaker.threshold, breaker.reset_after = 1, 0
+        breaker.record_failure()
+        probe = asyncio.create_task(web_client.get_text(f"{base}/slow"))
+        await asyncio.sleep(0.1)
+        assert not breaker.allow()
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert breaker.allow()
+
+
+async def test_get_bytes_reads_to_the_end():
+    body = bytes(range(256)) * (12 * 2**10)
+
+    async def chunked(request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse()
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        for start in range(0, len(body), 100_000):
+            await response.write(body[start:start + 100_000])
+            await asyncio.sleep(0)
+        await response.write_eof()
+        return response
+
+    async with serve({'/image.png': chunked}) as base, ClientSession() as session:
+        web_client = client(session)
+        assert await web_client.get_bytes(f"{base}/image.png") == body
+        with pytest.raises(ValueError):
+            await web_client.get_bytes(f"{base}/image.png", limit=2**20)
+        # too large is the file's fault, not the host's
+        assert web_client.get_breaker('127.0.0.1').failures == 0
@@ -0,0 +1,51 @@
+import os
+import asyncio
+import sqlite3
+
+import aiosqlite
+import pytest
+
+from utils.writer import WriteBehind
+
+INSERT = 'INSERT INTO verified (user_id) VALUES (?)'
+
+
+async def open_writer(path: str, **kwargs):
+    conn = await aiosqlite.connect(path)
+    await conn.execute('CREATE TABLE verified (user_id INTEGER PRIMARY KEY)')
+    writer = WriteBehind(conn, **kwargs)
+    await writer.start()
+    return conn, writer
+
+
+async def test_every_write_lands(tmp_path):
+    conn, writer = await open_writer(os.path.join(tmp_path, 'users.db'), max_batch=64)
+    await asyncio.gather(*(writer.execute(INSERT, (user_id,)) for user_id in range(1000)))
+    await writer.close()
+    async with conn.execute('SELECT COUNT(*) FROM verified') as cursor:
+        assert (await cursor.fetchone())[0] == 1000
+    async with conn.execute('PRAGMA journal_mode') as cursor:
+        assert (await cursor.fetchone())[0] == 'wal'
+    await conn.close()
+
+
+async def test_a_failing_write_does_not_sink_its_batch(tmp_path):
+    conn, writer = await open_writer(os.path.join(tmp_path, 'users.db'))
+    await writer.execute(INSERT, (1,))
+    results = await asyncio.gather(*(writer.execute(INSERT, (user_id,)) for user_id in (2, 1, 3)), return_exceptions=True)
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], sqlite3.IntegrityError)
+    await writer.close()
+    async with conn.execute('SELECT user_id FROM verified ORDER BY user_id') as cursor:
+        assert [row[0] for row in await cursor.fetchall()] == [1, 2, 3]
+    await conn.close()
+
+
+async def test_close_flushes_and_stops(tmp_path):
+    conn, writer = await open_writer(os.path.join(tmp_path, 'users.db'))
+    futures = [writer.submit(INSERT, (user_id,)) for user_id in range(10)]
+    await writer.close()
+    assert all(future.done() and future.exception() is None for future in futures)
+    with pytest.raises(RuntimeError):
+        writer.submit(INSERT, (11,))
+    await conn.close()
@@ -0,0 +1,202 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+from discord.ext import commands
+
+from .errors import CommandRejected
+from .feedback import RouteBudget
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+LOW = 0
+NORMAL = 1
+# a slash command has to be answered within 3s, it never waits for a slot longer than this
+INTERACTION_WAIT = 2.5
+
+
+# How much of the bot one kind of command may use: `limit` run at once and up to `queue` more
+# wait `max_wait` for a slot. Each user gets `user_rate` and each guild `guild_rate` of them per
+# `per` seconds. A class without a limit is only budgeted, its commands hold no slot
+@dataclass(frozen=True)
+class CommandClass:
+    name: str
+    limit: Optional[int]
+    queue: int = 0
+    max_wait: float = 5.0
+    user_rate: int = 10
+    guild_rate: int = 150
+    per: float = 30.0
+    priority: int = NORMAL
+
+
+DEFAULT_CLASSES = (
+    # facts come from the pool, an empty pool leaves every caller waiting on a scrape
+    CommandClass('scrape', limit=8, queue=32, user_rate=5, guild_rate=40, priority=LOW),
+    # a game keeps its slot until it ends, waiting for one only makes sense briefly
+    CommandClass('game', limit=500, queue=16, max_wait=2.0, user_rate=6, guild_rate=120, per=60.0),
+    # reads and writes that reach the user database
+    CommandClass('database', limit=32, queue=128),
+    # what an unverified user gets instead of their command, budgeted so nobody can farm them
+    CommandClass('prompt', limit=None, user_rate=2, guild_rate=30, per=60.0, priority=LOW),
+    CommandClass('default', limit=64, queue=256),
+)
+
+
+# Sits in the global check: every command is sorted into a class by its `admission` extra and has
+# to get past that class's budgets and take one of its slots before it runs. The slot is given back
+# when the command completes or fails. No guild may hold more than `guild_share` of a class's slots
+# and queue at once. With `overload_waiting` commands queued across all classes the bot is
+# overloaded, low priority commands are shed until the queues drain
+class AdmissionController:
+    def __init__(
+        self,
+        classes: Iterable[CommandClass] = DEFAULT_CLASSES,
+        *,
+        overload_waiting: int = 64,
+        guild_scale: float = 1.0,
+        guild_share: float = 0.5,
+        notify_every: float = 10.0,
+        keys: int = 10_000
+    ) -> None:
+        self.classes: Dict[str, CommandClass] = {command_class.name: command_class for command_class in classes}
+        self.overload_waiting = overload_waiting
+        self.notify_every = notify_every
+        self.keys = keys
+        self._users = {name: RouteBudget(spec.user_rate, spec.per, keys=keys) for name, spec in self.classes.items()}
+        # a scale of 0 turns guild budgets and shares off
+        self.guild_share = guild_share if guild_scale else None
+        self._guilds = {
+            name: RouteBudget(max(1, round(spec.guild_rate * guild_scale)), spec.per, keys=keys)
+            for name, spec in self.classes.items()
+        } if guild_scale else {}
+        self._slots = {name: asyncio.Semaphore(spec.limit) for name, spec in self.classes.items() if spec.limit}
+        self.running: Dict[str, int] = dict.fromkeys(self._slots, 0)
+        self.waiting: Dict[str, int] = dict.fromkeys(self._slots, 0)
+        # invocation (message or interaction id) -> class and guild of the slot it holds or waits for
+        self._held: Dict[int, Tuple[str, Optional[int]]] = {}
+        # (class, guild_id) -> commands of that guild running or waiting in that class
+        self._in_flight: Dict[Tuple[str, int], int] = {}
+        # user_id -> when they were last told about a rejection
+        self._told: OrderedDict[int, float] = OrderedDict()
+        for name in self._slots:
+            metrics.gauge(f'admission_running_{name}', lambda name=name: self.running[name])
+            metrics.gauge(f'admission_waiting_{name}', lambda name=name: self.waiting[name])
+        metrics.gauge('admission_overloaded', lambda: float(self.overloaded))
+
+    @classmethod
+    def from_env(cls) -> 'AdmissionController':
+        # the load test runs every synthetic user in one guild and turns guild budgets off
+        return cls(
+            overload_waiting=int(os.getenv('ADMISSION_OVERLOAD', '64')),
+            guild_scale=float(os.getenv('ADMISSION_GUILD_SCALE', '1'))
+        )
+
+    @property
+    def overloaded(self) -> bool:
+        return sum(self.waiting.values()) >= self.overload_waiting
+
+    @staticmethod
+    def key(ctx: commands.Context) -> int:
+        return ctx.interaction.id if ctx.interaction else ctx.message.id
+
+    def classify(self, ctx: commands.Context) -> CommandClass:
+        name = ctx.command.extras.get('admission', 'default') if ctx.command else 'default'
+        return self.classes.get(name, self.classes['default'])
+
+    def _reject(self, ctx: commands.Context, command_class: CommandClass, reason: str, retry_after: float) -> CommandRejected:
+        metrics.inc('admission_rejected_total', command_class=command_class.name, reason=reason)
+        # a user hammering a full queue is told once, answering every attempt would feed the overload
+        now = time.monotonic()
+        told = self._told.pop(ctx.author.id, None)
+        notify = told is None or now - told >= self.notify_every
+        self._told[ctx.author.id] = now if notify else told
+        while len(self._told) > self.keys:
+            self._told.popitem(last=False)
+        return CommandRejected(command_class.name, reason, retry_after, notify)
+
+    async def admit(self, ctx: commands.Context, name: Optional[str] = None) -> None:
+        key = self.key(ctx)
+        if key in self._held:
+            # the global check can run more than once for one invocation
+            return
+        command_class = self.classes[name] if name else self.classify(ctx)
+        users = self._users[command_class.name]
+        guilds = self._guilds.get(command_class.name) if ctx.guild else None
+        # budgets are only looked at here and spent once the command is let in, a command
+        # rejected for lack of capacity costs its user and guild nothing
+        retry_after = users.peek(ctx.author.id)
+        if retry_after:
+            raise self._reject(ctx, command_class, 'user_budget', retry_after)
+        if guilds is not None:
+            retry_after = guilds.peek(ctx.guild.id)
+            if retry_after:
+                raise self._reject(ctx, command_class, 'guild_budget', retry_after)
+        if command_class.priority == LOW and self.overloaded:
+            raise self._reject(ctx, command_class, 'shed', command_class.max_wait)
+
+        slots = self._slots.get(command_class.name)
+        guild_id = ctx.guild.id if ctx.guild and self.guild_share and slots else None
+        if guild_id is not None:
+            share = max(1, int((command_class.limit + command_class.queue) * self.guild_share))
+            if self._in_flight.get((command_class.name, guild_id), 0) >= share:
+                raise self._reject(ctx, command_class, 'guild_share', command_class.max_wait)
+        if slots is not None and slots.locked() and self.waiting[command_class.name] >= command_class.queue:
+            raise self._reject(ctx, command_class, 'queue_full', command_class.max_wait)
+
+        # nothing was awaited since the peeks, so both tokens are there
+        users.take(ctx.author.id)
+        if guilds is not None:
+            guilds.take(ctx.guild.id)
+        if slots is None:
+            metrics.inc('admission_admitted_total', command_class=command_class.name)
+            return
+
+        self._enter(command_class.name, guild_id)
+        if slots.locked():
+            max_wait = min(command_class.max_wait, INTERACTION_WAIT) if ctx.interaction else command_class.max_wait
+            self.waiting[command_class.name] += 1
+            try:
+                with metrics.timer('admission_wait_seconds', command_class=command_class.name):
+                    await asyncio.wait_for(slots.acquire(), max_wait)
+            except BaseException as error:
+                # timed out in the queue or cancelled, the command never ran
+                self._leave(command_class.name, guild_id)
+                users.refund(ctx.author.id)
+                if guilds is not None:
+                    guilds.refund(ctx.guild.id)
+                if isinstance(error, asyncio.TimeoutError):
+                    raise self._reject(ctx, command_class, 'timeout', max_wait) from None
+                raise
+            finally:
+                self.waiting[command_class.name] -= 1
+        else:
+            await slots.acquire()
+        self._held[key] = (command_class.name, guild_id)
+        self.running[command_class.name] += 1
+        metrics.inc('admission_admitted_total', command_class=command_class.name)
+
+    def _enter(self, name: str, guild_id: Optional[int]) -> None:
+        if guild_id is not None:
+            self._in_flight[(name, guild_id)] = self._in_flight.get((name, guild_id), 0) + 1
+
+    def _leave(self, name: str, guild_id: Optional[int]) -> None:
+        if guild_id is None:
+            return
+        left = self._in_flight.pop((name, guild_id)) - 1
+        if left:
+            self._in_flight[(name, guild_id)] = left
+
+    async def release(self, ctx: commands.Context, *args) -> None:
+        # on_command_completion and on_command_error, whichever ends the invocation
+        held = self._held.pop(self.key(ctx), None)
+        if held is not None:
+            name, guild_id = held
+            self._leave(name, guild_id)
+            self.running[name] -= 1
+            self._slots[name].release()
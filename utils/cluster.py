@@ -0,0 +1,227 @@
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import logging
+import argparse
+import subprocess
+import urllib.request
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+API_BASE = 'https://discord.com/api/v10'
+# Discord allows one IDENTIFY per rate limit bucket every 5 seconds
+IDENTIFY_INTERVAL = 5.0
+
+
+# Which shards one process runs. Shards are split into contiguous blocks, one per cluster
+@dataclass(frozen=True)
+class ClusterConfig:
+    cluster_id: int = 0
+    cluster_count: int = 1
+    # None lets Discord pick the count, only possible when a single process runs every shard
+    shard_count: Optional[int] = None
+    max_concurrency: int = 1
+    # wall-clock time the launcher started, every cluster schedules its identifies from it
+    launched_at: Optional[float] = None
+
+    def __post_init__(self) -> None:
+        if not 0 <= self.cluster_id < self.cluster_count:
+            raise ValueError(f"cluster {self.cluster_id} is out of range for {self.cluster_count} clusters")
+        if self.shard_count is None and self.cluster_count > 1:
+            raise ValueError("a shard count is required to split shards across clusters")
+        if self.shard_count is not None and self.shard_count < self.cluster_count:
+            raise ValueError(f"{self.shard_count} shards cannot fill {self.cluster_count} clusters")
+
+    @property
+    def multiprocess(self) -> bool:
+        return self.cluster_count > 1
+
+    @property
+    def shard_ids(self) -> Optional[List[int]]:
+        if self.shard_count is None:
+            return None
+        per, extra = divmod(self.shard_count, self.cluster_count)
+        start = self.cluster_id * per + min(self.cluster_id, extra)
+        return list(range(start, start + per + (self.cluster_id < extra)))
+
+    def identify_at(self, shard_id: int) -> Optional[float]:
+        # shard_id % max_concurrency is the rate limit bucket, each bucket takes its shards in order,
+        # so clusters never need to talk to each other to stay under the identify limit
+        if self.launched_at is None:
+            return None
+        return self.launched_at + IDENTIFY_INTERVAL * (shard_id // self.max_concurrency)
+
+    def local_path(self, path: str) -> str:
+        # files each process writes on its own, discord.log becomes discord.1.log in cluster 1
+        if not self.multiprocess:
+            return path
+        root, extension = os.path.splitext(path)
+        return f"{root}.{self.cluster_id}{extension}"
+
+    def to_env(self) -> Dict[str, str]:
+        env = {
+            'SHARDS': str(self.shard_count) if self.shard_count is not None else 'auto',
+            'CLUSTER_ID': str(self.cluster_id),
+            'CLUSTER_COUNT': str(self.cluster_count),
+            'MAX_CONCURRENCY': str(self.max_concurrency),
+        }
+        if self.launched_at is not None:
+            env['CLUSTER_LAUNCHED_AT'] = repr(self.launched_at)
+        return env
+
+    @classmethod
+    def from_env(cls) -> Optional['ClusterConfig']:
+        # unset SHARDS keeps the plain single-connection bot
+        shards = os.getenv('SHARDS')
+        if not shards:
+            return None
+        launched_at = os.getenv('CLUSTER_LAUNCHED_AT')
+        return cls(
+            cluster_id=int(os.getenv('CLUSTER_ID', 0)),
+            cluster_count=int(os.getenv('CLUSTER_COUNT', 1)),
+            shard_count=None if shards == 'auto' else int(shards),
+            max_concurrency=int(os.getenv('MAX_CONCURRENCY', 1)),
+            launched_at=float(launched_at) if launched_at else None
+        )
+
+
+def use_endpoints(api: Optional[str] = None, gateway: Optional[str] = None) -> None:
+    # points discord.py at another REST base and gateway, e.g. the StandInGateway in tests/support.py
+    import yarl
+    from discord.gateway import DiscordWebSocket
+    from discord.http import Route
+
+    if api:
+        Route.BASE = api
+    if gateway:
+        DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(gateway)
+
+
+def fetch_gateway(token: str, api: str = API_BASE) -> Tuple[int, int]:
+    # Discord's recommended shard count and the identify concurrency for this bot
+    request = urllib.request.Request(f"{api}/gateway/bot", headers={
+        'Authorization': f"Bot {token}",
+        'User-Agent': 'SpaceBot cluster launcher'
+    })
+    with urllib.request.urlopen(request, timeout=10) as response:
+        data = json.load(response)
+    return data['shards'], data['session_start_limit']['max_concurrency']
+
+
+# Runs one worker process per cluster and restarts the ones that crash. Workers are started
+# in their own session so a Ctrl+C reaches them once, through the launcher
+class Launcher:
+    def __init__(
+        self,
+        script: str = 'main.py',
+        *,
+        clusters: int,
+        shards: int,
+        max_concurrency: int = 1,
+        env: Optional[Dict[str, str]] = None,
+        cwd: Optional[str] = None,
+        restart_after: float = 5.0
+    ) -> None:
+        self.script = script
+        self.clusters = clusters
+        self.shards = shards
+        self.max_concurrency = max_concurrency
+        self.env = env or {}
+        self.cwd = cwd
+        self.restart_after = restart_after
+        self.workers: Dict[int, subprocess.Popen] = {}
+        self.restarts = 0
+        # cluster_id -> monotonic time its exited process is due to be restarted
+        self._restart_at: Dict[int, float] = {}
+        self._stopping = False
+
+    def configs(self, launched_at: Optional[float] = None) -> List[ClusterConfig]:
+        return [
+            ClusterConfig(cluster_id, self.clusters, self.shards, self.max_concurrency, launched_at)
+            for cluster_id in range(self.clusters)
+        ]
+
+    def spawn(self, config: ClusterConfig) -> subprocess.Popen:
+        env = {**os.environ, **self.env, **config.to_env()}
+        process = subprocess.Popen([sys.executable, self.script], env=env, cwd=self.cwd, start_new_session=True)
+        logger.info("Cluster %s started as pid %s with shards %s", config.cluster_id, process.pid, config.shard_ids)
+        self.workers[config.cluster_id] = process
+        return process
+
+    def start(self) -> None:
+        for config in self.configs(time.time()):
+            self.spawn(config)
+
+    def poll(self) -> None:
+        # an exited cluster is restarted on a later poll once its delay is up, the others stay watched meanwhile
+        now = time.monotonic()
+        for cluster_id, process in list(self.workers.items()):
+            if self._stopping or cluster_id in self._restart_at or process.poll() is None:
+                continue
+            logger.warning("Cluster %s exited with %s, restarting in %ss", cluster_id, process.returncode, self.restart_after)
+            self._restart_at[cluster_id] = now + self.restart_after
+        for cluster_id, restart_at in list(self._restart_at.items()):
+            if self._stopping or now < restart_at:
+                continue
+            del self._restart_at[cluster_id]
+            self.restarts += 1
+            config = self.configs()[cluster_id]
+            # shifts the schedule so the restarted cluster's first shard identifies right away
+            offset = IDENTIFY_INTERVAL * (config.shard_ids[0] // self.max_concurrency)
+            self.spawn(replace(config, launched_at=time.time() - offset))
+
+    def stop(self, timeout: float = 30.0) -> None:
+        self._stopping = True
+        for process in self.workers.values():
+            if process.poll() is None:
+                process.send_signal(signal.SIGINT)
+        deadline = time.monotonic() + timeout
+        for process in self.workers.values():
+            try:
+                process.wait(max(deadline - time.monotonic(), 0))
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+    def run(self) -> None:
+        def request_stop(*args) -> None:
+            self._stopping = True
+
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGTERM, request_stop)
+        self.start()
+        try:
+            while not self._stopping:
+                self.poll()
+                time.sleep(1)
+        finally:
+            self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog='python -m utils.cluster')
+    commands = parser.add_subparsers(dest='command')
+    launch = commands.add_parser('launch', help="run the bot as several worker processes")
+    launch.add_argument('--clusters', type=int, default=os.cpu_count() or 1)
+    launch.add_argument('--shards', default='auto', help="shard count, or auto for Discord's recommendation")
+    launch.add_argument('--script', default='main.py')
+    arguments = parser.parse_args()
+
+    if arguments.command != 'launch':
+        return parser.print_help()
+
+    from dotenv import load_dotenv
+
+    load_dotenv('.env')
+    logging.basicConfig(level=logging.INFO, format='LEVEL [%(levelname)s] at (%(asctime)s): %(name)s: %(message)s')
+    recommended, max_concurrency = fetch_gateway(os.environ['TOKEN'], os.getenv('DISCORD_API_BASE', API_BASE))
+    shards = recommended if arguments.shards == 'auto' else int(arguments.shards)
+    Launcher(arguments.script, clusters=min(arguments.clusters, shards), shards=shards, max_concurrency=max_concurrency).run()
+
+if __name__ == "__main__":
+    main()
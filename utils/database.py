@@ -0,0 +1,132 @@
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterable, List, Mapping, Optional, Sequence
+
+import aiosqlite
+
+from .metrics import metrics
+from .writer import WriteBehind
+
+# sqlite3 keeps an LRU of prepared statements per connection keyed by the SQL text,
+# every query here uses bound parameters so the same handful of statements is reused
+STATEMENT_CACHE_SIZE = 256
+
+
+# Read-only connections to one database file, handed out one caller at a time
+class ReaderPool:
+    def __init__(self, path: str, size: int) -> None:
+        self.path = path
+        self.size = size
+        self._idle: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+        self._connections: List[aiosqlite.Connection] = []
+        self.acquisitions = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def in_use(self) -> int:
+        return len(self._connections) - self._idle.qsize()
+
+    async def open(self) -> None:
+        uri = f"file:{os.path.abspath(self.path)}?mode=ro"
+        for _ in range(self.size):
+            conn = await aiosqlite.connect(uri, uri=True, cached_statements=STATEMENT_CACHE_SIZE)
+            self._connections.append(conn)
+            self._idle.put_nowait(conn)
+
+    async def close(self) -> None:
+        for conn in self._connections:
+            await conn.close()
+        self._connections.clear()
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[aiosqlite.Connection]:
+        start = time.perf_counter()
+        conn = await self._idle.get()
+        waited = time.perf_counter() - start
+        self.acquisitions += 1
+        self.wait_time += waited
+        self.max_wait = max(self.max_wait, waited)
+        metrics.observe('sqlite_pool_wait_seconds', waited)
+        try:
+            yield conn
+        finally:
+            self._idle.put_nowait(conn)
+
+    async def fetchone(self, statement: str, parameters: Sequence[Any] = ()) -> Optional[aiosqlite.Row]:
+        with metrics.phase('sqlite'):
+            return await self._fetchone(statement, parameters)
+
+    async def fetchall(self, statement: str, parameters: Sequence[Any] = ()) -> Iterable[aiosqlite.Row]:
+        with metrics.phase('sqlite'):
+            return await self._fetchall(statement, parameters)
+
+    async def _fetchone(self, statement: str, parameters: Sequence[Any]) -> Optional[aiosqlite.Row]:
+        async with self.acquire() as conn:
+            async with conn.execute(statement, parameters) as cursor:
+                return await cursor.fetchone()
+
+    async def _fetchall(self, statement: str, parameters: Sequence[Any]) -> Iterable[aiosqlite.Row]:
+        async with self.acquire() as conn:
+            async with conn.execute(statement, parameters) as cursor:
+                return await cursor.fetchall()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'size': self.size,
+            'in_use': self.in_use,
+            'acquisitions': self.acquisitions,
+            'avg_wait_ms': self.wait_time / self.acquisitions * 1e3 if self.acquisitions else 0.0,
+            'max_wait_ms': self.max_wait * 1e3,
+        }
+
+
+# Holds the bot's opened databases: one writer connection (behind a group-commit queue)
+# and a pool of read-only connections per file, all in WAL mode so reads never wait on writes
+class Database:
+    def __init__(self, paths: Mapping[str, str], *, readers: int = 4) -> None:
+        self.paths = dict(paths)
+        self.readers = readers
+        self._conn: Dict[str, aiosqlite.Connection] = {}
+        self._writers: Dict[str, WriteBehind] = {}
+        self._readers: Dict[str, ReaderPool] = {}
+
+    def __getitem__(self, name: str) -> Optional[aiosqlite.Connection]:
+        return self._conn.get(name)
+
+    def writer(self, name: str) -> Optional[WriteBehind]:
+        return self._writers.get(name)
+
+    def reader(self, name: str) -> Optional[ReaderPool]:
+        return self._readers.get(name)
+
+    async def start(self) -> None:
+        for name, path in self.paths.items():
+            conn = await aiosqlite.connect(path, cached_statements=STATEMENT_CACHE_SIZE)
+            self._conn[name] = conn
+            self._writers[name] = writer = WriteBehind(conn)
+            # switches the file to WAL before any reader opens it
+            await writer.start()
+            self._readers[name] = pool = ReaderPool(path, self.readers)
+            await pool.open()
+
+    async def close(self) -> None:
+        for name in list(self._conn):
+            await self._writers.pop(name).close()
+            await self._readers.pop(name).close()
+            await self._conn.pop(name).close()
+
+    async def __aenter__(self) -> 'Database':
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            name: {**pool.stats(), 'write_queue': self._writers[name].pending}
+            for name, pool in self._readers.items()
+        }
@@ -1,8 +1,26 @@
-from discord.ext.commands import CheckFailure
+from discord.ext.commands import CheckFailure, CommandError
 
 class SpaceCheckFailure(CheckFailure):
     pass
 
 class UserNotVerified(SpaceCheckFailure):
     def __init__(self, member) -> None:
-        self.member = member
\ No newline at end of file
+        self.member = member
+
+class UpstreamUnavailable(Exception):
+    def __init__(self, host: str, retry_after: float) -> None:
+        self.host = host
+        self.retry_after = retry_after
+        super().__init__(f"{host} is unavailable, retry in {retry_after:.0f}s")
+
+class SessionUnavailable(CommandError):
+    pass
+
+class CommandRejected(SpaceCheckFailure):
+    def __init__(self, command_class: str, reason: str, retry_after: float, notify: bool = True) -> None:
+        self.command_class = command_class
+        self.reason = reason
+        self.retry_after = retry_after
+        # whether the user still needs telling, repeats are dropped without a reply
+        self.notify = notify
+        super().__init__(f"{command_class} command rejected: {reason}")
@@ -0,0 +1,83 @@
+import time
+import random
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# Bounded pool of pre-scraped facts, refilled in the background so commands never wait on the network
+class FactPool:
+    def __init__(self, fetch: Callable[[], Awaitable[str]], *, size: int = 32, ttl: float = 3600.0) -> None:
+        self._fetch = fetch
+        self.size = size
+        self.ttl = ttl
+        # insertion order doubles as age order, oldest facts sit at the front
+        self._facts: OrderedDict[str, float] = OrderedDict()
+        self._inflight: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        self._prune()
+        return len(self._facts)
+
+    @property
+    def full(self) -> bool:
+        return len(self) >= self.size
+
+    def _prune(self) -> None:
+        deadline = time.monotonic() - self.ttl
+        while self._facts:
+            fact, fetched_at = next(iter(self._facts.items()))
+            if fetched_at > deadline:
+                break
+            del self._facts[fact]
+
+    def add(self, fact: str) -> bool:
+        fact = fact.strip()
+        if not fact or fact in self._facts:
+            return False
+        self._facts[fact] = time.monotonic()
+        while len(self._facts) > self.size:
+            self._facts.popitem(last=False)
+        return True
+
+    def get(self) -> Optional[str]:
+        self._prune()
+        if not self._facts:
+            return None
+        return random.choice(tuple(self._facts))
+
+    async def _fetch_and_add(self) -> str:
+        fact = await self._fetch()
+        self.add(fact)
+        return fact
+
+    async def fetch(self) -> str:
+        # concurrent callers share the request that is already in flight
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.create_task(self._fetch_and_add())
+        return await asyncio.shield(self._inflight)
+
+    async def refill(self, attempts: Optional[int] = None) -> int:
+        attempts = attempts or self.size
+        added = 0
+        for _ in range(attempts):
+            if self.full:
+                break
+            before = len(self._facts)
+            try:
+                await self.fetch()
+            except Exception as error:
+                logger.warning("Failed to refill the fact pool: %s", error)
+                break
+            added += len(self._facts) - before
+        return added
+
+    async def get_or_fetch(self) -> str:
+        fact = self.get()
+        metrics.inc('fact_pool_total', result='hit' if fact else 'miss')
+        return fact or await self.fetch()
@@ -0,0 +1,121 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional, Tuple
+
+import discord
+from discord.ext import commands
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# An in-process copy of Discord's per-channel message budget (5 creates or edits per 5s).
+# Callers reserve a token and wait out the returned delay, so the bot queues behind its own
+# budget instead of finding the limit through 429s that also hold up every other command there
+class RouteBudget:
+    def __init__(self, rate: int = 5, per: float = 5.0, *, keys: int = 10_000) -> None:
+        self.rate = rate
+        self.per = per
+        self.keys = keys
+        # key -> (tokens, updated), tokens go negative while callers are queued
+        self._buckets: OrderedDict[Hashable, Tuple[float, float]] = OrderedDict()
+
+    def _refill(self, key: Hashable, now: float) -> float:
+        tokens, updated = self._buckets.pop(key, (self.rate, now))
+        return min(self.rate, tokens + (now - updated) * self.rate / self.per)
+
+    def _store(self, key: Hashable, tokens: float, now: float) -> None:
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.keys:
+            self._buckets.popitem(last=False)
+
+    def reserve(self, key: Hashable) -> float:
+        # takes a token and returns how long to wait before spending it
+        now = time.monotonic()
+        tokens = self._refill(key, now) - 1
+        self._store(key, tokens, now)
+        return 0.0 if tokens >= 0 else -tokens * self.per / self.rate
+
+    def peek(self, key: Hashable) -> float:
+        # what take() would return, without taking anything
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (self.rate, now))
+        tokens = min(self.rate, tokens + (now - updated) * self.rate / self.per)
+        return 0.0 if tokens >= 1 else (1 - tokens) * self.per / self.rate
+
+    def refund(self, key: Hashable) -> None:
+        # gives back a token that was taken for something that never happened
+        now = time.monotonic()
+        self._store(key, min(self.rate, self._refill(key, now) + 1), now)
+
+    def take(self, key: Hashable) -> float:
+        # takes a token only if one is there: 0.0 when it was, otherwise how long until one is
+        now = time.monotonic()
+        tokens = self._refill(key, now)
+        if tokens < 1:
+            self._store(key, tokens, now)
+            return (1 - tokens) * self.per / self.rate
+        self._store(key, tokens - 1, now)
+        return 0.0
+
+
+# One status message per game that keeps count of repeated feedback. The first bump sends it,
+# later bumps fold into a single edit at most once per `window`, so a game costs at most one
+# REST call per window however fast its player types
+class CoalescedStatus:
+    def __init__(
+        self,
+        ctx: commands.Context,
+        budget: RouteBudget,
+        render: Callable[[int], str],
+        *,
+        window: float = 1.0
+    ) -> None:
+        self.ctx = ctx
+        self.budget = budget
+        self.render = render
+        self.window = window
+        self.count = 0
+        self.shown = 0
+        self.calls = 0
+        self.message: Optional[discord.Message] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __enter__(self) -> 'CoalescedStatus':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def bump(self) -> None:
+        self.count += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._update())
+        else:
+            metrics.inc('feedback_coalesced_total')
+
+    def close(self) -> None:
+        # whatever is still pending is superseded by the game's last message
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _update(self) -> None:
+        try:
+            while self.shown < self.count:
+                await asyncio.sleep(self.budget.reserve(self.ctx.channel.id))
+                shown = self.count
+                if self.message is None:
+                    self.message = await self.ctx.send(self.render(shown), ephemeral=True)
+                else:
+                    await self.message.edit(content=self.render(shown))
+                self.shown = shown
+                self.calls += 1
+                metrics.inc('feedback_rest_calls_total')
+                # bumps during the window are picked up by the next pass, as one edit
+                await asyncio.sleep(self.window)
+        except discord.HTTPException as error:
+            # feedback is a nicety, the game carries on without it
+            logger.warning("Could not update game feedback in %s: %s", self.ctx.channel.id, error)
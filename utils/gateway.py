@@ -0,0 +1,120 @@
+import os
+import inspect
+import importlib
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional
+
+import discord
+from discord.ext import commands
+
+
+# What one cog needs from the gateway, declared as a `gateway` class attribute next to `hidden`.
+# Anything not declared is left off in the lean profile
+@dataclass(frozen=True)
+class GatewayNeeds:
+    # discord.Intents flag names
+    intents: FrozenSet[str] = frozenset()
+    # discord.MemberCacheFlags names, e.g. 'joined' for cogs that look members up in the cache
+    member_cache: FrozenSet[str] = frozenset()
+    chunk_guilds: bool = False
+    # how many recent messages the cog needs cached, for edit/delete/reaction events on them
+    messages: int = 0
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, 'intents', frozenset(self.intents))
+        object.__setattr__(self, 'member_cache', frozenset(self.member_cache))
+
+    def __or__(self, other: 'GatewayNeeds') -> 'GatewayNeeds':
+        return GatewayNeeds(
+            self.intents | other.intents,
+            self.member_cache | other.member_cache,
+            self.chunk_guilds or other.chunk_guilds,
+            max(self.messages, other.messages)
+        )
+
+
+# the bot itself: the guild cache and prefix commands
+CORE = GatewayNeeds(intents={'guilds', 'guild_messages', 'dm_messages', 'message_content'})
+
+
+def declared_needs(cogs: Iterable[Any]) -> GatewayNeeds:
+    # works on cog classes and instances alike
+    needs = CORE
+    for cog in cogs:
+        needs |= getattr(cog, 'gateway', GatewayNeeds())
+    return needs
+
+
+def cog_classes(directory: str = './cogs', package: str = 'cogs') -> List[type]:
+    # the cogs' declarations are needed before the bot exists, load_extension runs the modules again later
+    classes = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.py'):
+            continue
+        module = importlib.import_module(f'{package}.{filename[:-3]}')
+        classes.extend(
+            value for value in vars(module).values()
+            if inspect.isclass(value) and issubclass(value, commands.Cog) and value.__module__ == module.__name__
+        )
+    return classes
+
+
+# Gateway and cache settings the bot is constructed with
+@dataclass(frozen=True)
+class GatewayProfile:
+    name: str
+    intents: discord.Intents
+    member_cache_flags: discord.MemberCacheFlags
+    chunk_guilds_at_startup: bool
+    max_messages: Optional[int] = None
+
+    @classmethod
+    def full(cls) -> 'GatewayProfile':
+        # what the bot always ran with, every member and presence cached
+        intents = discord.Intents(
+            guilds=True,
+            members=True,
+            emojis=True,
+            messages=True,
+            guild_messages=True,
+            dm_messages=True,
+            message_content=True,
+            presences=True
+        )
+        return cls('full', intents, discord.MemberCacheFlags.from_intents(intents), True, 1000)
+
+    @classmethod
+    def lean(cls, needs: GatewayNeeds) -> 'GatewayProfile':
+        intents = discord.Intents(**dict.fromkeys(needs.intents, True))
+        if needs.chunk_guilds and not intents.members:
+            raise ValueError("Chunking guilds needs the members intent")
+        flags = discord.MemberCacheFlags.none()
+        for name in needs.member_cache:
+            setattr(flags, name, True)
+        return cls('lean', intents, flags, needs.chunk_guilds, needs.messages or None)
+
+    @classmethod
+    def select(cls, name: str, cogs: Optional[Iterable[Any]] = None) -> 'GatewayProfile':
+        match name:
+            case 'full':
+                return cls.full()
+            case 'lean':
+                return cls.lean(declared_needs(cog_classes() if cogs is None else cogs))
+            case _:
+                raise ValueError(f"Unknown GATEWAY_PROFILE: {name!r}")
+
+    def options(self) -> Dict[str, Any]:
+        return {
+            'intents': self.intents,
+            'member_cache_flags': self.member_cache_flags,
+            'chunk_guilds_at_startup': self.chunk_guilds_at_startup,
+            'max_messages': self.max_messages,
+        }
+
+    def describe(self) -> str:
+        intents = ', '.join(name for name, enabled in self.intents if enabled)
+        members = ', '.join(name for name, enabled in self.member_cache_flags if enabled) or 'none'
+        return (
+            f"{self.name} gateway profile: intents [{intents}], member cache [{members}], "
+            f"chunking {'on' if self.chunk_guilds_at_startup else 'off'}, message cache {self.max_messages or 'off'}"
+        )
@@ -0,0 +1,226 @@
+import io
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import Executor
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+import discord
+from yarl import URL
+
+from .web import WebClient
+
+try:
+    from PIL import Image
+except ImportError:
+    # without Pillow images are cached at the size their host serves them
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+SIGNATURES = {b'\x89PNG\r\n\x1a\n': 'png', b'\xff\xd8\xff': 'jpg', b'GIF87a': 'gif', b'GIF89a': 'gif'}
+
+
+def sniff(data: bytes) -> Optional[str]:
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    for signature, kind in SIGNATURES.items():
+        if data.startswith(signature):
+            return kind
+    return None
+
+
+def downscale(data: bytes, max_side: int) -> Tuple[bytes, str]:
+    # runs in the bot's executor, a module level function so a process pool can run it too
+    kind = sniff(data)
+    if kind is None:
+        raise ValueError("Not a PNG, JPEG, GIF or WebP image")
+    # GIFs may be animated, they are kept whole
+    if Image is None or kind == 'gif':
+        return data, kind
+    with Image.open(io.BytesIO(data)) as image:
+        if max(image.size) <= max_side:
+            return data, kind
+        image.thumbnail((max_side, max_side))
+        output = io.BytesIO()
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image.save(output, 'PNG', optimize=True)
+            return output.getvalue(), 'png'
+        image.convert('RGB').save(output, 'JPEG', quality=85, optimize=True)
+        return output.getvalue(), 'jpg'
+
+
+# Where corpus images come from. The bot fetches over HTTP, tests and offline runs read files
+class ImageSource(ABC):
+    @abstractmethod
+    async def fetch(self, url: str) -> bytes:
+        ...
+
+
+class HttpImageSource(ImageSource):
+    def __init__(self, web: WebClient) -> None:
+        self.web = web
+
+    async def fetch(self, url: str) -> bytes:
+        return await self.web.get_bytes(url)
+
+
+# Serves an image URL from directory/<last segment of the URL path>
+class FileImageSource(ImageSource):
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def path(self, url: str) -> str:
+        return os.path.join(self.directory, os.path.basename(URL(url).path))
+
+    async def fetch(self, url: str) -> bytes:
+        def read() -> bytes:
+            with open(self.path(url), 'rb') as f:
+                return f.read()
+        return await asyncio.to_thread(read)
+
+
+# One stored image, named after the hash of its (downscaled) content
+@dataclass(slots=True)
+class CachedImage:
+    digest: str
+    filename: str
+    # Discord's CDN URL for an upload of this file, reused until it expires
+    attachment: Optional[str] = None
+
+    def reusable(self, margin: float = 3600.0) -> bool:
+        if not self.attachment:
+            return False
+        # signed CDN links carry their expiry as hex unix time in `ex`
+        expires = URL(self.attachment).query.get('ex')
+        try:
+            return expires is None or int(expires, 16) - margin > time.time()
+        except ValueError:
+            return False
+
+
+# Corpus images fetched once, downscaled onto disk and indexed by content hash. Whichever game
+# shows an image first uploads it, every later round points its embed at that upload, so a
+# repeat costs neither a fetch nor an upload. URLs serving identical images share both
+class ImageCache:
+    def __init__(
+        self,
+        source: ImageSource,
+        directory: str = './database/images',
+        *,
+        index: str = 'index.json',
+        max_side: int = 512,
+        executor: Optional[Executor] = None
+    ) -> None:
+        self.source = source
+        self.directory = directory
+        self.index_path = os.path.join(directory, index)
+        self.max_side = max_side
+        self.executor = executor
+        # source URL -> digest, digest -> image
+        self._urls: Dict[str, str] = {}
+        self._images: Dict[str, CachedImage] = {}
+        self._pending: Dict[str, asyncio.Task] = {}
+        self.fetched_bytes = 0
+        self.uploads = 0
+        self.reuses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._images)
+
+    def _read_index(self) -> None:
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+            images = {digest: CachedImage(**image) for digest, image in raw['images'].items()}
+            urls = dict(raw['urls'])
+        except (OSError, ValueError, TypeError, KeyError):
+            return
+        # an index entry without its file is fetched again
+        self._images = {digest: image for digest, image in images.items() if os.path.exists(self.path(image))}
+        self._urls = {url: digest for url, digest in urls.items() if digest in self._images}
+
+    def _write_index(self, raw: Dict) -> None:
+        with open(self.index_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(raw, f)
+        os.replace(self.index_path + '.tmp', self.index_path)
+
+    def _write_file(self, filename: str, data: bytes) -> None:
+        path = os.path.join(self.directory, filename)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+
+    async def load(self) -> None:
+        await asyncio.to_thread(self._read_index)
+
+    async def save(self) -> None:
+        raw = {'urls': dict(self._urls), 'images': {digest: asdict(image) for digest, image in self._images.items()}}
+        await asyncio.to_thread(self._write_index, raw)
+
+    def path(self, image: CachedImage) -> str:
+        return os.path.join(self.directory, image.filename)
+
+    async def get(self, url: str) -> Optional[CachedImage]:
+        # None when the image can't be had, the caller falls back to hot-linking the URL
+        digest = self._urls.get(url)
+        if digest is not None:
+            return self._images[digest]
+        task = self._pending.get(url)
+        if task is None:
+            # games starting on the same image at once share one fetch
+            task = self._pending[url] = asyncio.create_task(self._fetch(url))
+            task.add_done_callback(lambda _: self._pending.pop(url, None))
+        try:
+            return await asyncio.shield(task)
+        except Exception as error:
+            logger.warning("Could not cache image %s: %r", url, error)
+            return None
+
+    async def _fetch(self, url: str) -> CachedImage:
+        data = await self.source.fetch(url)
+        self.fetched_bytes += len(data)
+        data, kind = await asyncio.get_running_loop().run_in_executor(self.executor, downscale, data, self.max_side)
+        digest = hashlib.sha256(data).hexdigest()
+        image = self._images.get(digest)
+        if image is None:
+            image = CachedImage(digest, f"{digest[:32]}.{kind}")
+            await asyncio.to_thread(self._write_file, image.filename, data)
+            self._images[digest] = image
+        self._urls[url] = digest
+        await self.save()
+        return image
+
+    async def warm(self, urls: Iterable[str], concurrency: int = 4) -> int:
+        # fetches whatever isn't on disk yet, returns how many were
+        limit = asyncio.Semaphore(concurrency)
+
+        async def fetch(url: str) -> bool:
+            async with limit:
+                return await self.get(url) is not None
+
+        missing = [url for url in dict.fromkeys(urls) if url not in self._urls]
+        return sum(await asyncio.gather(*(fetch(url) for url in missing)))
+
+    def attach(self, embed: discord.Embed, image: CachedImage) -> Optional[discord.File]:
+        # points the embed at the earlier upload, or at a new attachment the caller sends along
+        if image.reusable():
+            self.reuses += 1
+            embed.set_image(url=image.attachment)
+            return None
+        embed.set_image(url=f"attachment://{image.filename}")
+        return discord.File(self.path(image), filename=image.filename)
+
+    async def uploaded(self, image: CachedImage, message: discord.Message) -> None:
+        for attachment in message.attachments:
+            if attachment.filename == image.filename:
+                self.uploads += 1
+                image.attachment = attachment.url
+                await self.save()
+                return
@@ -0,0 +1,126 @@
+import time
+import queue
+import logging
+import logging.handlers
+from typing import Dict, Optional, Tuple
+
+FORMAT = 'LEVEL [%(levelname)s] at (%(asctime)s): %(name)s: %(message)s'
+
+
+# Hands records to a background thread through a bounded queue. The calling thread never
+# formats or touches the disk, and when the queue is full the record is dropped and counted
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, maxsize: int = 10_000) -> None:
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+        self._unreported = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the queue never leaves the process, so formatting can wait for the listener thread
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            if self._unreported:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    'name': __name__,
+                    'levelno': logging.WARNING,
+                    'levelname': 'WARNING',
+                    'msg': f"Dropped {self._unreported} log records, the log writer fell behind",
+                }))
+                self._unreported = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self._unreported += 1
+
+
+# Lets at most `burst` records per logger and level through every `per` seconds, below WARNING.
+# What was held back is summed up in the first record of the next window
+class RateLimitFilter(logging.Filter):
+    def __init__(self, burst: int = 50, per: float = 1.0) -> None:
+        super().__init__()
+        self.burst = burst
+        self.per = per
+        self.suppressed = 0
+        self._windows: Dict[Tuple[str, int], Tuple[float, int, int]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.levelno)
+        now = time.monotonic()
+        started, count, held = self._windows.get(key, (now, 0, 0))
+        if now - started >= self.per:
+            if held:
+                record.msg = f"{record.msg} ({held} similar records suppressed)"
+            started, count, held = now, 0, 0
+        if count >= self.burst:
+            self._windows[key] = (started, count, held + 1)
+            self.suppressed += 1
+            return False
+        self._windows[key] = (started, count + 1, held)
+        return True
+
+
+# The bounded queue may be full when stopping, so the stop marker waits for room instead of failing
+class QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+
+class LogRuntime:
+    def __init__(self, logger: logging.Logger, handler: DroppingQueueHandler, listener: QueueListener, limiter: RateLimitFilter) -> None:
+        self.logger = logger
+        self.handler = handler
+        self.listener = listener
+        self.limiter = limiter
+        self._stopped = False
+
+    @property
+    def dropped(self) -> int:
+        return self.handler.dropped
+
+    @property
+    def suppressed(self) -> int:
+        return self.limiter.suppressed
+
+    @property
+    def stopped(self) -> bool:
+        return self._stopped
+
+    def stop(self) -> None:
+        # drains what is queued, then joins the writer thread, close() may run more than once
+        if not self._stopped:
+            self._stopped = True
+            self.logger.removeHandler(self.handler)
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+
+
+def setup_logging(
+    logger: logging.Logger,
+    filename: str = 'discord.log',
+    *,
+    max_bytes: int = 10 * 2**20,
+    backups: int = 5,
+    when: Optional[str] = None,
+    burst: int = 50,
+    queue_size: int = 10_000
+) -> LogRuntime:
+    if when:
+        # time based, e.g. when='midnight'
+        writer: logging.Handler = logging.handlers.TimedRotatingFileHandler(filename, when=when, backupCount=backups, encoding='utf-8')
+    else:
+        writer = logging.handlers.RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+    writer.setFormatter(logging.Formatter(FORMAT))
+
+    limiter = RateLimitFilter(burst=burst)
+    handler = DroppingQueueHandler(queue_size)
+    handler.addFilter(limiter)
+    logger.addHandler(handler)
+
+    listener = QueueListener(handler.queue, writer, respect_handler_level=True)
+    listener.start()
+    return LogRuntime(logger, handler, listener, limiter)
@@ -0,0 +1,116 @@
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+PUNCTUATION = re.compile(r"[^\w\s]")
+ARTICLES = ('the ', 'a ', 'an ')
+
+
+def normalize(text: str) -> str:
+    # "  The Bódé's  Galaxy!" -> "bodes galaxy"
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char)).casefold()
+    text = ' '.join(PUNCTUATION.sub('', text).split())
+    for article in ARTICLES:
+        if text.startswith(article):
+            return text[len(article):]
+    return text
+
+
+def distance(a: str, b: str, limit: int) -> int:
+    # Levenshtein distance restricted to the diagonal band |i - j| <= limit, anything that
+    # would have to leave the band is already over the limit and comes back as limit + 1
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    over = limit + 1
+    previous = [j if j <= limit else over for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        char_a = a[i - 1]
+        low, high = max(1, i - limit), min(len(b), i + limit)
+        current = [over] * (len(b) + 1)
+        current[0] = i if i <= limit else over
+        for j in range(low, high + 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != b[j - 1]),
+                over
+            )
+        if min(current[low - 1:high + 1]) > limit:
+            return over
+        previous = current
+    return previous[-1]
+
+
+def trigrams(word: str) -> List[str]:
+    return [word[i:i + 3] for i in range(len(word) - 2)]
+
+
+# Trigram postings over normalized answers. One edit touches at most three trigrams, so a
+# candidate within k edits shares at least (trigram count - 3k) of them with the guess and
+# everything else is discarded before the (bounded) edit distance is ever computed. Trigrams
+# are counted with repeats, "nananana" holds "nan" three times, as the bound assumes
+class TrigramIndex:
+    def __init__(self, words: Iterable[str] = ()) -> None:
+        self._words: List[str] = []
+        # trigram -> (word index, times the trigram occurs in that word)
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._by_length: Dict[int, List[int]] = {}
+        for word in words:
+            self.add(word)
+
+    def add(self, word: str) -> None:
+        index = len(self._words)
+        self._words.append(word)
+        self._by_length.setdefault(len(word), []).append(index)
+        for gram, count in Counter(trigrams(word)).items():
+            self._postings.setdefault(gram, []).append((index, count))
+
+    def search(self, word: str, threshold: int) -> List[Tuple[int, str]]:
+        shared = Counter()
+        for gram, count in Counter(trigrams(word)).items():
+            for index, occurrences in self._postings.get(gram, ()):
+                shared[index] += min(count, occurrences)
+        found = []
+        for length in range(len(word) - threshold, len(word) + threshold + 1):
+            for index in self._by_length.get(length, ()):
+                if shared[index] < max(len(word), length) - 2 - 3 * threshold:
+                    continue
+                candidate = self._words[index]
+                edits = distance(word, candidate, threshold)
+                if edits <= threshold:
+                    found.append((edits, candidate))
+        return sorted(found)
+
+
+# Every accepted answer of every trivia entry, normalized once at load time
+class AnswerMatcher:
+    def __init__(self, answers: Mapping[str, Iterable[str]], *, max_distance: int = 2, ratio: float = 0.25) -> None:
+        self.max_distance = max_distance
+        self.ratio = ratio
+        self._exact: Dict[str, str] = {}
+        for key, accepted in answers.items():
+            for answer in (key, *accepted):
+                self._exact.setdefault(normalize(answer), key)
+        self._index = TrigramIndex(self._exact)
+
+    def threshold(self, guess: str) -> int:
+        # one typo per four characters, capped at max_distance, "milky" and shorter get at most one
+        return min(self.max_distance, int(len(guess) * self.ratio))
+
+    def match(self, guess: str) -> Optional[str]:
+        guess = normalize(guess)
+        key = self._exact.get(guess)
+        if key is not None:
+            return key
+        threshold = self.threshold(guess)
+        if threshold == 0:
+            return None
+        found = self._index.search(guess, threshold)
+        if not found:
+            return None
+        return self._exact[found[0][1]]
+
+    def is_correct(self, guess: str, key: str) -> bool:
+        return self.match(guess) == key
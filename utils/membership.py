@@ -0,0 +1,68 @@
+import sys
+import heapq
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Iterator, Set
+
+
+# Set of user IDs packed into a sorted int64 buffer (8 bytes per ID), looked up by binary search.
+# New IDs land in a small hash set first and are merged into the buffer in batches.
+class VerifiedSet:
+    def __init__(self, ids: Iterable[int] = (), *, merge_at: int = 4096) -> None:
+        self._sorted = array('q', sorted(set(ids)))
+        self._pending: Set[int] = set()
+        self.merge_at = merge_at
+
+    @classmethod
+    def from_sorted(cls, ids: Iterable[int], **kwargs) -> 'VerifiedSet':
+        # skips the sort, the caller guarantees ascending unique IDs (e.g. an INTEGER PRIMARY KEY scan)
+        self = cls(**kwargs)
+        self._sorted = array('q', ids)
+        return self
+
+    @classmethod
+    def from_buffer(cls, buffer: memoryview, **kwargs) -> 'VerifiedSet':
+        # searches sorted int64s where they are, e.g. in a mapped snapshot, until the first merge copies them
+        self = cls(**kwargs)
+        self._sorted = buffer.cast('B').cast('q')
+        return self
+
+    @property
+    def buffer(self) -> memoryview:
+        self.merge()
+        return memoryview(self._sorted)
+
+    def count_range(self, low: int, high: int) -> int:
+        # how many IDs fall in (low, high]
+        return (
+            bisect_right(self._sorted, high) - bisect_right(self._sorted, low)
+            + sum(low < user_id <= high for user_id in self._pending)
+        )
+
+    def __contains__(self, user_id: int) -> bool:
+        if user_id in self._pending:
+            return True
+        index = bisect_left(self._sorted, user_id)
+        return index < len(self._sorted) and self._sorted[index] == user_id
+
+    def __len__(self) -> int:
+        return len(self._sorted) + len(self._pending)
+
+    def __iter__(self) -> Iterator[int]:
+        return heapq.merge(self._sorted, sorted(self._pending))
+
+    @property
+    def nbytes(self) -> int:
+        return self._sorted.itemsize * len(self._sorted) + sys.getsizeof(self._pending)
+
+    def add(self, user_id: int) -> None:
+        if user_id in self:
+            return
+        self._pending.add(user_id)
+        if len(self._pending) >= self.merge_at:
+            self.merge()
+
+    def merge(self) -> None:
+        if self._pending:
+            self._sorted = array('q', heapq.merge(self._sorted, sorted(self._pending)))
+            self._pending.clear()
@@ -0,0 +1,141 @@
+import os
+import time
+import contextvars
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# 0.5ms .. ~33s, doubling, plenty for anything from a set lookup to a stuck upstream
+BUCKETS = tuple(0.0005 * 2 ** exponent for exponent in range(17))
+
+# the command being invoked in the current task, so phases deeper down can be attributed to it
+current_command: contextvars.ContextVar[str] = contextvars.ContextVar('current_command', default='')
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'total')
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q: float) -> float:
+        # linear interpolation inside the bucket the q-th observation falls in
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                low = BUCKETS[index - 1] if index else 0.0
+                high = BUCKETS[index] if index < len(BUCKETS) else BUCKETS[-1]
+                return low + (high - low) * (rank - seen) / count
+            seen += count
+        return BUCKETS[-1]
+
+
+# Process-wide counters and latency histograms. Everything is a no-op while disabled,
+# each hook costs one attribute check then
+class Metrics:
+    def __init__(self) -> None:
+        self.enabled = False
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.gauges: Dict[str, Callable[[], float]] = {}
+        self._null = nullcontext()
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name: str, read: Callable[[], float]) -> None:
+        self.gauges[name] = read
+
+    @contextmanager
+    def _timer(self, name: str, labels: Dict[str, str]) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timer(self, name: str, **labels: str):
+        if not self.enabled:
+            return self._null
+        return self._timer(name, labels)
+
+    def phase(self, phase: str):
+        # time spent in one part of the stack (sqlite, http, rest...) on behalf of the running command
+        if not self.enabled:
+            return self._null
+        return self._timer('phase_seconds', {'phase': phase, 'command': current_command.get() or 'none'})
+
+    def ratio(self, name: str, hit: str = 'hit', miss: str = 'miss') -> Optional[float]:
+        hits = sum(value for (key, labels), value in self.counters.items() if key == name and ('result', hit) in labels)
+        misses = sum(value for (key, labels), value in self.counters.items() if key == name and ('result', miss) in labels)
+        return hits / (hits + misses) if hits + misses else None
+
+    def summary(self, name: str = 'command_seconds') -> List[Tuple[str, int, float, float, float]]:
+        rows = []
+        for (key, labels), histogram in sorted(self.histograms.items()):
+            if key == name:
+                label = ','.join(value for _, value in labels)
+                rows.append((label, histogram.count, histogram.quantile(0.5), histogram.quantile(0.95), histogram.quantile(0.99)))
+        return rows
+
+    def render(self) -> str:
+        # Prometheus text exposition format
+        lines = []
+
+        def format_labels(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = [f'{key}="{value}"' for key, value in labels + extra]
+            return '{' + ','.join(pairs) + '}' if pairs else ''
+
+        for name in sorted({key for key, _ in self.counters}):
+            lines.append(f"# TYPE spacebot_{name} counter")
+            for (key, labels), value in sorted(self.counters.items()):
+                if key == name:
+                    lines.append(f"spacebot_{name}{format_labels(labels)} {value}")
+        for name in sorted({key for key, _ in self.histograms}):
+            lines.append(f"# TYPE spacebot_{name} histogram")
+            for (key, labels), histogram in sorted(self.histograms.items()):
+                if key != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                    lines.append(f"spacebot_{name}_bucket{format_labels(labels, (('le', le),))} {cumulative}")
+                lines.append(f"spacebot_{name}_sum{format_labels(labels)} {histogram.total}")
+                lines.append(f"spacebot_{name}_count{format_labels(labels)} {histogram.count}")
+        for name, read in sorted(self.gauges.items()):
+            lines.append(f"# TYPE spacebot_{name} gauge")
+            lines.append(f"spacebot_{name} {read()}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(path + '.tmp', path)
+
+
+metrics = Metrics()
@@ -0,0 +1,241 @@
+import time
+import heapq
+import struct
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Callable, ClassVar, Dict, FrozenSet, List, Mapping, Optional, Set, Tuple
+
+from .userstate import UserState
+
+logger = logging.getLogger(__name__)
+
+
+# Something a player did that a mission can count. Cogs build one and hand it to
+# MissionTracker.emit, `name` is what a mission's goal refers to in missions.json
+@dataclass(frozen=True, slots=True)
+class GameEvent:
+    name: ClassVar[str] = ''
+    user_id: int
+
+
+@dataclass(frozen=True, slots=True)
+class GuessCorrect(GameEvent):
+    name: ClassVar[str] = 'gtu_correct'
+    category: str
+
+
+@dataclass(frozen=True, slots=True)
+class TyperacerFinish(GameEvent):
+    name: ClassVar[str] = 'typeracer_finish'
+    wpm: float
+    accuracy: float
+
+
+EVENTS = {event.name: event for event in (GuessCorrect, TyperacerFinish)}
+# a player's progress in a snapshot: user_id, mission, count, started
+RECORD = struct.Struct('<qiid')
+
+
+def duration_seconds(duration: str) -> float:
+    # missions.json durations are H:MM
+    hours, minutes = duration.split(':')
+    return int(hours) * 3600 + int(minutes) * 60
+
+
+# missions.json turned inside out: for each event name, the missions it counts towards
+class MissionIndex:
+    def __init__(self, missions: Mapping[str, Mapping]) -> None:
+        self.missions = missions
+        self.goals: Dict[int, int] = {}
+        self.durations: Dict[int, float] = {}
+        events: Dict[str, Set[int]] = {}
+        for key, mission in missions.items():
+            number = int(key)
+            self.durations[number] = duration_seconds(mission['duration'])
+            goal = mission.get('goal')
+            if goal:
+                self.goals[number] = goal['count']
+                events.setdefault(goal['event'], set()).add(number)
+        self.events: Dict[str, FrozenSet[int]] = {name: frozenset(numbers) for name, numbers in events.items()}
+
+
+# One story player's progress on their current mission
+@dataclass(slots=True)
+class Progress:
+    mission: int
+    count: int
+    started: float
+
+    def deadline(self, index: MissionIndex) -> Optional[float]:
+        # only missions the tracker can count are timed, the rest wait for a goal in missions.json
+        if self.mission not in index.goals:
+            return None
+        return self.started + index.durations[self.mission]
+
+
+# Counts game events towards the missions of players in story mode. Everything happens in memory:
+# emit() is a dict lookup or two, progress reaches the story table through flush(), which also
+# ends the story of anyone whose mission ran out of time
+class MissionTracker:
+    def __init__(self, user_state: UserState, missions: Callable[[], Mapping[str, Mapping]]) -> None:
+        self.user_state = user_state
+        # read through the trivia library, so a reloaded missions.json is picked up on the next event
+        self._missions = missions
+        self._index: Optional[MissionIndex] = None
+        self._progress: Dict[int, Progress] = {}
+        self._dirty: Set[int] = set()
+        # what a snapshot held, (mission, count, started) per player, until reconcile() compares the table to it
+        self._restored: Dict[int, Tuple[int, int, float]] = {}
+        # (deadline, user_id, mission), stale once the player moved on, checked when popped
+        self._deadlines: List[Tuple[float, int, int]] = []
+
+    @property
+    def index(self) -> MissionIndex:
+        missions = self._missions()
+        if self._index is None or self._index.missions is not missions:
+            self._index = MissionIndex(missions)
+            self._deadlines = [
+                (progress.deadline(self._index), user_id, progress.mission)
+                for user_id, progress in self._progress.items() if progress.mission in self._index.goals
+            ]
+            heapq.heapify(self._deadlines)
+        return self._index
+
+    @property
+    def pending(self) -> int:
+        return len(self._dirty)
+
+    async def load(self) -> None:
+        rows = await self.user_state.database.reader(self.user_state.name).fetchall(
+            'SELECT user_id, progression, mission_count, mission_started FROM story WHERE enabled = 1'
+        )
+        now = time.time()
+        # stories started before missions were timed get their clock started now
+        self._progress = {
+            user_id: Progress(progression or 1, count or 0, started or now)
+            for user_id, progression, count, started in rows
+        }
+        self._index = None
+
+    def snapshot(self) -> bytes:
+        return b''.join(
+            RECORD.pack(user_id, progress.mission, progress.count, progress.started)
+            for user_id, progress in self._progress.items()
+        )
+
+    def restore(self, records: memoryview) -> None:
+        self._restored = {user_id: (mission, count, started) for user_id, mission, count, started in RECORD.iter_unpack(records)}
+        self._progress = {user_id: Progress(*record) for user_id, record in self._restored.items()}
+        self._index = None
+
+    async def reconcile(self, chunk: int = 50_000) -> Dict[str, int]:
+        # like UserState.reconcile: a row that differs from the snapshot was changed after it was
+        # written and wins, counting done since the restore is kept everywhere else
+        reader = self.user_state.database.reader(self.user_state.name)
+        restored, self._restored = self._restored, {}
+        now = time.time()
+        changed = 0
+        seen = set()
+        last = 0
+        while rows := await reader.fetchall(
+            'SELECT user_id, progression, mission_count, mission_started FROM story '
+            'WHERE enabled = 1 AND user_id > ? ORDER BY user_id LIMIT ?', (last, chunk)
+        ):
+            for user_id, progression, count, started in rows:
+                seen.add(user_id)
+                record = (progression or 1, count or 0, started or now)
+                if restored.get(user_id) != record:
+                    self._progress[user_id] = Progress(*record)
+                    self._dirty.discard(user_id)
+                    changed += 1
+            last = rows[-1][0]
+        ended = 0
+        for user_id in restored.keys() - seen:
+            if self._progress.pop(user_id, None) is not None:
+                self._dirty.discard(user_id)
+                ended += 1
+        self._index = None
+        return {'missions_changed': changed, 'missions_ended': ended}
+
+    def begin(self, user_id: int) -> None:
+        # start_story already wrote the same row
+        self._track(user_id, Progress(1, 0, time.time()))
+
+    def _track(self, user_id: int, progress: Progress) -> None:
+        self._progress[user_id] = progress
+        index = self.index
+        if progress.mission in index.goals:
+            heapq.heappush(self._deadlines, (progress.deadline(index), user_id, progress.mission))
+
+    def status(self, user_id: int) -> Optional[Tuple[Progress, Optional[int], Optional[float]]]:
+        # (progress, goal, deadline), goal and deadline are None for missions that aren't tracked
+        progress = self._current(user_id)
+        if progress is None:
+            return None
+        index = self.index
+        return progress, index.goals.get(progress.mission), progress.deadline(index)
+
+    def _current(self, user_id: int) -> Optional[Progress]:
+        mission = self.user_state.get_progression(user_id)
+        if mission is None:
+            return None
+        progress = self._progress.get(user_id)
+        if progress is None or progress.mission != mission:
+            # moved on by another cluster, or by hand in the database
+            progress = Progress(mission, 0, time.time())
+            self._track(user_id, progress)
+        return progress
+
+    def emit(self, event: GameEvent) -> Optional[int]:
+        # returns the mission the event cleared, if it cleared one
+        index = self.index
+        listening = index.events.get(event.name)
+        if not listening or self.user_state.get_progression(event.user_id) not in listening:
+            return None
+        progress = self._current(event.user_id)
+        if time.time() > progress.deadline(index):
+            # out of time, the next flush ends the story
+            return None
+        progress.count += 1
+        self._dirty.add(event.user_id)
+        if progress.count < index.goals[progress.mission]:
+            return None
+        cleared = progress.mission
+        # past the last mission the story is complete and nothing counts any more
+        self.user_state.progression[event.user_id] = cleared + 1
+        self._track(event.user_id, Progress(cleared + 1, 0, time.time()))
+        return cleared
+
+    def expired(self, now: Optional[float] = None) -> List[int]:
+        now = now or time.time()
+        # load(), restore() and reconcile() drop the index, the deadlines are rebuilt with it
+        self.index
+        users = []
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, user_id, mission = heapq.heappop(self._deadlines)
+            progress = self._progress.get(user_id)
+            if progress is None or progress.mission != mission:
+                continue
+            if self.user_state.get_progression(user_id) != mission:
+                continue
+            users.append(user_id)
+        return users
+
+    async def flush(self) -> int:
+        # one UPDATE per player whose progress changed, queued together so they commit as one group
+        dirty, self._dirty = self._dirty, set()
+        writes = [
+            self.user_state.save_progress(user_id, progress.mission, progress.count, progress.started)
+            for user_id, progress in ((user_id, self._progress.get(user_id)) for user_id in dirty)
+            if progress is not None and self.user_state.get_progression(user_id) is not None
+        ]
+        expired = self.expired()
+        if expired:
+            logger.info("%d story players ran out of time", len(expired))
+        for user_id in expired:
+            self._progress.pop(user_id, None)
+        # failing a mission means starting the story over with >>begin
+        writes += [self.user_state.stop_story(user_id) for user_id in expired]
+        await asyncio.gather(*writes)
+        return len(writes)
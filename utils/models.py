@@ -1,150 +1,407 @@
-import json
 import os
+import time
+import asyncio
 import logging
 from itertools import cycle
-from dataclasses import dataclass
-from typing import Dict, List, Literal, Mapping, Optional
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Coroutine, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 import aiohttp
 import aiosqlite
 import discord
-from bs4 import BeautifulSoup
 from discord.ext import commands
 
-from .ui.view import HelpView
-
-
-# dataclass for caching user;s information
-@dataclass(slots=True, repr=True, kw_only=True)
-class Cache:
-    verified: bool
-    story_progression: Optional[int] = None
-
-# Holds the bot's cache of opened databases
-class Database:
-    def __init__(self, connections: Mapping[str, aiosqlite.Connection]) -> None:
-        self._conn = connections
-
-    def __getitem__(self, name: str) -> Optional[aiosqlite.Connection]:
-        return self._conn.get(name)
-
-
-# Praser for the Scraper
-class WebsiteParser(BeautifulSoup):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-    
-    def get_head(self, sub: Literal[1, 2, 3, 4, 5, 6], *args) -> Optional[str]:
-        return self.find(f"h{sub}", *args)
-
+from .admission import AdmissionController
+from .membership import VerifiedSet
+from .logs import setup_logging
+from .metrics import current_command, metrics
+from .missions import MissionTracker
+from .ui.view import ConfirmAction, ConfirmPrompt, HelpView
+from .web import WebClient
+from .cluster import ClusterConfig, use_endpoints
+from .feedback import RouteBudget
+from .database import Database, ReaderPool
+from .gateway import GatewayProfile
+from .images import FileImageSource, HttpImageSource, ImageCache
+from .sessions import SessionManager
+from .snapshot import Snapshot, SnapshotError, write_snapshot
+from .startup import profiler
+from .trivia import TriviaLibrary
+from .typeracer import Leaderboards
+from .userstate import UserState
+from .writer import WriteBehind
 
 # Bot class for the bot
 class SpaceBot(commands.Bot):
-    def __init__(self, *args, **kwargs):
-        intents = discord.Intents(
-            guilds=True,
-            members=True,
-            emojis=True,
-            messages=True,
-            guild_messages=True,
-            dm_messages=True,
-            message_content=True,
-            presences=True
-        )
+
+    # nothing needs these before the bot is ready, they load in the background afterwards
+    DEFERRED_EXTENSIONS = ('jishaku',)
+
+    def __init__(self, *args, cluster: Optional[ClusterConfig] = None, **kwargs):
+        # lean sizes intents and caches to what the cogs declare, full is everything as before
+        profile = GatewayProfile.select(os.getenv('GATEWAY_PROFILE', 'full'))
+        if cluster:
+            # only reaches discord.py's AutoShardedClient, see ShardedSpaceBot
+            kwargs.update(shard_count=cluster.shard_count, shard_ids=cluster.shard_ids)
         super().__init__(
             command_prefix=commands.when_mentioned_or('>>'),
-            intents=intents
+            **profile.options(),
+            **kwargs
         )
 
-        self.verified: Dict[int, Cache] = {}
+        self.cluster = cluster
+        self.gateway_profile = profile
+
+        self.user_state: Optional[UserState] = None
+        self.leaderboards: Optional[Leaderboards] = None
+        self.missions: Optional[MissionTracker] = None
+        self.sessions = SessionManager()
+        # the global check admits every command, its slot is given back however the command ends
+        self.admission = AdmissionController.from_env()
+        self.add_listener(self.admission.release, 'on_command_completion')
+        self.add_listener(self.admission.release, 'on_command_error')
+        # action name -> handler for ConfirmPrompt, filled in by the cogs that send prompts
+        self.confirm_actions: Dict[str, ConfirmAction] = {}
+        # game feedback keeps one channel message in five free for everything else
+        self.route_budget = RouteBudget(rate=4, per=5.0)
         self.activities = cycle(['Space is almost endless.', '10⁷ K?', 'No stars? No moons? No planets? Damn that\'s sad.'])
         self.logger = self.get_logger()
+        self.logger.info(profile.describe())
         self.session: Optional[aiohttp.ClientSession] = None
+        self.web: Optional[WebClient] = None
+        self.images: Optional[ImageCache] = None
+        self.executor: Optional[Executor] = None
         self._conn: Optional[Database] = None
-        self.universe_trivia = self.load_information()
+        self.trivia: Optional[TriviaLibrary] = None
+        self.help_cache = HelpCache()
+        self._connecting_at: Optional[float] = None
+        self._deferred: Optional[asyncio.Task] = None
+        self._reconcile: Optional[asyncio.Task] = None
+        self._state_loaded = False
+        # start() is still running, its teardown logs until the very end
+        self._running = False
         self.theme = 0xF5F5DC
+        self.instrument_http()
+        metrics.gauge('game_sessions_active', lambda: self.sessions.active)
+        metrics.gauge('verified_users', lambda: len(self.verified))
+        metrics.gauge('mission_progress_unflushed', lambda: self.missions.pending if self.missions else 0)
+
+    def instrument_http(self) -> None:
+        # every Discord REST call goes through HTTPClient.request, time it there per route template
+        request = self.http.request
+
+        async def timed_request(route: discord.http.Route, *args, **kwargs):
+            if not metrics.enabled:
+                return await request(route, *args, **kwargs)
+            with metrics.phase('rest'), metrics.timer('rest_seconds', route=f"{route.method} {route.path}"):
+                return await request(route, *args, **kwargs)
+
+        self.http.request = timed_request
+
+    async def invoke(self, ctx: commands.Context) -> None:
+        if not metrics.enabled or ctx.command is None:
+            return await super().invoke(ctx)
+        token = current_command.set(ctx.command.qualified_name)
+        try:
+            # a game's invocation lasts until the game ends, that is play time, not latency. Its
+            # phases are still attributed to it
+            if ctx.command.extras.get('admission') == 'game':
+                return await super().invoke(ctx)
+            with metrics.timer('command_seconds', command=ctx.command.qualified_name):
+                await super().invoke(ctx)
+        finally:
+            current_command.reset(token)
+
+    @property
+    def verified(self) -> VerifiedSet:
+        return self.user_state.verified if self.user_state else VerifiedSet()
 
     async def verify_user(self, user: discord.Member) -> None:
-        verified = self.get_conn('verified')
-        if verified:
-            async with verified.cursor() as cursor:
-                statement = 'INSERT INTO verified (user_id) VALUES (?)'
-                await cursor.execute(statement, (user.id,))
-                await verified.commit()
-            self.verified[user.id] = Cache(verified=True)
+        if self.user_state:
+            await self.user_state.verify(user.id)
 
     async def setup_hook(self) -> None:
-        await self.load_extension('jishaku')
+        self.add_dynamic_items(ConfirmPrompt)
+        # extension imports are synchronous, but any awaiting in cog_load still overlaps
+        await asyncio.gather(*(
+            self.load_extension(f'cogs.{filename[:-3]}')
+            for filename in sorted(os.listdir('./cogs')) if filename.endswith('.py')
+        ))
+        self.help_cache.clear()
+        self._deferred = asyncio.create_task(self.load_deferred_extensions())
+
+    async def load_deferred_extensions(self) -> None:
+        await self.wait_until_ready()
+        for name in self.DEFERRED_EXTENSIONS:
+            await self.load_extension(name)
         jishaku_cog = self.get_cog('Jishaku')
         if jishaku_cog:
             jishaku_cog.hidden = True
-        for filename in os.listdir('./cogs'):
-            if filename.endswith('.py'):
-                await self.load_extension(f'cogs.{filename[:-3]}')
-        
+            self.help_cache.clear()
+        report = profiler.report()
+        self.logger.info(f"Startup timings:\n{report}")
+        print(report)
+
+    async def load_extension(self, name: str, *, package: Optional[str] = None) -> None:
+        with profiler.phase(f'extension {name}'):
+            await super().load_extension(name, package=package)
+        self.help_cache.clear()
+
+    async def unload_extension(self, name: str, *, package: Optional[str] = None) -> None:
+        await super().unload_extension(name, package=package)
+        self.help_cache.clear()
+
+    async def reload_extension(self, name: str, *, package: Optional[str] = None) -> None:
+        await super().reload_extension(name, package=package)
+        self.help_cache.clear()
+
     def get_logger(self):
         logger = logging.getLogger('discord')
         logger.setLevel(logging.INFO)
-        handler = logging.FileHandler(filename='discord.log', encoding='utf-8', mode='w')
-        handler.setFormatter(logging.Formatter('LEVEL [%(levelname)s] at (%(asctime)s): %(name)s: %(message)s'))
-        logger.addHandler(handler)
+        # records go through a queue to a writer thread, the event loop never blocks on the log file
+        self.logs = setup_logging(
+            logger,
+            self.local_path('discord.log'),
+            max_bytes=int(os.getenv('LOG_MAX_BYTES', 10 * 2**20)),
+            backups=int(os.getenv('LOG_BACKUPS', '5')),
+            when=os.getenv('LOG_ROTATE_WHEN') or None,
+            burst=int(os.getenv('LOG_BURST', '50'))
+        )
+        metrics.gauge('log_records_dropped', lambda: self.logs.dropped)
+        metrics.gauge('log_records_suppressed', lambda: self.logs.suppressed)
         return logger
 
+    def get_executor(self) -> Executor:
+        # PARSER_POOL=process moves HTML parsing off the GIL entirely, threads are cheaper to start
+        workers = int(os.getenv('PARSER_WORKERS', 0)) or None
+        match os.getenv('PARSER_POOL', 'thread'):
+            case 'process':
+                return ProcessPoolExecutor(max_workers=workers)
+            case 'thread':
+                return ThreadPoolExecutor(max_workers=workers, thread_name_prefix='parser')
+            case kind:
+                raise ValueError(f"Unknown PARSER_POOL: {kind!r}")
+
+    def get_image_cache(self) -> ImageCache:
+        # IMAGE_SOURCE serves corpus images from a local directory instead of their hosts
+        directory = os.getenv('IMAGE_SOURCE')
+        source = FileImageSource(directory) if directory else HttpImageSource(self.web)
+        # the files are named by content and shared, the index is written by each process alone
+        index = os.path.basename(self.local_path('index.json'))
+        return ImageCache(source, './database/images', index=index, executor=self.executor)
+
+    def local_path(self, path: str) -> str:
+        # per process file names when running as one of several clusters
+        return self.cluster.local_path(path) if self.cluster else path
+
     def get_conn(self, name: str) -> Optional[aiosqlite.Connection]:
         return self._conn[name]
 
-    def load_information(self):
-        with open('./information/galaxy.json', 'r') as f:
-            return json.load(f)
+    def get_writer(self, name: str) -> Optional[WriteBehind]:
+        return self._conn.writer(name)
+
+    def get_reader(self, name: str) -> Optional[ReaderPool]:
+        return self._conn.reader(name)
+
+    def database_stats(self) -> Dict[str, Dict[str, float]]:
+        return self._conn.stats() if self._conn else {}
+
+    def load_information(self) -> TriviaLibrary:
+        return TriviaLibrary('./information')
 
     async def init_database(self, **kwargs) -> None:
-        self._conn = Database(kwargs)
+        self._conn = Database(kwargs, readers=int(os.getenv('DB_READERS', 4)))
+        # several processes share the files in cluster mode and keep each other's memory current
+        origin = self.cluster.cluster_id if self.cluster and self.cluster.multiprocess else None
+        self.user_state = UserState(self._conn, origin=origin)
+        self.missions = MissionTracker(self.user_state, lambda: self.trivia.corpus.missions)
+        # the global board also moves with races on the other clusters
+        self.leaderboards = Leaderboards(self._conn, max_age=60.0 if origin is not None else None)
 
     async def on_ready(self) -> None:
+        if self._connecting_at:
+            profiler.record('gateway connect until ready', self._connecting_at)
+            self._connecting_at = None
         self.logger.info(f"Logged in as {self.user} ({self.user.id}), preparing to conquer the universe.")
         print(f"Logged in as {self.user} ({self.user.id}), preparing to conquer the universe.")
 
     async def create_tables(self) -> None:
-        SCHEMA_VERIFIED = """
-                CREATE TABLE IF NOT EXISTS verified (
-                        user_id INTEGER PRIMARY KEY
-                );
-                """
-        SCHEMA_STORY = """
-                CREATE TABLE IF NOT EXISTS story (
-                        user_id INTEGER PRIMARY KEY,
-                        enabled INTEGER,
-                        progression INTEGER DEFAULT 0
-                );
-                """
-
-        verified = self.get_conn('verified')
-        story = self.get_conn('story')
-
-        if verified:
-            async with verified.cursor() as cursor:
-                await cursor.execute(SCHEMA_VERIFIED)
-        if story:
-            async with story.cursor() as cursor:
-                await cursor.execute(SCHEMA_STORY)
-
-
-    async def start(self, *args, **kwargs) -> None:
-        async with aiohttp.ClientSession() as self.session:
-            async with aiosqlite.connect('./database/verified.db') as verified:
-                async with aiosqlite.connect('./database/story.db') as story:
-                    await self.init_database(verified=verified, story=story)
-                    await self.create_tables()
-                    await self.fill_verification_cache()
-                    return await super().start(*args, **kwargs)
+        # verified.db and story.db are folded into users.db the first time they are found
+        await self.user_state.create_tables(legacy={
+            'verified': './database/verified.db',
+            'story': './database/story.db'
+        })
+        await self.leaderboards.create_tables()
+
+    async def start(self, token: str, *, reconnect: bool = True) -> None:
+        self._running = True
+        try:
+            await self.run_until_closed(token, reconnect)
+        finally:
+            self._running = False
+            self.stop_logging()
+
+    async def run_until_closed(self, token: str, reconnect: bool) -> None:
+        with self.get_executor() as self.executor:
+            async with aiohttp.ClientSession() as self.session:
+                self.web = WebClient(self.session)
+                self.images = self.get_image_cache()
+                metrics.enabled = os.getenv('METRICS', '0') == '1'
+                await self.init_database(users='./database/users.db')
+                with profiler.phase('database open'):
+                    await self._conn.start()
+                try:
+                    # none of these depend on each other, the gateway only opens once all are done
+                    await self.prepare(
+                        self.prepare_user_state(),
+                        self.prepare_trivia(),
+                        self.prepare_images(),
+                        self.prepare_login(token)
+                    )
+                    self._connecting_at = time.perf_counter()
+                    return await self.connect(reconnect=reconnect)
+                finally:
+                    try:
+                        await self.save_state()
+                    finally:
+                        await self._conn.close()
+
+    async def close(self) -> None:
+        await super().close()
+        self.stop_logging()
+
+    def stop_logging(self) -> None:
+        # close() returns while start() may still be saving state, and start() may end (a failed
+        # login, a cancelled task) before close() is called. Whichever finishes second stops the
+        # listener, so everything either of them logs is written
+        if self._running or not self.is_closed() or self.logs.stopped:
+            return
+        if self.logs.dropped:
+            self.logger.warning(f"{self.logs.dropped} log records were dropped under load")
+        self.logs.stop()
+
+    @staticmethod
+    async def prepare(*steps: Coroutine[Any, Any, None]) -> None:
+        # when one step fails the others are cancelled and awaited, none may still be running
+        # once the caller tears down the database and session they use
+        tasks = [asyncio.create_task(step) for step in steps]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def prepare_user_state(self) -> None:
+        with profiler.phase('database tables'):
+            await self.create_tables()
+        with profiler.phase('user state load'):
+            await self.fill_verification_cache()
+
+    async def prepare_trivia(self) -> None:
+        with profiler.phase('trivia compile'):
+            self.trivia = await asyncio.to_thread(self.load_information)
+
+    async def prepare_images(self) -> None:
+        with profiler.phase('image index load'):
+            await self.images.load()
+
+    async def prepare_login(self, token: str) -> None:
+        # login also runs setup_hook, so the extensions load alongside the database work
+        with profiler.phase('login + setup_hook'):
+            await self.login(token)
+
+    def snapshot_path(self) -> str:
+        return self.local_path(os.getenv('SNAPSHOT_FILE', './database/snapshot.bin'))
 
     async def fill_verification_cache(self):
-        verified = self.get_conn('verified')
-        if verified:
-            async with verified.cursor() as cursor:
-                await cursor.execute('SELECT * FROM verified')
-                async for record in cursor:
-                    self.verified[record[0]] = Cache(verified=True)
+        # the last clean shutdown's snapshot is mapped instead of scanning the tables, and checked
+        # against them once the bot is up. Without a usable one everything comes from the database
+        snapshot = await asyncio.to_thread(Snapshot.load, self.snapshot_path())
+        try:
+            if snapshot is not None:
+                self.user_state.restore(snapshot)
+                self.missions.restore(snapshot.section('missions'))
+                self.logger.info(f"Restored {len(self.user_state.verified)} verified users from a snapshot {time.time() - snapshot.meta['created']:.0f}s old")
+                # a snapshot is only good for the start after the shutdown that wrote it. Left in
+                # place, a crash would bring the same stale state back. The mapping outlives the file
+                await self.consume_snapshot()
+                self._reconcile = asyncio.create_task(self.reconcile_snapshot())
+        except (SnapshotError, KeyError, TypeError, ValueError) as error:
+            self.logger.warning(f"Ignoring snapshot: {error!r}")
+            snapshot = None
+        if snapshot is None:
+            await self.user_state.load()
+            await self.missions.load()
+        self._state_loaded = True
+
+    async def consume_snapshot(self) -> None:
+        try:
+            await asyncio.to_thread(os.remove, self.snapshot_path())
+        except OSError as error:
+            self.logger.warning(f"Could not remove the restored snapshot: {error!r}")
+
+    async def reconcile_snapshot(self) -> None:
+        start = time.perf_counter()
+        changes = await self.user_state.reconcile()
+        changes.update(await self.missions.reconcile())
+        summary = ', '.join(f"{name} {count}" for name, count in changes.items())
+        self.logger.info(f"Reconciled the snapshot with the database in {(time.perf_counter() - start) * 1e3:.0f}ms: {summary}")
+
+    async def save_state(self) -> None:
+        # mission progress since the last periodic flush, then the snapshot for the next start.
+        # Missions are looked up in the corpus, a start that failed before it loaded ran no games
+        if not self._state_loaded or self.trivia is None:
+            return
+        if self._reconcile:
+            self._reconcile.cancel()
+        await self.missions.flush()
+        sections, meta = self.user_state.snapshot()
+        sections['missions'] = self.missions.snapshot()
+        size = await asyncio.to_thread(write_snapshot, self.snapshot_path(), sections, {**meta, 'created': time.time()})
+        self.logger.info(f"Wrote a {size / 2**20:.1f}MiB snapshot to {self.snapshot_path()}")
+
+
+# SpaceBot on discord.py's AutoShardedBot. The MRO puts SpaceBot's overrides first and
+# AutoShardedClient's connect/close under them, so everything above runs unchanged
+class ShardedSpaceBot(SpaceBot, commands.AutoShardedBot):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._identified: Set[int] = set()
+
+    async def before_identify_hook(self, shard_id: Optional[int], *, initial: bool = False) -> None:
+        # the launcher's schedule spaces first identifies across every cluster, reconnects use the default wait
+        identify_at = self.cluster.identify_at(shard_id) if self.cluster and shard_id is not None else None
+        if identify_at is None or shard_id in self._identified:
+            return await super().before_identify_hook(shard_id, initial=initial)
+        self._identified.add(shard_id)
+        await asyncio.sleep(max(identify_at - time.time(), 0))
+
+
+def create_bot(cluster: Optional[ClusterConfig] = None) -> SpaceBot:
+    use_endpoints(os.getenv('DISCORD_API_BASE'), os.getenv('DISCORD_GATEWAY_URL'))
+    if cluster:
+        return ShardedSpaceBot(cluster=cluster)
+    return SpaceBot()
+
+
+# Rendered help pages, shared by every copy of SpaceHelp and dropped whenever extensions change
+class HelpCache:
+    def __init__(self) -> None:
+        self._pages: Dict[Tuple, Tuple[discord.Embed, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def clear(self) -> None:
+        self._pages = {}
+
+    def get(self, key: Tuple, render: Callable[[], Iterable[discord.Embed]]) -> Tuple[discord.Embed, ...]:
+        pages = self._pages.get(key)
+        if pages is None:
+            pages = self._pages[key] = tuple(render())
+        return pages
 
 
 # Help command for the bot
@@ -154,35 +411,44 @@ class SpaceHelp(commands.HelpCommand):
         super().__init__(command_attrs={'hidden': True})
         self.banner = "https://i.imgur.com/HIyFo04.jpg"
 
-    async def send_bot_help(self, mapping: Dict[commands.Cog, List[commands.Command]]) -> None:
-        embeds = []
+    def get_embed(self, title: str, description: Optional[str]) -> discord.Embed:
+        # footer shows the bot rather than the author, so one rendered page fits everyone
+        bot = self.context.bot
+        embed = discord.Embed(title=title, description=description, color=bot.theme)
+        embed.set_image(url=self.banner)
+        embed.set_footer(text=f"{bot.user.name}", icon_url=bot.user.display_avatar.url)
+        return embed
+
+    def render_cog(self, cog: commands.Cog, command_list: Iterable[commands.Command]) -> discord.Embed:
+        commands = "\n".join(f"• {command.qualified_name} - {command.brief}" for command in command_list if not command.hidden)
+        return self.get_embed(f"{cog.qualified_name} Commands", commands)
+
+    def render_bot(self, mapping: Dict[commands.Cog, List[commands.Command]]) -> Iterator[discord.Embed]:
         for cog, commands in mapping.items():
             if (not cog) or (cog and cog.hidden):
                 continue
-            commands = "\n".join(f"• {command.qualified_name} - {command.brief}" for command in commands if not command.hidden)
-            embed = discord.Embed(title=f"{cog.qualified_name} Commands", description=commands, color=self.context.bot.theme)
-            embed.set_image(url=self.banner)
-            embed.set_footer(text=f"{self.context.bot.user.name}", icon_url=self.context.author.display_avatar.url)
-            embeds.append(embed)
+            yield self.render_cog(cog, commands)
+
+    async def send_bot_help(self, mapping: Dict[commands.Cog, List[commands.Command]]) -> None:
+        bot = self.context.bot
+        embeds = bot.help_cache.get(('bot', bot.user.id), lambda: self.render_bot(mapping))
+        if not embeds:
+            return
         view = HelpView(self.context, embeds)
         destination = self.get_destination()
-        await destination.send(embed=embed, view=view)
+        await destination.send(embed=embeds[0], view=view)
 
     async def send_cog_help(self, cog: commands.Cog) -> None:
-        command_list = [command for command in cog.walk_commands()]
-        commands = "\n".join(f"• {command.qualified_name} - {command.brief}" for command in command_list if not command.hidden)
-        embed = discord.Embed(title=f"{cog.qualified_name} Commands", description=commands, color=self.context.bot.theme)
-        embed.set_image(url=self.banner)
-        embed.set_footer(text=f"{self.context.bot.user.name}", icon_url=self.context.author.display_avatar.url)
+        bot = self.context.bot
+        embed, = bot.help_cache.get(('cog', cog.qualified_name, bot.user.id), lambda: [self.render_cog(cog, cog.walk_commands())])
         destination = self.get_destination()
         await destination.send(embed=embed)
 
     async def send_command_help(self, command: commands.Command) -> None:
-        embed = discord.Embed(title=f"{command.qualified_name}", description=command.help, color=self.context.bot.theme)
-        embed.set_image(url=self.banner)
-        embed.set_footer(text=f"{self.context.bot.user.name}", icon_url=self.context.author.display_avatar.url)
+        bot = self.context.bot
+        embed, = bot.help_cache.get(
+            ('command', command.qualified_name, bot.user.id),
+            lambda: [self.get_embed(f"{command.qualified_name}", command.help)]
+        )
         destination = self.get_destination()
         await destination.send(embed=embed)
-    
-            
-
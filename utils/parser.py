@@ -0,0 +1,25 @@
+import re
+from typing import Literal, Optional
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+# Only the <h2 class="wow"> nodes are ever built into a tree, the rest of the page is skipped.
+# The class attribute is still one raw string while straining, hence the word-boundary regex.
+FACT_STRAINER = SoupStrainer('h2', attrs={'class': re.compile(r'(^|\s)wow(\s|$)')})
+
+
+# Praser for the Scraper, builds the whole document
+class WebsiteParser(BeautifulSoup):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+    
+    def get_head(self, sub: Literal[1, 2, 3, 4, 5, 6], *args) -> Optional[str]:
+        return self.find(f"h{sub}", *args)
+
+
+# Module level so it can be pickled into a process pool
+def parse_fact(text: str) -> Optional[str]:
+    fact = BeautifulSoup(text, 'lxml', parse_only=FACT_STRAINER).find('h2')
+    if fact is None:
+        return None
+    return fact.get_text(strip=True)
@@ -1,45 +1,47 @@
-import time
 import asyncio
+import importlib
+from concurrent.futures import Executor
+from types import ModuleType
 from typing import Optional
 
-import aiohttp
+from .startup import profiler
+from .web import WebClient
 
-from .models import WebsiteParser
 
 class Scraper:
 
     BASE = "https://fungenerators.com/random/facts/"
-    USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML," 
+    USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML,"
                  " like Gecko) Chrome/81.0.4044.138 Safari/537.36")
 
-    def __init__(self, session: Optional[aiohttp.ClientSession]):
-        self.session = session
-
-    async def _require_session(self) -> None:
-        if (self.session is None) or (self.session and self.session.closed):
-            self.session = aiohttp.ClientSession()
-
-    async def get_head(self, endpoint) -> WebsiteParser:
-        await self._require_session()
-        url = self.BASE + endpoint
-        async with self.session.get(url, headers={'User-Agent': self.USER_AGENT}) as response:
-            text = await response.text()
-            return WebsiteParser(text, "lxml")
+    def __init__(
+        self,
+        client: WebClient,
+        base: Optional[str] = None,
+        executor: Optional[Executor] = None
+    ):
+        self.client = client
+        self.base = base or self.BASE
+        # None runs the parser on the loop's default thread pool
+        self.executor = executor
+        self._parser: Optional[ModuleType] = None
+
+    async def get_parser(self) -> ModuleType:
+        # bs4 and lxml are only needed once the first page comes back, import them off the loop
+        if self._parser is None:
+            with profiler.phase('import utils.parser (bs4, lxml)'):
+                self._parser = await asyncio.to_thread(importlib.import_module, '.parser', __package__)
+        return self._parser
+
+    async def get_page(self, endpoint) -> str:
+        url = self.base + endpoint
+        return await self.client.get_text(url, headers={'User-Agent': self.USER_AGENT})
 
     async def scrape(self) -> str:
-        website_parser = await self.get_head("space")
-        fact = website_parser.get_head(2, {'class': 'wow'})
-        return fact.text
-
-
-async def test_main():
-    start = time.perf_counter()
-    async with aiohttp.ClientSession() as session:
-        scraper = Scraper(session)
-        parser = await scraper.scrape()
-        print(parser)
-    end = time.perf_counter()
-    print(f"Time taken: {end - start}")
-
-if __name__ == "__main__":
-    asyncio.run(test_main())
\ No newline at end of file
+        text = await self.get_page("space")
+        parser = await self.get_parser()
+        loop = asyncio.get_running_loop()
+        fact = await loop.run_in_executor(self.executor, parser.parse_fact, text)
+        if fact is None:
+            raise ValueError(f"No fact found at {self.base}space")
+        return fact
@@ -0,0 +1,82 @@
+import time
+import asyncio
+from typing import Dict, Optional, Tuple
+
+import discord
+
+from .errors import SessionUnavailable
+
+SessionKey = Tuple[int, int]
+
+
+# One running game, receives only the messages its player sends in its channel
+class GameSession:
+    def __init__(self, manager: 'SessionManager', key: SessionKey, timeout: float, after: int = 0) -> None:
+        self.manager = manager
+        self.key = key
+        self.timeout = timeout
+        # the message that started the game can reach the listener after the session opened
+        self.after = after
+        self.started_at = time.monotonic()
+        self._messages: asyncio.Queue[discord.Message] = asyncio.Queue(maxsize=16)
+
+    def __enter__(self) -> 'GameSession':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.manager._close(self)
+
+    def feed(self, message: discord.Message) -> None:
+        if message.id <= self.after:
+            return
+        if self._messages.full():
+            # a player typing faster than the game reads, the latest message is the one that
+            # matters (a quit or the right answer), stale guesses make room for it
+            self._messages.get_nowait()
+        self._messages.put_nowait(message)
+
+    async def wait(self, timeout: Optional[float] = None) -> discord.Message:
+        # raises asyncio.TimeoutError once the player has gone quiet for `timeout` seconds
+        return await asyncio.wait_for(self._messages.get(), timeout or self.timeout)
+
+
+# Routes incoming messages to running games by (channel_id, author_id) with one dict lookup,
+# instead of every pending wait_for predicate running against every message
+class SessionManager:
+    def __init__(self, *, limit: int = 1000, timeout: float = 60.0) -> None:
+        self.limit = limit
+        self.timeout = timeout
+        self._sessions: Dict[SessionKey, GameSession] = {}
+        self.rejected = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    @property
+    def active(self) -> int:
+        return len(self._sessions)
+
+    def open(self, channel_id: int, author_id: int, *, timeout: Optional[float] = None, after: int = 0) -> GameSession:
+        key = (channel_id, author_id)
+        if key in self._sessions:
+            self.rejected += 1
+            raise SessionUnavailable("You already have a game running in this channel.")
+        if len(self._sessions) >= self.limit:
+            self.rejected += 1
+            raise SessionUnavailable("Too many games are running right now, try again in a bit.")
+        session = self._sessions[key] = GameSession(self, key, timeout or self.timeout, after)
+        return session
+
+    def _close(self, session: GameSession) -> None:
+        if self._sessions.get(session.key) is session:
+            del self._sessions[session.key]
+
+    def dispatch(self, message: discord.Message) -> bool:
+        session = self._sessions.get((message.channel.id, message.author.id))
+        if session is None:
+            return False
+        session.feed(message)
+        return True
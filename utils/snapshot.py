@@ -0,0 +1,108 @@
+import os
+import json
+import mmap
+import zlib
+import struct
+import logging
+from typing import Any, Dict, Mapping, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'SPCSNAP\x00'
+VERSION = 1
+# magic, format version, CRC-32 of everything after the header, length of everything after it
+HEADER = struct.Struct('<8sIIQ')
+# name, offset from the start of the file, length in bytes
+SECTION = struct.Struct('<16sQQ')
+# sections start 8-byte aligned so they can be viewed as int64 in place
+ALIGN = 8
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def write_snapshot(path: str, sections: Mapping[str, Buffer], meta: Mapping[str, Any]) -> int:
+    # written next to the old file and swapped in, a process still mapping the old one keeps it
+    sections = {'meta': json.dumps(dict(meta)).encode(), **sections}
+    table_size = 4 + SECTION.size * len(sections)
+    offset = HEADER.size + table_size
+    table = [struct.pack('<I', len(sections))]
+    layout = []
+    for name, data in sections.items():
+        offset += -offset % ALIGN
+        length = memoryview(data).nbytes
+        table.append(SECTION.pack(name.encode(), offset, length))
+        layout.append((offset, data))
+        offset += length
+
+    checksum = 0
+    with open(path + '.tmp', 'wb') as f:
+        f.seek(HEADER.size)
+        for chunk in table:
+            f.write(chunk)
+            checksum = zlib.crc32(chunk, checksum)
+        for start, data in layout:
+            padding = b'\x00' * (start - f.tell())
+            f.write(padding)
+            f.write(data)
+            checksum = zlib.crc32(data, zlib.crc32(padding, checksum))
+        size = f.tell()
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, checksum, size - HEADER.size))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+    return size
+
+
+# A snapshot file mapped read-only. Sections are memoryviews straight into the mapping: the kernel
+# pages them in as they are read, and the file stays mapped while anything still refers to one
+class Snapshot:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, 'rb') as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as error:
+                raise SnapshotError(f"{path} is empty") from error
+        view = memoryview(self._map)
+        if len(view) < HEADER.size:
+            raise SnapshotError(f"{path} is truncated")
+        magic, version, checksum, length = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise SnapshotError(f"{path} is not a snapshot")
+        if version != VERSION:
+            raise SnapshotError(f"{path} is format version {version}, expected {VERSION}")
+        if len(view) != HEADER.size + length:
+            raise SnapshotError(f"{path} is {len(view)} bytes, its header says {HEADER.size + length}")
+        if zlib.crc32(view[HEADER.size:]) != checksum:
+            raise SnapshotError(f"{path} fails its checksum")
+        count, = struct.unpack_from('<I', view, HEADER.size)
+        self.sections: Dict[str, memoryview] = {}
+        for index in range(count):
+            name, offset, size = SECTION.unpack_from(view, HEADER.size + 4 + index * SECTION.size)
+            if offset + size > len(view):
+                raise SnapshotError(f"{path}: section {name!r} runs past the end")
+            self.sections[name.rstrip(b'\x00').decode()] = view[offset:offset + size]
+        self.meta: Dict[str, Any] = json.loads(bytes(self.section('meta')))
+
+    @classmethod
+    def load(cls, path: str) -> Optional['Snapshot']:
+        # None sends the caller down the full rebuild
+        if not os.path.exists(path):
+            logger.info("No snapshot at %s, loading everything from the database", path)
+            return None
+        try:
+            return cls(path)
+        except (OSError, SnapshotError, ValueError) as error:
+            logger.warning("Ignoring snapshot: %s", error)
+            return None
+
+    def section(self, name: str) -> memoryview:
+        try:
+            return self.sections[name]
+        except KeyError:
+            raise SnapshotError(f"{self.path} has no {name!r} section") from None
@@ -0,0 +1,40 @@
+import time
+import logging
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# Wall-clock timings of each startup phase. Phases may overlap, so each line shows
+# when the phase started relative to the first one as well as how long it took
+class StartupProfiler:
+    def __init__(self) -> None:
+        self.phases: List[Tuple[str, float, float]] = []
+
+    @property
+    def origin(self) -> float:
+        return min((start for _, start, _ in self.phases), default=time.perf_counter())
+
+    def record(self, name: str, start: float, end: Optional[float] = None) -> None:
+        self.phases.append((name, start, end or time.perf_counter()))
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start)
+
+    def report(self) -> str:
+        origin = self.origin
+        total = max((end for _, _, end in self.phases), default=origin) - origin
+        lines = [f"{'phase':<32} {'start':>9} {'took':>9}"]
+        for name, start, end in sorted(self.phases, key=lambda phase: phase[1]):
+            lines.append(f"{name:<32} {(start - origin) * 1e3:7.1f}ms {(end - start) * 1e3:7.1f}ms")
+        lines.append(f"{'total':<32} {'':>9} {total * 1e3:7.1f}ms")
+        return "\n".join(lines)
+
+
+profiler = StartupProfiler()
@@ -0,0 +1,207 @@
+import os
+import re
+import json
+import random
+import asyncio
+import logging
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from .matcher import AnswerMatcher
+from .missions import EVENTS
+
+logger = logging.getLogger(__name__)
+
+DURATION = re.compile(r"^\d+:[0-5]\d$")
+# typeracer prompts have to fit comfortably in one message
+SENTENCE_LENGTH = 300
+
+
+class CorpusError(ValueError):
+    pass
+
+
+# One question: what to show (clues, image) and what to accept (answers)
+@dataclass(slots=True, frozen=True, kw_only=True)
+class TriviaEntry:
+    key: str
+    category: str
+    clues: Tuple[Tuple[str, str], ...]
+    answers: Tuple[str, ...]
+    image: Optional[str] = None
+
+
+def _require(condition: bool, source: str, key: str, message: str) -> None:
+    if not condition:
+        raise CorpusError(f"{source}: {key!r} {message}")
+
+
+def _is_text(value: Any) -> bool:
+    return isinstance(value, str) and bool(value.strip())
+
+
+def compile_galaxies(raw: Any, source: str = 'galaxy.json') -> Tuple[TriviaEntry, ...]:
+    _require(isinstance(raw, dict), source, '<root>', "must be an object")
+    entries = []
+    for key, info in raw.items():
+        _require(isinstance(info, dict), source, key, "must be an object")
+        for field in ('description', 'constellation', 'image'):
+            _require(_is_text(info.get(field)), source, key, f"needs a non-empty string '{field}'")
+        answers = info.get('answers')
+        _require(
+            isinstance(answers, list) and bool(answers) and all(map(_is_text, answers)),
+            source, key, "needs a non-empty list of string 'answers'"
+        )
+        entries.append(TriviaEntry(
+            key=key,
+            category='galaxy',
+            clues=(('description', info['description']), ('constellation', info['constellation'])),
+            answers=tuple(answers),
+            image=info['image']
+        ))
+    return tuple(entries)
+
+
+def compile_constellations(raw: Any, source: str = 'constellation.json') -> Tuple[TriviaEntry, ...]:
+    _require(isinstance(raw, dict), source, '<root>', "must be an object")
+    entries = []
+    for key, meaning in raw.items():
+        _require(_is_text(meaning), source, key, "needs a non-empty string meaning")
+        entries.append(TriviaEntry(
+            key=key,
+            category='constellation',
+            clues=(('meaning', meaning),),
+            answers=(key,)
+        ))
+    return tuple(entries)
+
+
+def compile_missions(raw: Any, source: str = 'missions.json') -> Mapping[str, Mapping[str, Any]]:
+    _require(isinstance(raw, dict), source, '<root>', "must be an object")
+    for key in raw:
+        # checked before sorting by number, int() on anything else isn't a CorpusError
+        _require(key.isascii() and key.isdigit(), source, key, "must be a mission number")
+    _require(sorted(raw, key=int) == [str(number) for number in range(1, len(raw) + 1)], source, '<root>', "must be numbered 1..n")
+    missions = {}
+    for key, mission in raw.items():
+        _require(isinstance(mission, dict), source, key, "must be an object")
+        for field in ('name', 'description'):
+            _require(_is_text(mission.get(field)), source, key, f"needs a non-empty string '{field}'")
+        _require(isinstance(mission.get('points'), int), source, key, "needs integer 'points'")
+        _require(isinstance(mission.get('duration'), str) and bool(DURATION.match(mission['duration'])), source, key, "needs an 'H:MM' duration")
+        goal = mission.get('goal')
+        if goal is not None:
+            # what the mission tracker counts, missions without one are shown but not tracked
+            _require(isinstance(goal, dict) and goal.get('event') in EVENTS, source, key, f"needs a goal 'event' out of {sorted(EVENTS)}")
+            _require(isinstance(goal.get('count'), int) and goal['count'] > 0, source, key, "needs a positive integer goal 'count'")
+        missions[key] = MappingProxyType(dict(mission))
+    return MappingProxyType(missions)
+
+
+def compile_sentences(raw: Any, source: str = 'sentences.json') -> Tuple[str, ...]:
+    _require(isinstance(raw, list) and bool(raw), source, '<root>', "must be a non-empty list")
+    sentences = []
+    for index, sentence in enumerate(raw):
+        _require(_is_text(sentence), source, str(index), "must be a non-empty string")
+        # whitespace is normalized here, the prompt and the scoring both compare against this form
+        sentence = ' '.join(sentence.split())
+        _require(len(sentence) <= SENTENCE_LENGTH, source, str(index), f"is longer than {SENTENCE_LENGTH} characters")
+        sentences.append(sentence)
+    return tuple(sentences)
+
+
+# Everything in information/, validated and indexed. Never mutated, a reload builds a new one
+class TriviaCorpus:
+
+    SOURCES = {
+        'galaxy': ('galaxy.json', compile_galaxies),
+        'constellation': ('constellation.json', compile_constellations),
+    }
+    MISSIONS = 'missions.json'
+    SENTENCES = 'sentences.json'
+
+    def __init__(
+        self,
+        pools: Mapping[str, Tuple[TriviaEntry, ...]],
+        missions: Mapping[str, Mapping[str, Any]],
+        sentences: Tuple[str, ...] = ()
+    ) -> None:
+        self.pools = MappingProxyType(dict(pools))
+        self.categories = tuple(category for category, pool in self.pools.items() if pool)
+        self.missions = missions
+        self.sentences = sentences
+        self._entries = {category: {entry.key: entry for entry in pool} for category, pool in self.pools.items()}
+        # galaxies and constellations share names ("Andromeda"), so each category gets its own matcher
+        self._matchers = {
+            category: AnswerMatcher({entry.key: entry.answers for entry in pool})
+            for category, pool in self.pools.items()
+        }
+
+    @classmethod
+    def compile(cls, directory: str) -> 'TriviaCorpus':
+        pools = {}
+        for category, (filename, compiler) in cls.SOURCES.items():
+            pools[category] = compiler(cls._read(directory, filename), filename)
+        missions = compile_missions(cls._read(directory, cls.MISSIONS), cls.MISSIONS)
+        sentences = compile_sentences(cls._read(directory, cls.SENTENCES), cls.SENTENCES)
+        return cls(pools, missions, sentences)
+
+    @staticmethod
+    def _read(directory: str, filename: str) -> Any:
+        try:
+            with open(os.path.join(directory, filename), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as error:
+            raise CorpusError(f"{filename}: {error}") from error
+
+    def __len__(self) -> int:
+        return sum(map(len, self.pools.values()))
+
+    def get(self, category: str, key: str) -> Optional[TriviaEntry]:
+        return self._entries.get(category, {}).get(key)
+
+    def random(self, category: Optional[str] = None) -> TriviaEntry:
+        # categories are picked evenly so the 12 galaxies don't drown under 88 constellations
+        return random.choice(self.pools[category or random.choice(self.categories)])
+
+    def random_sentence(self) -> str:
+        return random.choice(self.sentences)
+
+    def is_correct(self, entry: TriviaEntry, guess: str) -> bool:
+        return self._matchers[entry.category].is_correct(guess, entry.key)
+
+
+# Holds the live corpus and swaps in a freshly compiled one whenever a source file changes
+class TriviaLibrary:
+    def __init__(self, directory: str = './information') -> None:
+        self.directory = directory
+        self._mtimes = self._stat()
+        self.corpus = TriviaCorpus.compile(directory)
+
+    def _stat(self) -> Dict[str, float]:
+        filenames = [filename for filename, _ in TriviaCorpus.SOURCES.values()] + [TriviaCorpus.MISSIONS, TriviaCorpus.SENTENCES]
+        mtimes = {}
+        for filename in filenames:
+            try:
+                mtimes[filename] = os.stat(os.path.join(self.directory, filename)).st_mtime_ns
+            except OSError:
+                mtimes[filename] = 0
+        return mtimes
+
+    async def reload(self, force: bool = False) -> bool:
+        mtimes = self._stat()
+        if not force and mtimes == self._mtimes:
+            return False
+        try:
+            corpus = await asyncio.to_thread(TriviaCorpus.compile, self.directory)
+        except CorpusError as error:
+            # keep serving the last good corpus until the files are fixed
+            logger.error("Not reloading trivia: %s", error)
+            self._mtimes = mtimes
+            return False
+        # a single reference swap, games already running keep the entry they were given
+        self.corpus = corpus
+        self._mtimes = mtimes
+        logger.info("Reloaded trivia corpus (%d entries)", len(corpus))
+        return True
@@ -0,0 +1,196 @@
+import time
+import heapq
+import asyncio
+import datetime
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from .database import Database
+from .matcher import distance
+
+# every race is kept in typeracer_results, the leaderboards only ever read typeracer_best:
+# one row per (scope, user) holding that user's best race, scope being the guild id or
+# GLOBAL. (scope, wpm DESC, user_id) makes a top-N query an index range scan of N rows,
+# user_id breaking ties the same way the in-memory boards do
+SCHEMA = """
+        CREATE TABLE IF NOT EXISTS typeracer_results (
+                id INTEGER PRIMARY KEY,
+                guild_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                wpm REAL NOT NULL,
+                accuracy REAL NOT NULL,
+                seconds REAL NOT NULL,
+                created REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS typeracer_best (
+                scope INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                wpm REAL NOT NULL,
+                accuracy REAL NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (scope, user_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS typeracer_best_rank ON typeracer_best (scope, wpm DESC, user_id);
+        """
+
+GLOBAL = 0
+# how close an attempt must be to the sentence to count as finished
+MIN_ACCURACY = 0.6
+# interleaved with the words of the prompt, a pasted answer carries them along
+PASTE_MARK = '\u200b'
+
+
+# One finished race. wpm is net: gross speed scaled by accuracy, so mashing keys doesn't pay
+@dataclass(frozen=True)
+class RaceResult:
+    wpm: float
+    accuracy: float
+    seconds: float
+
+
+def prompt(sentence: str) -> str:
+    return f' {PASTE_MARK}'.join(sentence.split(' '))
+
+
+def is_pasted(text: str) -> bool:
+    return PASTE_MARK in text
+
+
+def elapsed(prompted_at: datetime.datetime, typed_at: datetime.datetime) -> float:
+    # both come from the message snowflakes, so neither the gateway nor the event loop's lag counts
+    return max((typed_at - prompted_at).total_seconds(), 0.001)
+
+
+def score(sentence: str, typed: str, seconds: float, min_accuracy: float = MIN_ACCURACY) -> RaceResult:
+    # runs on the event loop for every message of a race, so the edit distance stops as soon as
+    # the attempt can't reach min_accuracy any more, and such an attempt scores nothing
+    limit = int((1 - min_accuracy) * len(sentence))
+    missed = RaceResult(0.0, 0.0, round(seconds, 2))
+    # checked on the raw message, collapsing its whitespace is already linear in its length
+    if len(typed) > 2 * (len(sentence) + limit):
+        return missed
+    typed = ' '.join(typed.split())
+    # the band grows only as far as the attempt needs, a near perfect one costs a narrow pass
+    band = min(8, limit)
+    while (errors := distance(sentence, typed, band)) > band and band < limit:
+        band = min(band * 4, limit)
+    if errors > limit:
+        return missed
+    accuracy = max(0.0, 1 - errors / len(sentence))
+    # the usual five characters to a word
+    gross = len(typed) / 5 / (seconds / 60)
+    return RaceResult(round(gross * accuracy, 1), round(accuracy, 3), round(seconds, 2))
+
+
+# The top `size` personal bests of one scope: a min-heap, so a new race is compared against
+# the slowest place and only touches the heap when it makes the board
+class Board:
+    def __init__(self, size: int, rows: List[Tuple[int, float, float]] = ()) -> None:
+        self.size = size
+        self.loaded_at = time.monotonic()
+        self._best: Dict[int, Tuple[float, float]] = {}
+        # (wpm, -user_id): the slowest place sits at the root, ties go to the lower id
+        self._heap: List[Tuple[float, int]] = []
+        for user_id, wpm, accuracy in rows:
+            self.offer(user_id, wpm, accuracy)
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def offer(self, user_id: int, wpm: float, accuracy: float) -> bool:
+        current = self._best.get(user_id)
+        if current is not None:
+            if wpm <= current[0]:
+                return False
+            # already on the board, a better race only moves them up
+            self._best[user_id] = (wpm, accuracy)
+            self._heap = [(wpm if -user == user_id else speed, user) for speed, user in self._heap]
+            heapq.heapify(self._heap)
+            return True
+        key = (wpm, -user_id)
+        if len(self._heap) < self.size:
+            heapq.heappush(self._heap, key)
+        elif key > self._heap[0]:
+            _, dropped = heapq.heapreplace(self._heap, key)
+            del self._best[-dropped]
+        else:
+            return False
+        self._best[user_id] = (wpm, accuracy)
+        return True
+
+    def top(self, limit: int) -> List[Tuple[int, float, float]]:
+        return [(-user, *self._best[-user]) for _, user in heapq.nlargest(limit, self._heap)]
+
+
+# Persistent typeracer leaderboards per guild and across every guild. Boards are read from the
+# index once and then kept current by the races recorded here. With several processes sharing
+# the database, max_age makes a board reload now and then to pick up the others' races
+class Leaderboards:
+    def __init__(
+        self,
+        database: Database,
+        name: str = 'users',
+        *,
+        size: int = 10,
+        boards: int = 1000,
+        max_age: Optional[float] = None
+    ) -> None:
+        self.database = database
+        self.name = name
+        self.size = size
+        self.max_age = max_age
+        self._boards: OrderedDict[int, Board] = OrderedDict()
+        self._limit = boards
+
+    async def create_tables(self) -> None:
+        await self.database[self.name].executescript(SCHEMA)
+
+    async def board(self, scope: int) -> Board:
+        board = self._boards.get(scope)
+        if board is not None and (self.max_age is None or time.monotonic() - board.loaded_at < self.max_age):
+            self._boards.move_to_end(scope)
+            return board
+        rows = await self.database.reader(self.name).fetchall(
+            'SELECT user_id, wpm, accuracy FROM typeracer_best WHERE scope = ? ORDER BY wpm DESC, user_id LIMIT ?',
+            (scope, self.size)
+        )
+        board = self._boards[scope] = Board(self.size, rows)
+        # only the guilds that raced recently stay in memory
+        while len(self._boards) > self._limit:
+            self._boards.popitem(last=False)
+        return board
+
+    async def top(self, scope: int = GLOBAL, limit: Optional[int] = None) -> List[Tuple[int, float, float]]:
+        return (await self.board(scope)).top(min(limit or self.size, self.size))
+
+    async def personal_best(self, user_id: int, scope: int = GLOBAL) -> Optional[float]:
+        row = await self.database.reader(self.name).fetchone(
+            'SELECT wpm FROM typeracer_best WHERE scope = ? AND user_id = ?', (scope, user_id)
+        )
+        return row[0] if row else None
+
+    async def record(self, guild_id: Optional[int], user_id: int, result: RaceResult) -> None:
+        # races in DMs only count globally
+        scopes = [GLOBAL] if guild_id is None else [guild_id, GLOBAL]
+        now = time.time()
+        writer = self.database.writer(self.name)
+        await asyncio.gather(
+            writer.execute(
+                'INSERT INTO typeracer_results (guild_id, user_id, wpm, accuracy, seconds, created) VALUES (?, ?, ?, ?, ?, ?)',
+                (guild_id or GLOBAL, user_id, result.wpm, result.accuracy, result.seconds, now)
+            ),
+            *(
+                writer.execute(
+                    'INSERT INTO typeracer_best (scope, user_id, wpm, accuracy, created) VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT (scope, user_id) DO UPDATE SET wpm = excluded.wpm, accuracy = excluded.accuracy, '
+                    'created = excluded.created WHERE excluded.wpm > typeracer_best.wpm',
+                    (scope, user_id, result.wpm, result.accuracy, now)
+                )
+                for scope in scopes
+            )
+        )
+        for scope in scopes:
+            board = self._boards.get(scope)
+            if board is not None:
+                board.offer(user_id, result.wpm, result.accuracy)
@@ -1,58 +1,93 @@
-from typing import List
+import re
+import time
+from typing import Awaitable, Callable, Optional, Sequence
 
 import discord
 from discord import ui
 from discord.ext import commands
 
-class ConfirmButton(ui.View):
-    def __init__(self, ctx: commands.Context) -> None:
-        super().__init__(timeout=60)
-        self.confirmed = None
-        self.ctx = ctx
-
-
-    @ui.button(label='Confirm', style=discord.ButtonStyle.green)
-    async def confirm(
-        self, 
-        interaction: discord.Interaction, 
-        button: discord.Button
-    ) -> None:
-        self.confirmed = True
-        if interaction.message:
-            await interaction.message.delete()
-        else:
-            interaction.delete_original_message()
-        self.stop()
-    
-    @ui.button(label='Cancel', style=discord.ButtonStyle.red)
-    async def cancel(
-        self, 
-        interaction: discord.Interaction, 
-        button: discord.Button
-    ) -> None:
-        if interaction.message:
-            await interaction.message.delete()
-        else:
-            interaction.delete_original_message()
-        self.stop()
+# Runs when a confirm prompt is answered: (interaction, confirmed) -> what the prompt turns into
+ConfirmAction = Callable[[discord.Interaction, bool], Awaitable[str]]
+
+
+# Confirm and Cancel buttons that keep their whole state in the custom_id, so no view is held per
+# prompt and a prompt still works after a restart. Clicks reach whichever cog registered the
+# action in bot.confirm_actions, the bot registers this class once with add_dynamic_items
+class ConfirmPrompt(
+    ui.DynamicItem[ui.Button],
+    template=r'confirm:(?P<action>[a-z_]+):(?P<user_id>[0-9]+):(?P<issued>[0-9]+):(?P<choice>yes|no)'
+):
+    # as long as the old per-prompt views waited, an answer after that may no longer apply
+    EXPIRES = 60
+
+    def __init__(self, action: str, user_id: int, confirmed: bool, issued: Optional[int] = None) -> None:
+        issued = int(time.time()) if issued is None else issued
+        super().__init__(ui.Button(
+            label='Confirm' if confirmed else 'Cancel',
+            style=discord.ButtonStyle.green if confirmed else discord.ButtonStyle.red,
+            custom_id=f"confirm:{action}:{user_id}:{issued}:{'yes' if confirmed else 'no'}"
+        ))
+        self.action = action
+        self.user_id = user_id
+        self.confirmed = confirmed
+        self.issued = issued
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: ui.Button, match: re.Match[str]) -> 'ConfirmPrompt':
+        return cls(match['action'], int(match['user_id']), match['choice'] == 'yes', int(match['issued']))
+
+    @staticmethod
+    def view(action: str, user_id: int) -> ui.View:
+        issued = int(time.time())
+        view = ui.View(timeout=None)
+        view.add_item(ConfirmPrompt(action, user_id, True, issued))
+        view.add_item(ConfirmPrompt(action, user_id, False, issued))
+        # a finished view is sent but never stored, clicks go through the dynamic item instead
+        view.stop()
+        return view
+
+    @property
+    def expired(self) -> bool:
+        return time.time() - self.issued > self.EXPIRES
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message("This prompt isn't yours to answer.", ephemeral=True)
+            return False
+        return True
+
+    async def callback(self, interaction: discord.Interaction) -> None:
+        handler = interaction.client.confirm_actions.get(self.action)
+        if handler is None or self.expired:
+            # stale, or its cog was unloaded since the prompt went out
+            await interaction.response.edit_message(content="This prompt has expired, run the command again.", embed=None, view=None)
+            return
+        # acknowledged before the action runs, a slow database write can't miss the 3s deadline
+        await interaction.response.defer()
+        content = await handler(interaction, self.confirmed)
+        # the prompt becomes the answer
+        await interaction.edit_original_response(content=content, embed=None, view=None)
 
 class HelpView(ui.View):
-    def __init__(self, ctx: commands.Context, embeds: List[discord.Embed]) -> None:
+    def __init__(self, ctx: commands.Context, embeds: Sequence[discord.Embed]) -> None:
         super().__init__(timeout=60)
+        # pages come straight from the help cache and are only ever read
         self.embeds = embeds
         self.counter = 0
+        if len(embeds) < 2:
+            self.update_side('all', True)
 
     def forward(self):
         if self.counter + 1 < len(self.embeds):
             self.counter += 1
-            return self.embeds[0]
+            return self.embeds[self.counter]
         return
 
 
     def backward(self):
         if self.counter > 0:
             self.counter -= 1
-            return self.embeds[0]
+            return self.embeds[self.counter]
         return
 
 
@@ -72,7 +107,7 @@ class HelpView(ui.View):
                         child.disabled = not disabled
             case 'all':
                 for child in self.children:
-                    child.disabled = True
+                    child.disabled = disabled
             
 
     @ui.button(emoji="\N{Black Left-Pointing Double Triangle}",style=discord.ButtonStyle.blurple, disabled=True)
@@ -100,7 +135,7 @@ class HelpView(ui.View):
         if interaction.message:
             await interaction.message.edit(view=self)
         else:
-            await interaction.edit_original_message(view=self)
+            await interaction.edit_original_response(view=self)
         self.stop()
 
 
@@ -120,7 +155,7 @@ class HelpView(ui.View):
     async def last_embed(self, interaction: discord.Interaction, button: discord.Button):
         embed = self.embeds[-1]
         self.counter = len(self.embeds) - 1
-        self.disable_side('right')
+        self.update_side('right', True)
         return await interaction.message.edit(embed=embed, view=self)
         
 
@@ -0,0 +1,246 @@
+import os
+import time
+import asyncio
+import logging
+from array import array
+from typing import Dict, Mapping, Optional, Tuple
+
+from .database import Database
+from .membership import VerifiedSet
+from .snapshot import Snapshot
+
+logger = logging.getLogger(__name__)
+
+# user_id is an INTEGER PRIMARY KEY (the rowid) in both tables, so every lookup and the
+# sorted startup scan already go through the table's own b-tree, no secondary index needed
+SCHEMA = """
+        CREATE TABLE IF NOT EXISTS verified (
+                user_id INTEGER PRIMARY KEY
+        );
+        CREATE TABLE IF NOT EXISTS story (
+                user_id INTEGER PRIMARY KEY,
+                enabled INTEGER,
+                progression INTEGER DEFAULT 0,
+                mission_count INTEGER DEFAULT 0,
+                mission_started REAL
+        );
+        CREATE TABLE IF NOT EXISTS changes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                origin INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                value INTEGER,
+                created REAL NOT NULL
+        );
+        """
+# added to story after the table first shipped, older files get them on startup
+STORY_COLUMNS = {
+    'mission_count': 'INTEGER DEFAULT 0',
+    'mission_started': 'REAL',
+}
+
+
+# Verification and story progress for every user, kept in one database and fully loaded in memory.
+# With an origin set, several processes share the database: every write is also appended to the
+# changes table and sync() replays what the other processes wrote into this one's memory
+class UserState:
+    def __init__(self, database: Database, name: str = 'users', *, origin: Optional[int] = None) -> None:
+        self.database = database
+        self.name = name
+        self.origin = origin
+        self.verified = VerifiedSet()
+        # only users who began the story are present, a missing key is a cached "not started"
+        self.progression: Dict[int, int] = {}
+        # id of the last change already reflected in memory
+        self.cursor = 0
+        # story progress as a snapshot restored it, until reconcile() has compared it to the table
+        self._restored: Dict[int, int] = {}
+
+    async def create_tables(self, legacy: Optional[Mapping[str, str]] = None) -> None:
+        conn = self.database[self.name]
+        await conn.executescript(SCHEMA)
+        await self._add_columns('story', STORY_COLUMNS)
+        for table, path in (legacy or {}).items():
+            if os.path.exists(path):
+                await self._migrate(table, path)
+
+    async def _add_columns(self, table: str, columns: Mapping[str, str]) -> None:
+        conn = self.database[self.name]
+        async with conn.execute(f'PRAGMA table_info({table})') as cursor:
+            existing = {row[1] for row in await cursor.fetchall()}
+        for column, definition in columns.items():
+            if column not in existing:
+                await conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+        await conn.commit()
+
+    async def _migrate(self, table: str, path: str) -> None:
+        # pulls a table over from the old one-database-per-table layout, once
+        conn = self.database[self.name]
+        await conn.execute('ATTACH DATABASE ? AS legacy', (path,))
+        try:
+            async with conn.execute("SELECT 1 FROM legacy.sqlite_master WHERE type = 'table' AND name = ?", (table,)) as cursor:
+                exists = await cursor.fetchone()
+            if exists:
+                # the old files predate the newer columns, copy only the ones they have
+                async with conn.execute(f'PRAGMA legacy.table_info({table})') as cursor:
+                    columns = ', '.join(row[1] for row in await cursor.fetchall())
+                await conn.execute(f'INSERT OR IGNORE INTO {table} ({columns}) SELECT {columns} FROM legacy.{table}')
+                await conn.commit()
+        finally:
+            await conn.execute('DETACH DATABASE legacy')
+        os.replace(path, path + '.migrated')
+        logger.info("Migrated %s from %s", table, path)
+
+    async def load(self) -> None:
+        reader = self.database.reader(self.name)
+        async with reader.acquire() as conn:
+            # read before the tables, a change landing in between is replayed by the next sync, harmlessly
+            async with conn.execute('SELECT COALESCE(MAX(id), 0) FROM changes') as cursor:
+                self.cursor, = await cursor.fetchone()
+            async with conn.execute('SELECT user_id FROM verified ORDER BY user_id') as cursor:
+                cursor.arraysize = 4096
+                ids = array('q')
+                async for record in cursor:
+                    ids.append(record[0])
+            async with conn.execute('SELECT user_id, progression FROM story WHERE enabled = 1') as cursor:
+                # rows written before progression started at 1 still hold the column default
+                progression = {user_id: progress or 1 for user_id, progress in await cursor.fetchall()}
+        self.verified = VerifiedSet.from_sorted(ids)
+        self.progression = progression
+
+    def snapshot(self) -> Tuple[Dict[str, memoryview], Dict[str, int]]:
+        # sections and meta for write_snapshot, taken after the last write of a clean shutdown
+        story = array('q')
+        for user_id, progression in sorted(self.progression.items()):
+            story.extend((user_id, progression))
+        return {'verified': self.verified.buffer, 'story': memoryview(story)}, {'cursor': self.cursor}
+
+    def restore(self, snapshot: Snapshot) -> None:
+        # verified is searched inside the mapping, story is small enough to rebuild as a dict
+        story = snapshot.section('story').cast('q')
+        self.verified = VerifiedSet.from_buffer(snapshot.section('verified'))
+        self.progression = dict(zip(story[0::2], story[1::2]))
+        self.cursor = snapshot.meta['cursor']
+        self._restored = dict(self.progression)
+
+    async def reconcile(self, chunk: int = 50_000) -> Dict[str, int]:
+        # catches a restored snapshot up with the tables, a chunk at a time so commands keep running
+        # in between. The snapshot, not memory, is what the tables are compared to, anything that
+        # changed in memory since the restore is newer than both
+        reader = self.database.reader(self.name)
+        added = extra = 0
+        last = 0
+        while rows := await reader.fetchall(
+            'SELECT user_id FROM verified WHERE user_id > ? ORDER BY user_id LIMIT ?', (last, chunk)
+        ):
+            for user_id, in rows:
+                if user_id not in self.verified:
+                    self.verified.add(user_id)
+                    added += 1
+            extra += self.verified.count_range(last, rows[-1][0]) - len(rows)
+            last = rows[-1][0]
+        extra += self.verified.count_range(last, 2**63 - 1)
+        if extra > 0:
+            # verifications were removed from the table, the sorted buffer only grows so start over
+            logger.warning("%d verified users in the snapshot are gone from the table, reloading", extra)
+            await self.load()
+            return {'verified_added': added, 'verified_removed': extra, 'story_changed': 0, 'story_ended': 0}
+
+        restored, self._restored = self._restored, {}
+        changed = 0
+        seen = set()
+        last = 0
+        while rows := await reader.fetchall(
+            'SELECT user_id, progression FROM story WHERE enabled = 1 AND user_id > ? ORDER BY user_id LIMIT ?', (last, chunk)
+        ):
+            for user_id, progression in rows:
+                seen.add(user_id)
+                progression = progression or 1
+                if restored.get(user_id) != progression:
+                    self.progression[user_id] = progression
+                    changed += 1
+            last = rows[-1][0]
+        ended = 0
+        for user_id, progression in restored.items():
+            if user_id not in seen and self.progression.get(user_id) == progression:
+                del self.progression[user_id]
+                ended += 1
+        return {'verified_added': added, 'verified_removed': 0, 'story_changed': changed, 'story_ended': ended}
+
+    def is_verified(self, user_id: int) -> bool:
+        return user_id in self.verified
+
+    def get_progression(self, user_id: int) -> Optional[int]:
+        return self.progression.get(user_id)
+
+    async def verify(self, user_id: int) -> None:
+        await self._write('INSERT OR IGNORE INTO verified (user_id) VALUES (?)', (user_id,), 'verify', user_id)
+        self.verified.add(user_id)
+
+    async def start_story(self, user_id: int) -> None:
+        await self._write(
+            'INSERT INTO story (user_id, enabled, progression, mission_count, mission_started) VALUES (?, 1, 1, 0, ?) '
+            'ON CONFLICT (user_id) DO UPDATE SET enabled = 1, progression = 1, mission_count = 0, '
+            'mission_started = excluded.mission_started',
+            (user_id, time.time()), 'story', user_id, 1
+        )
+        self.progression[user_id] = 1
+
+    async def stop_story(self, user_id: int) -> None:
+        await self._write('UPDATE story SET enabled = 0 WHERE user_id = ?', (user_id,), 'story', user_id)
+        self.progression.pop(user_id, None)
+
+    async def set_progression(self, user_id: int, progression: int) -> None:
+        await self._write(
+            'UPDATE story SET progression = ? WHERE user_id = ?', (progression, user_id),
+            'story', user_id, progression
+        )
+        self.progression[user_id] = progression
+
+    async def save_progress(self, user_id: int, progression: int, count: int, started: float) -> None:
+        # the mission tracker's counters, written in batches rather than per event
+        await self._write(
+            'UPDATE story SET progression = ?, mission_count = ?, mission_started = ? WHERE user_id = ? AND enabled = 1',
+            (progression, count, started, user_id), 'story', user_id, progression
+        )
+
+    async def _write(self, statement: str, parameters: Tuple, kind: str, user_id: int, value: Optional[int] = None) -> None:
+        writer = self.database.writer(self.name)
+        if self.origin is None:
+            return await writer.execute(statement, parameters)
+        # queued back to back, so the change row commits with the write or in the group right after it
+        await asyncio.gather(
+            writer.execute(statement, parameters),
+            writer.execute(
+                'INSERT INTO changes (origin, kind, user_id, value, created) VALUES (?, ?, ?, ?, ?)',
+                (self.origin, kind, user_id, value, time.time())
+            )
+        )
+
+    def apply(self, kind: str, user_id: int, value: Optional[int]) -> None:
+        if kind == 'verify':
+            self.verified.add(user_id)
+        elif kind == 'story' and value is None:
+            self.progression.pop(user_id, None)
+        elif kind == 'story':
+            self.progression[user_id] = value
+
+    async def sync(self) -> int:
+        # replays changes made by other processes since the last sync, returns how many were applied
+        rows = await self.database.reader(self.name).fetchall(
+            'SELECT id, origin, kind, user_id, value FROM changes WHERE id > ? ORDER BY id', (self.cursor,)
+        )
+        applied = 0
+        for change_id, origin, kind, user_id, value in rows:
+            if origin != self.origin:
+                self.apply(kind, user_id, value)
+                applied += 1
+            self.cursor = change_id
+        return applied
+
+    async def prune(self, older_than: float = 600.0) -> None:
+        # every process syncs every few seconds, old changes only matter to one that was stopped,
+        # and that one reloads everything when it starts again
+        await self.database.writer(self.name).execute(
+            'DELETE FROM changes WHERE created < ?', (time.time() - older_than,)
+        )
@@ -0,0 +1,283 @@
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+from dataclasses import asdict, dataclass
+from typing import Dict, Mapping, Optional
+
+import aiohttp
+from yarl import URL
+
+from .errors import UpstreamUnavailable
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# A response as it is stored on disk, validators included so it can be revalidated later
+@dataclass(slots=True, repr=True, kw_only=True)
+class CachedResponse:
+    url: str
+    body: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    stored_at: float = 0.0
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.stored_at
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+# Write-through response cache, one JSON file per URL, disk access happens in a worker thread
+class ResponseCache:
+    def __init__(self, directory: Optional[str] = './database/http_cache') -> None:
+        self.directory = directory
+        self._memory: Dict[str, CachedResponse] = {}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(url.encode()).hexdigest() + '.json')
+
+    def _read(self, url: str) -> Optional[CachedResponse]:
+        try:
+            with open(self._path(url), 'r', encoding='utf-8') as f:
+                return CachedResponse(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def _write(self, response: CachedResponse) -> None:
+        path = self._path(response.url)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(asdict(response), f)
+        os.replace(path + '.tmp', path)
+
+    async def get(self, url: str) -> Optional[CachedResponse]:
+        response = self._memory.get(url)
+        if response is None and self.directory:
+            response = await asyncio.to_thread(self._read, url)
+            if response:
+                self._memory[url] = response
+        return response
+
+    async def set(self, response: CachedResponse) -> None:
+        response.stored_at = time.time()
+        self._memory[response.url] = response
+        if self.directory:
+            await asyncio.to_thread(self._write, response)
+
+
+# Opens after `threshold` consecutive failures, lets one probe through after `reset_after` seconds
+class CircuitBreaker:
+    def __init__(self, threshold: int = 5, reset_after: float = 30.0) -> None:
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_after - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if self._probing or self.retry_after > 0:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+    def end_probe(self) -> None:
+        # a probe that ended without an outcome (cancelled, or an unexpected error) lets the next one through
+        self._probing = False
+
+
+class RetryableStatus(Exception):
+    def __init__(self, status: int) -> None:
+        self.status = status
+        super().__init__(f"Upstream answered with {status}")
+
+
+# Outbound HTTP on top of the bot's shared session
+class WebClient:
+    def __init__(
+        self,
+        session: Optional[aiohttp.ClientSession],
+        *,
+        cache: Optional[ResponseCache] = None,
+        per_host: int = 4,
+        timeout: float = 10.0,
+        retries: int = 2,
+        backoff: float = 0.5,
+        breaker_threshold: int = 5,
+        breaker_reset: float = 30.0
+    ) -> None:
+        self.session = session
+        self.cache = cache or ResponseCache()
+        self.per_host = per_host
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self._limits: Dict[str, asyncio.Semaphore] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    async def _require_session(self) -> None:
+        if (self.session is None) or (self.session and self.session.closed):
+            self.session = aiohttp.ClientSession()
+
+    def get_breaker(self, host: str) -> CircuitBreaker:
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_reset)
+        return breaker
+
+    def _get_limit(self, host: str) -> asyncio.Semaphore:
+        limit = self._limits.get(host)
+        if limit is None:
+            limit = self._limits[host] = asyncio.Semaphore(self.per_host)
+        return limit
+
+    async def _request(self, url: str, headers: Mapping[str, str], cached: Optional[CachedResponse]) -> str:
+        request_headers = dict(headers)
+        if cached:
+            request_headers.update(cached.conditional_headers())
+        async with self._get_limit(URL(url).host):
+            async with self.session.get(url, headers=request_headers, timeout=self.timeout) as response:
+                if response.status == 304 and cached:
+                    await self.cache.set(cached)
+                    return cached.body
+                if response.status == 429 or response.status >= 500:
+                    raise RetryableStatus(response.status)
+                response.raise_for_status()
+                body = await response.text()
+                await self.cache.set(CachedResponse(
+                    url=url,
+                    body=body,
+                    etag=response.headers.get('ETag'),
+                    last_modified=response.headers.get('Last-Modified')
+                ))
+                return body
+
+    async def get_text(self, url: str, *, headers: Optional[Mapping[str, str]] = None, max_age: float = 0.0) -> str:
+        with metrics.phase('http'):
+            return await self._get_text(url, headers, max_age)
+
+    async def _get_text(self, url: str, headers: Optional[Mapping[str, str]], max_age: float) -> str:
+        await self._require_session()
+        host = URL(url).host
+        cached = await self.cache.get(url)
+        if cached and cached.age < max_age:
+            metrics.inc('http_responses_total', host=host, result='fresh')
+            return cached.body
+
+        breaker = self.get_breaker(host)
+        if not breaker.allow():
+            metrics.inc('http_responses_total', host=host, result='breaker_open')
+            if cached:
+                return cached.body
+            raise UpstreamUnavailable(host, breaker.retry_after)
+        # an open breaker that let this request through made it the probe
+        probe = breaker.opened_at is not None
+        try:
+            return await self._attempt(url, headers, cached, host, breaker)
+        finally:
+            if probe:
+                breaker.end_probe()
+
+    async def _attempt(
+        self,
+        url: str,
+        headers: Optional[Mapping[str, str]],
+        cached: Optional[CachedResponse],
+        host: str,
+        breaker: CircuitBreaker
+    ) -> str:
+        error: Optional[Exception] = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                # full jitter, so callers that failed together don't retry together
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** (attempt - 1)))
+            try:
+                body = await self._request(url, headers or {}, cached)
+            except aiohttp.ClientResponseError:
+                # the host answered, it is the request that is wrong
+                breaker.record_success()
+                raise
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError, RetryableStatus) as exc:
+                error = exc
+                logger.info("GET %s failed (attempt %d/%d): %r", url, attempt + 1, self.retries + 1, exc)
+            else:
+                breaker.record_success()
+                metrics.inc('http_responses_total', host=host, result='ok')
+                return body
+
+        breaker.record_failure()
+        metrics.inc('http_responses_total', host=host, result='failed')
+        if cached:
+            logger.warning("Serving stale %s (%.0fs old) after: %r", url, cached.age, error)
+            return cached.body
+        # callers handle one error for "the host can't be reached", whether or not the breaker opened
+        raise UpstreamUnavailable(host, breaker.retry_after or self.backoff * 2 ** self.retries) from error
+
+    async def get_bytes(self, url: str, *, limit: int = 8 * 2**20) -> bytes:
+        # one attempt, no response cache: callers that want binaries keep their own copy on disk
+        with metrics.phase('http'):
+            await self._require_session()
+            host = URL(url).host
+            breaker = self.get_breaker(host)
+            if not breaker.allow():
+                raise UpstreamUnavailable(host, breaker.retry_after)
+            probe = breaker.opened_at is not None
+            try:
+                async with self._get_limit(host):
+                    async with self.session.get(url, timeout=self.timeout) as response:
+                        response.raise_for_status()
+                        if (response.content_length or 0) > limit:
+                            raise ValueError(f"{url} is larger than {limit} bytes")
+                        # read() on the stream returns whatever is buffered, the body is read to EOF here
+                        body = bytearray()
+                        async for chunk in response.content.iter_chunked(64 * 2**10):
+                            body += chunk
+                            if len(body) > limit:
+                                raise ValueError(f"{url} is larger than {limit} bytes")
+            except (aiohttp.ClientResponseError, ValueError):
+                # the host answered, just not with something usable
+                breaker.record_success()
+                raise
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as error:
+                breaker.record_failure()
+                metrics.inc('http_responses_total', host=host, result='failed')
+                raise UpstreamUnavailable(host, breaker.retry_after or self.backoff) from error
+            finally:
+                if probe:
+                    breaker.end_probe()
+            breaker.record_success()
+            metrics.inc('http_responses_total', host=host, result='ok')
+            return bytes(body)
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+from itertools import groupby
+from typing import Any, List, Optional, Sequence, Tuple
+
+import aiosqlite
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+Write = Tuple[str, Sequence[Any], asyncio.Future]
+
+
+# Queues writes for one connection and commits them in groups, one fsync per batch instead of per statement
+class WriteBehind:
+    def __init__(self, conn: aiosqlite.Connection, *, max_batch: int = 256, window: float = 0.01) -> None:
+        self.conn = conn
+        self.max_batch = max_batch
+        self.window = window
+        self._queue: asyncio.Queue[Optional[Write]] = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    async def start(self) -> None:
+        await self.conn.execute('PRAGMA journal_mode=WAL')
+        # WAL + NORMAL is still durable across application crashes and only fsyncs at checkpoints
+        await self.conn.execute('PRAGMA synchronous=NORMAL')
+        self._task = asyncio.create_task(self._run())
+
+    def submit(self, statement: str, parameters: Sequence[Any] = ()) -> asyncio.Future:
+        if self._task is None or self._task.done():
+            raise RuntimeError("WriteBehind is not running")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((statement, parameters, future))
+        return future
+
+    async def execute(self, statement: str, parameters: Sequence[Any] = ()) -> None:
+        # resolves once the write is committed
+        with metrics.phase('sqlite'):
+            await self.submit(statement, parameters)
+
+    async def close(self) -> None:
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+
+    async def _collect(self, first: Write) -> Tuple[List[Write], bool]:
+        batch = [first]
+        deadline = asyncio.get_running_loop().time() + self.window
+        while len(batch) < self.max_batch:
+            if self._queue.empty():
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                item = self._queue.get_nowait()
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _commit(self, batch: List[Write]) -> None:
+        try:
+            # consecutive writes of the same statement go down in one executemany call
+            for statement, writes in groupby(batch, key=lambda write: write[0]):
+                await self.conn.executemany(statement, [write[1] for write in writes])
+            await self.conn.commit()
+        except Exception:
+            await self.conn.rollback()
+            if len(batch) == 1:
+                raise
+            # isolate the offending write so the rest of the batch still lands
+            for write in batch:
+                await self._commit_one(write)
+        else:
+            for *_, future in batch:
+                if not future.done():
+                    future.set_result(None)
+
+    async def _commit_one(self, write: Write) -> None:
+        statement, parameters, future = write
+        try:
+            await self.conn.execute(statement, parameters)
+            await self.conn.commit()
+        except Exception as error:
+            await self.conn.rollback()
+            if not future.done():
+                future.set_exception(error)
+        else:
+            if not future.done():
+                future.set_result(None)
+
+    async def _run(self) -> None:
+        closing = False
+        while not closing:
+            first = await self._queue.get()
+            if first is None:
+                break
+            batch, closing = await self._collect(first)
+            try:
+                await self._commit(batch)
+            except Exception as error:
+                logger.exception("Group commit failed")
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+        # flush whatever was queued behind the close marker
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                await self._commit_one(item)